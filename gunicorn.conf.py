@@ -0,0 +1,23 @@
+'''
+gunicorn settings of the web workers
+
+    gunicorn -c gunicorn.conf.py ooiservices.manage:app
+
+Sync workers, one request at a time each. Long lived responses (live
+tails, bulk exports) are refused here and served by the stream process, see
+gunicorn_stream.conf.py.
+'''
+
+worker_class = 'sync'
+#a plot may wait RENDER_TIMEOUT for its renderer after fetching its data
+timeout = 60
+
+def post_worker_init(worker):
+    '''
+    Starts the renderer pool of a web worker once the application is loaded,
+    before the worker serves requests from any thread, and turns away the
+    streamed responses a sync worker cannot hold
+    '''
+    from ooiservices.app.uframe.render_pool import start_pool
+    worker.wsgi.config['SERVE_STREAMS'] = False
+    start_pool(worker.wsgi.config)
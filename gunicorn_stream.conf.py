@@ -0,0 +1,17 @@
+'''
+gunicorn settings of the stream process, which serves the long lived
+responses: /uframe/tail and /uframe/bulk_export. Route those paths here
+from the front end proxy.
+
+    gunicorn -c gunicorn_stream.conf.py ooiservices.manage:app
+
+gevent workers hold an open tail or export as a greenlet rather than a whole
+worker. The worker timeout only covers the worker's own heartbeat, so
+responses may stay open as long as they are read.
+'''
+import os
+
+bind = '0.0.0.0:%s' % os.environ.get('STREAM_PORT', '4001')
+worker_class = 'gevent'
+worker_connections = 1000
+timeout = 30
@@ -5,6 +5,7 @@ ooiservices
 Initializes the application and necessary application logic
 '''
 import os
+from datetime import timedelta
 from flask import Flask
 from flask.ext.sqlalchemy import SQLAlchemy
 from flask.ext.login import LoginManager
@@ -19,7 +20,7 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 login_manager = LoginManager()
 login_manager.session_protection = 'strong'
 
-cache = Cache(config={'CACHE_TYPE':'simple'})
+cache = Cache()
 db = SQLAlchemy()
 csrf = CsrfProtect()
 celery = Celery('__main__')
@@ -30,7 +31,18 @@ def create_app(config_name):
     env = Environments(app, default_env=config_name)
     env.from_yaml(os.path.join(basedir, 'config.yml'))
     celery.conf.update(BROKER_URL=app.config['REDIS_URL'],
-                CELERY_RESULT_BACKEND=app.config['REDIS_URL'])
+                CELERY_RESULT_BACKEND=app.config['REDIS_URL'],
+                CELERY_IMPORTS=('ooiservices.app.uframe.tasks',),
+                CELERYBEAT_SCHEDULE={
+                    'cleanup-exports': {
+                        'task': 'ooiservices.app.uframe.tasks.cleanup_exports',
+                        'schedule': timedelta(hours=1)},
+                    'warm-cache': {
+                        'task': 'ooiservices.app.uframe.tasks.warm_cache',
+                        'schedule': timedelta(seconds=app.config['CACHE_WARM_INTERVAL'])},
+                    'refresh-parameter-index': {
+                        'task': 'ooiservices.app.uframe.tasks.refresh_parameter_index',
+                        'schedule': timedelta(seconds=app.config['PARAM_INDEX_INTERVAL'])}})
 
     #Adding logging capabilities.
     if app.config['LOGGING'] == True:
@@ -68,6 +80,9 @@ def create_app(config_name):
     csrf.init_app(app)
     redis_store.init_app(app)
 
+    from ooiservices.app.tracing import init_app as init_tracing
+    init_tracing(app)
+
     from ooiservices.app.main import api as main_blueprint
     app.register_blueprint(main_blueprint)
 
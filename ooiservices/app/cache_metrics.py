@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+'''
+ooiservices.cache_metrics
+
+Hit, miss, expiration and eviction counts and entry sizes for the service
+caches, broken down by logical cache name and kept in the shared redis store
+so that every worker reports into the same numbers. An entry that outlived
+its timeout is an expiration; one the backend dropped earlier (LRU, memory
+limit) is an eviction.
+'''
+from functools import wraps
+from fnmatch import fnmatch
+from flask import current_app
+from ooiservices.app import cache, redis_store
+import numpy as np
+import sys
+import time
+
+CACHE_NAMES_KEY = 'ooiservices:cache_names'
+CACHE_STATS_KEY = 'ooiservices:cache_stats:%s'
+#the index of a cache: entry sizes in a hash, expiry times in a sorted set
+CACHE_SIZES_KEY = 'ooiservices:cache_sizes:%s'
+CACHE_EXPIRY_KEY = 'ooiservices:cache_expiry:%s'
+
+#caches that report their own size, name -> function returning (entries, bytes)
+size_reporters = {}
+
+
+def record(name, event, amount=1):
+    '''
+    Counts a hits, misses, expirations or evictions event for a cache. Never
+    raises, the metrics must not break the request they describe.
+    '''
+    try:
+        pipe = redis_store.pipeline()
+        pipe.sadd(CACHE_NAMES_KEY, name)
+        pipe.hincrby(CACHE_STATS_KEY % name, event, amount)
+        pipe.execute()
+    except Exception, e:
+        current_app.logger.debug('cache metrics not recorded: %s' % e)
+
+def _sizeof(value):
+    '''
+    Approximate size in bytes of a cached value
+    '''
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_sizeof(v) for v in value.itervalues())
+    if hasattr(value, 'content') and hasattr(value, 'status_code'):
+        #requests.Response
+        return len(value.content)
+    return sys.getsizeof(value)
+
+def make_key(name, args):
+    return ':'.join([name] + [unicode(a) for a in args])
+
+def lookup(name, key):
+    '''
+    The value cached under key or None, counted as a hit or miss of the
+    cache name
+    '''
+    value = cache.get(key)
+    if value is not None:
+        record(name, 'hits')
+        return value
+    try:
+        #a key still indexed expired or was dropped by the backend; whoever
+        #takes it out of the index counts it, once
+        pipe = redis_store.pipeline()
+        pipe.sadd(CACHE_NAMES_KEY, name)
+        pipe.hincrby(CACHE_STATS_KEY % name, 'misses', 1)
+        pipe.zscore(CACHE_EXPIRY_KEY % name, key)
+        pipe.zrem(CACHE_EXPIRY_KEY % name, key)
+        pipe.hdel(CACHE_SIZES_KEY % name, key)
+        added, misses, expires, removed, deleted = pipe.execute()
+        if removed:
+            record(name, 'expirations' if expires <= time.time() else 'evictions')
+    except Exception, e:
+        current_app.logger.debug('cache metrics not recorded: %s' % e)
+    return None
+
+def store(name, key, value, timeout):
+    '''
+    Caches value under key for timeout seconds and indexes its size. The
+    index entries past their timeout are pruned on the way.
+    '''
+    cache.set(key, value, timeout=timeout)
+    try:
+        now = time.time()
+        pipe = redis_store.pipeline()
+        pipe.sadd(CACHE_NAMES_KEY, name)
+        pipe.hset(CACHE_SIZES_KEY % name, key, _sizeof(value))
+        pipe.zadd(CACHE_EXPIRY_KEY % name, **{key: now + timeout})
+        pipe.zrangebyscore(CACHE_EXPIRY_KEY % name, '-inf', now)
+        pipe.zremrangebyscore(CACHE_EXPIRY_KEY % name, '-inf', now)
+        _drop_expired(name, pipe.execute()[3])
+    except Exception, e:
+        current_app.logger.debug('cache metrics not recorded: %s' % e)
+
+def get_or_set(name, key, timeout, compute):
+    '''
+    The value cached under key, or the value of compute() which is then
+    cached for timeout seconds. Reported under the cache name.
+    '''
+    value = lookup(name, key)
+    if value is None:
+        value = compute()
+        store(name, key, value, timeout)
+    return value
+
+def memoize(name, timeout=3600):
+    '''
+    Memoizes a function in the application cache, like cache.memoize, and
+    reports its hits, misses, expirations, evictions and entry sizes under
+    name. Keys are readable (name:arg:arg...) so entries can be invalidated
+    by stream, ref or pattern.
+    '''
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args):
+            return get_or_set(name, make_key(name, args), timeout, lambda: f(*args))
+
+        def invalidate(*args):
+            key = make_key(name, args)
+            cache.delete(key)
+            _unindex(name, key)
+
+        decorated_function.uncached = f
+        decorated_function.cache_name = name
+        decorated_function.invalidate = invalidate
+        return decorated_function
+    return decorator
+
+def _drop_expired(name, expired):
+    '''
+    Drops the sizes of keys taken out of the expiry index, counting them as
+    expirations
+    '''
+    if expired:
+        pipe = redis_store.pipeline()
+        pipe.hdel(CACHE_SIZES_KEY % name, *expired)
+        pipe.hincrby(CACHE_STATS_KEY % name, 'expirations', len(expired))
+        pipe.execute()
+
+def _prune_expired(name):
+    '''
+    Drops index entries past their timeout, counting them as expirations.
+    Returns the live entries as key -> size.
+    '''
+    now = time.time()
+    pipe = redis_store.pipeline()
+    pipe.zrangebyscore(CACHE_EXPIRY_KEY % name, '-inf', now)
+    pipe.zremrangebyscore(CACHE_EXPIRY_KEY % name, '-inf', now)
+    pipe.hgetall(CACHE_SIZES_KEY % name)
+    expired, removed, sizes = pipe.execute()
+    _drop_expired(name, expired)
+    expired = set(expired)
+    return dict((key, int(size)) for key, size in sizes.iteritems() if key not in expired)
+
+def _unindex(name, key):
+    '''
+    Takes an invalidated key out of the index of a cache
+    '''
+    pipe = redis_store.pipeline()
+    pipe.hdel(CACHE_SIZES_KEY % name, key)
+    pipe.zrem(CACHE_EXPIRY_KEY % name, key)
+    pipe.execute()
+
+def get_cache_stats():
+    '''
+    Hits, misses, expirations, evictions, entry count and bytes per cache
+    name
+    '''
+    stats = {}
+    for name in redis_store.smembers(CACHE_NAMES_KEY):
+        if name in size_reporters:
+            entries, size = size_reporters[name]()
+        else:
+            live = _prune_expired(name)
+            entries, size = len(live), sum(live.values())
+        counts = redis_store.hgetall(CACHE_STATS_KEY % name)
+        lookups = int(counts.get('hits', 0)) + int(counts.get('misses', 0))
+        stats[name] = {'hits': int(counts.get('hits', 0)),
+                       'misses': int(counts.get('misses', 0)),
+                       'expirations': int(counts.get('expirations', 0)),
+                       'evictions': int(counts.get('evictions', 0)),
+                       'hit_ratio': float(counts.get('hits', 0)) / lookups if lookups else None,
+                       'entries': entries,
+                       'bytes': size}
+    return stats
+
+def invalidate(name=None, stream=None, ref=None, pattern=None):
+    '''
+    Deletes the memoized entries whose key contains the stream or ref, or
+    matches the (fnmatch) pattern, optionally only in the cache called name.
+    Returns the deleted keys.
+    '''
+    names = [name] if name else redis_store.smembers(CACHE_NAMES_KEY)
+    deleted = []
+    for name in names:
+        if name in size_reporters:
+            continue
+        for key in _prune_expired(name):
+            parts = key.split(':')
+            if (stream and stream in parts) or (ref and ref in parts) or \
+                    (pattern and fnmatch(key, pattern)):
+                cache.delete(key)
+                _unindex(name, key)
+                deleted.append(key)
+    return deleted
+
+def reset_stats():
+    '''
+    Zeroes the counters of every cache
+    '''
+    for name in redis_store.smembers(CACHE_NAMES_KEY):
+        redis_store.delete(CACHE_STATS_KEY % name)
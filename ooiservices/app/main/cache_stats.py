@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+'''
+Cache metrics endpoint
+
+'''
+
+from flask import jsonify
+from ooiservices.app.main import api
+from ooiservices.app.main.authentication import auth
+from ooiservices.app.decorators import scope_required
+from ooiservices.app.cache_metrics import get_cache_stats
+
+@api.route('/cache_stats', methods=['GET'])
+@auth.login_required
+@scope_required(u'user_admin')
+def get_cache_stats_route():
+    '''
+    Hits, misses, expirations, evictions, entry count and bytes for each cache
+    '''
+    return jsonify(caches=get_cache_stats())
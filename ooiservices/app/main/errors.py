@@ -37,6 +37,12 @@ def internal_server_error(message):
     response.status_code = 500
     return response
 
+def service_unavailable(message):
+    response = jsonify({'error': 'service unavailable', 'message': message})
+    current_app.logger.info('error: 503 - %s' % message)
+    response.status_code = 503
+    return response
+
 @api.errorhandler(ValidationError)
 def validation_error(e):
     return bad_request(e.args[0])
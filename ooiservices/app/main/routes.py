@@ -11,11 +11,9 @@ from ooiservices.app import db, cache
 from authentication import auth
 from ooiservices.app.models import PlatformDeployment, InstrumentDeployment
 from ooiservices.app.models import Stream, StreamParameter, Organization, Instrumentname
-from ooiservices.app.uframe.controller import get_data
 import json
 import yaml
 from wtforms import ValidationError
-from netCDF4 import num2date, date2index
 
 @api.route('/platform_deployments')
 def get_platform_deployments():
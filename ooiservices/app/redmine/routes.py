@@ -8,6 +8,7 @@ from flask import jsonify, request, Response, current_app
 from ooiservices.app.redmine import redmine as api
 from ooiservices.app.main.authentication import auth
 from ooiservices.app.decorators import scope_required
+from ooiservices.app.tracing import span
 from collections import OrderedDict
 from redmine import Redmine
 import json
@@ -66,10 +67,11 @@ def create_redmine_ticket():
     redmine = redmine_login()
 
     # Create new issue
-    issue = redmine.issue.new()
-    for key, value in fields.iteritems():
-        setattr(issue, key, value)
-    issue.save()
+    with span('http', url=current_app.config['REDMINE_URL'], op='issue.save'):
+        issue = redmine.issue.new()
+        for key, value in fields.iteritems():
+            setattr(issue, key, value)
+        issue.save()
 
     return data, 201
 
@@ -91,15 +93,16 @@ def get_all_redmine_tickets():
     proj = request.args['project']
 
     # project = redmine.project.get('ooinet-user-interface-development').refresh()
-    project = redmine.project.get(proj).refresh()
-
-    issues = dict(issues=[])
-    for issue in project.issues:
-        details = OrderedDict()
-        for field in issue_fields:
-            if hasattr(issue, field):
-                details[field] = str(getattr(issue, field))
-        issues['issues'].append(details)
+    with span('http', url=current_app.config['REDMINE_URL'], op='project.issues'):
+        project = redmine.project.get(proj).refresh()
+
+        issues = dict(issues=[])
+        for issue in project.issues:
+            details = OrderedDict()
+            for field in issue_fields:
+                if hasattr(issue, field):
+                    details[field] = str(getattr(issue, field))
+            issues['issues'].append(details)
     return jsonify(issues)
 
 
@@ -139,12 +142,13 @@ def update_redmine_ticket():
     redmine = redmine_login()
 
     # Get the issue
-    issue = redmine.issue.get(dataDict['resource_id'])
-    for key, value in fields.iteritems():
-        # Update all fields except the issue resource id
-        if 'resource_id' != key:
-            setattr(issue, key, value)
-    issue.save()
+    with span('http', url=current_app.config['REDMINE_URL'], op='issue.update'):
+        issue = redmine.issue.get(dataDict['resource_id'])
+        for key, value in fields.iteritems():
+            # Update all fields except the issue resource id
+            if 'resource_id' != key:
+                setattr(issue, key, value)
+        issue.save()
 
     return data, 201
 
@@ -163,12 +167,13 @@ def get_redmine_ticket():
                         mimetype="application/json")
 
     issue_id = request.args['id']
-    issue = redmine.issue.get(issue_id, include='children,journals,watchers')
+    with span('http', url=current_app.config['REDMINE_URL'], op='issue.get'):
+        issue = redmine.issue.get(issue_id, include='children,journals,watchers')
 
-    details = OrderedDict()
-    for field in issue_fields:
-        if hasattr(issue, field):
-            details[field] = str(getattr(issue, field))
+        details = OrderedDict()
+        for field in issue_fields:
+            if hasattr(issue, field):
+                details[field] = str(getattr(issue, field))
 
     return jsonify(details)
 
@@ -187,13 +192,14 @@ def get_redmine_users():
                         mimetype="application/json")
 
     proj = request.args['project']
-    project = redmine.project.get(proj).refresh()
+    with span('http', url=current_app.config['REDMINE_URL'], op='project.memberships'):
+        project = redmine.project.get(proj).refresh()
+
+        users = dict(users=[],user_id=[])
 
-    users = dict(users=[],user_id=[])
-    
-    for user in project.memberships:
+        for user in project.memberships:
 
-        users['users'].append([user['user']['name'],user['id']])
+            users['users'].append([user['user']['name'],user['id']])
 
 
     return jsonify(users)
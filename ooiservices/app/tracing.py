@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+'''
+ooiservices.tracing
+
+Per-request tracing. Upstream http calls, JSON decoding, database queries
+and plot rendering are recorded as spans on the trace of the current
+request, summarized in a Server-Timing response header and logged in full
+when the request is slow.
+'''
+
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, request, current_app, has_request_context
+from flask.ext.sqlalchemy import get_debug_queries
+import threading
+import requests
+import time
+
+_local = threading.local()
+
+
+class Trace(object):
+
+    def __init__(self):
+        self.start = time.time()
+        self.spans = []
+
+    @contextmanager
+    def span(self, kind, **attrs):
+        record = dict(attrs, kind=kind, start=time.time())
+        try:
+            yield record
+        finally:
+            record['duration'] = time.time() - record['start']
+            #list.append is atomic, spans may come from worker threads
+            self.spans.append(record)
+
+    def summary(self):
+        '''
+        Total duration and count of the spans of each kind
+        '''
+        kinds = {}
+        for s in self.spans:
+            duration, count = kinds.get(s['kind'], (0.0, 0))
+            kinds[s['kind']] = (duration + s['duration'], count + 1)
+        return kinds
+
+    def server_timing(self):
+        '''
+        The trace as a Server-Timing header value, durations in ms
+        '''
+        metrics = ['%s;dur=%.1f;desc="%d calls"' % (kind, duration * 1000, count)
+                   for kind, (duration, count) in sorted(self.summary().iteritems())]
+        metrics.append('total;dur=%.1f' % ((time.time() - self.start) * 1000))
+        return ', '.join(metrics)
+
+def current_trace():
+    '''
+    The trace of the current request, or of the request a worker thread was
+    bound to with traced(). None outside of a request.
+    '''
+    if has_request_context():
+        return getattr(g, 'trace', None)
+    return getattr(_local, 'trace', None)
+
+@contextmanager
+def span(kind, **attrs):
+    '''
+    Records a span of kind on the current trace, if there is one
+    '''
+    trace = current_trace()
+    if trace is None:
+        yield dict(attrs)
+        return
+    with trace.span(kind, **attrs) as record:
+        yield record
+
+def traced(trace, f):
+    '''
+    Wraps f so that, run in a worker thread, its spans go to trace
+    '''
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        _local.trace = trace
+        try:
+            return f(*args, **kwargs)
+        finally:
+            _local.trace = None
+    return decorated_function
+
+def traced_get(url, **kwargs):
+    '''
+    requests.get, recorded as an http span with the url, status and size.
+    For streamed responses the span ends when the headers arrive.
+    '''
+    with span('http', url=url) as record:
+        response = requests.get(url, **kwargs)
+        record['status'] = response.status_code
+        if kwargs.get('stream'):
+            record['bytes'] = int(response.headers.get('content-length') or 0)
+        else:
+            record['bytes'] = len(response.content)
+    return response
+
+def traced_json(response):
+    '''
+    response.json(), recorded as a decode span
+    '''
+    with span('decode', url=response.url, bytes=len(response.content)):
+        return response.json()
+
+def start_trace():
+    g.trace = Trace()
+
+def finish_trace(response):
+    trace = getattr(g, 'trace', None)
+    if trace is None:
+        return response
+    for query in get_debug_queries():
+        trace.spans.append({'kind': 'db', 'statement': query.statement,
+                            'start': query.start_time, 'duration': query.duration})
+    if current_app.config.get('TRACE_SERVER_TIMING'):
+        response.headers['Server-Timing'] = trace.server_timing()
+    elapsed = time.time() - trace.start
+    if elapsed >= current_app.config.get('SLOW_REQUEST_TIME', float('inf')):
+        current_app.logger.warning('Slow request %.3fs: %s %s' % (elapsed, request.method, request.full_path))
+        for s in sorted(trace.spans, key=lambda s: s['start']):
+            details = ' '.join('%s=%s' % (k, v) for k, v in sorted(s.iteritems())
+                               if k not in ('kind', 'start', 'duration'))
+            current_app.logger.warning('  %-6s %8.1fms %s' % (s['kind'], s['duration'] * 1000, details))
+    return response
+
+def init_app(app):
+    app.before_request(start_trace)
+    app.after_request(finish_trace)
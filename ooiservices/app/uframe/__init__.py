@@ -10,4 +10,4 @@ from flask import Blueprint
 
 uframe = Blueprint('uframe', __name__)
 
-from ooiservices.app.uframe import controller
+from ooiservices.app.uframe import controller, export, tail, param_index, tiles
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/chunk_store.py
+
+Disk backed store of stream data, split into fixed time chunks with one
+.npy file per field. Chunks are memory-mapped on read, so a time window only
+touches the chunks it overlaps. Chunks that lie entirely in the past never
+change and are never refetched; the live chunk is refetched, and only its
+time range, on every read that reaches it. The least recently read chunks
+are evicted once the store grows past its disk budget.
+
+Layout: <root>/<stream>/<ref>/<chunk index>/<field>.npy, plus per stream
+.first (time of the first record) and .timestamp (the preferred timestamp
+field)
+'''
+
+from flask import current_app
+from ooiservices.app import basedir
+from ooiservices.app.cache_metrics import record, size_reporters
+from ooiservices.app.uframe.data import to_columns, COSMO_CONSTANT
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+
+TIME_FIELD = '__time__'
+
+
+class ChunkStore(object):
+
+    def __init__(self, root, chunk_seconds, budget_bytes):
+        self.root = root
+        self.chunk_seconds = chunk_seconds
+        self.budget_bytes = budget_bytes
+        #bytes stored, counted once from disk and then kept up to date
+        #with the chunks this process saves and evicts
+        self.stored_bytes = None
+
+    def _chunk_dir(self, stream, ref, index):
+        return os.path.join(self.root, stream, ref, str(index))
+
+    def _is_historic(self, index):
+        '''
+        A chunk is historic once its whole time range is in the past
+        '''
+        now = time.time() + COSMO_CONSTANT
+        return (index + 1) * self.chunk_seconds <= now
+
+    def _load(self, chunk_dir):
+        '''
+        Memory-maps every field of a stored chunk
+        '''
+        chunk = {}
+        for name in os.listdir(chunk_dir):
+            path = os.path.join(chunk_dir, name)
+            try:
+                chunk[name[:-4]] = np.load(path, mmap_mode='r')
+            except ValueError:
+                #empty arrays cannot be mapped
+                chunk[name[:-4]] = np.load(path)
+        os.utime(chunk_dir, None)
+        return chunk
+
+    def _stream_dir(self, stream, ref):
+        stream_dir = os.path.join(self.root, stream, ref)
+        if not os.path.exists(stream_dir):
+            try:
+                os.makedirs(stream_dir)
+            except OSError:
+                #created concurrently
+                pass
+        return stream_dir
+
+    def _save(self, stream, ref, index, chunk):
+        '''
+        Writes a chunk to a temporary directory and moves it into place, so
+        readers in other processes only ever see complete chunks.
+        '''
+        tmp_dir = tempfile.mkdtemp(dir=self._stream_dir(stream, ref), prefix='.tmp')
+        size = 0
+        for field, values in chunk.iteritems():
+            if values.dtype == object:
+                values = np.array([u'' if v is None else unicode(v) for v in values])
+            path = os.path.join(tmp_dir, field + '.npy')
+            np.save(path, values)
+            size += os.path.getsize(path)
+        try:
+            os.rename(tmp_dir, self._chunk_dir(stream, ref, index))
+        except OSError:
+            #another process stored the chunk first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        if self.stored_bytes is not None:
+            self.stored_bytes += size
+
+    def _first_time_path(self, stream, ref):
+        return os.path.join(self.root, stream, ref, '.first')
+
+    def _first_time(self, stream, ref):
+        '''
+        Time of the first record of a stream, known once it has been fetched
+        '''
+        try:
+            with open(self._first_time_path(stream, ref)) as f:
+                return float(f.read())
+        except (IOError, ValueError):
+            return None
+
+    def _timestamp_path(self, stream, ref):
+        return os.path.join(self.root, stream, ref, '.timestamp')
+
+    def timestamp_field(self, stream, ref):
+        '''
+        Name of the preferred timestamp field of a stream, known once it has
+        been fetched
+        '''
+        try:
+            with open(self._timestamp_path(stream, ref)) as f:
+                return f.read() or None
+        except IOError:
+            return None
+
+    def _write_marker(self, path, value):
+        with open(path, 'w') as f:
+            f.write(value)
+
+    def _split(self, data, indices):
+        '''
+        Splits uframe records into the chunks with the given indices. Also
+        returns the preferred timestamp field.
+        '''
+        fields = [f for f in data[0].keys() if f != 'preferred_timestamp']
+        pref_timestamp, t, columns = to_columns(data, fields)
+        columns[TIME_FIELD] = t
+        chunks = {}
+        for index in indices:
+            lo, hi = np.searchsorted(t, [index * self.chunk_seconds, (index + 1) * self.chunk_seconds])
+            chunks[index] = dict((k, v[lo:hi]) for k, v in columns.iteritems())
+        return pref_timestamp, chunks
+
+    def iter_chunks(self, stream, ref, start, end, fetch):
+        '''
+        Yields, per chunk, a dict of field arrays covering start <= t < end.
+        The arrays are slices of memory-mapped files where the chunk is
+        stored. fetch(start, end) is called at most once, when chunks are
+        missing, and returns the uframe records of the stream between start
+        and end; the first time a stream is read it is asked for the whole
+        history up to the missing chunks, so the start of the stream is known.
+        '''
+        #nothing precedes the first record or follows the present
+        first = self._first_time(stream, ref)
+        if first is not None:
+            start = max(start, first)
+        end = min(end, time.time() + COSMO_CONSTANT)
+        if end < start:
+            return
+
+        indices = range(int(start // self.chunk_seconds), int(end // self.chunk_seconds) + 1)
+        chunks = {}
+        missing = []
+        known = self.timestamp_field(stream, ref) is not None
+        for index in indices:
+            chunk_dir = self._chunk_dir(stream, ref, index)
+            if known and os.path.isdir(chunk_dir):
+                chunks[index] = self._load(chunk_dir)
+            else:
+                missing.append(index)
+        record('chunk_store', 'hits', len(chunks))
+
+        if missing:
+            fetch_start = missing[0] * self.chunk_seconds if first is not None else 0
+            data = fetch(fetch_start, (missing[-1] + 1) * self.chunk_seconds)
+            if not data:
+                #nothing new, the stored chunks are all there is
+                missing = []
+        if missing:
+            if first is None:
+                first = min(float(d[d['preferred_timestamp']]) for d in data)
+                indices = [i for i in indices if (i + 1) * self.chunk_seconds > first]
+                missing = [i for i in missing if (i + 1) * self.chunk_seconds > first]
+            record('chunk_store', 'misses', len(missing))
+            pref_timestamp, fetched = self._split(data, missing)
+            for index in missing:
+                if self._is_historic(index):
+                    self._save(stream, ref, index, fetched[index])
+                chunks[index] = fetched[index]
+            self._stream_dir(stream, ref)
+            self._write_marker(self._first_time_path(stream, ref), repr(first))
+            self._write_marker(self._timestamp_path(stream, ref), pref_timestamp)
+            if self.stored_bytes is None or self.stored_bytes > self.budget_bytes:
+                self.evict()
+
+        for index in indices:
+            chunk = chunks.get(index)
+            if chunk is None:
+                continue
+            t = chunk[TIME_FIELD]
+            lo, hi = np.searchsorted(t, [start, end])
+            if hi > lo:
+                yield dict((k, v[lo:hi]) for k, v in chunk.iteritems())
+
+    def read(self, stream, ref, fields, start, end, fetch):
+        '''
+        Reads the time array and the requested fields for start <= t < end.
+        A window within one chunk is returned without copying.
+        '''
+        parts = list(self.iter_chunks(stream, ref, start, end, fetch))
+        if len(parts) == 1:
+            return parts[0][TIME_FIELD], dict((f, parts[0][f]) for f in fields)
+        if not parts:
+            return np.array([]), dict((f, np.array([])) for f in fields)
+        t = np.concatenate([p[TIME_FIELD] for p in parts])
+        return t, dict((f, np.concatenate([p[f] for p in parts])) for f in fields)
+
+    def _list_chunks(self):
+        '''
+        (last read time, size, directory) of every stored chunk
+        '''
+        chunks = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if not os.path.basename(dirpath).isdigit():
+                continue
+            size = sum(os.path.getsize(os.path.join(dirpath, f)) for f in filenames)
+            chunks.append((os.path.getmtime(dirpath), size, dirpath))
+        return chunks
+
+    def usage(self):
+        '''
+        Number of stored chunks and their size in bytes
+        '''
+        chunks = self._list_chunks()
+        return len(chunks), sum(size for mtime, size, dirpath in chunks)
+
+    def evict(self):
+        '''
+        Removes the least recently read chunks until the store fits its
+        budget. Walks the store, so it is only run when the tracked size
+        is over the budget (or not known yet).
+        '''
+        chunks = self._list_chunks()
+        total = sum(size for mtime, size, dirpath in chunks)
+        evicted = 0
+        for mtime, size, dirpath in sorted(chunks):
+            if total <= self.budget_bytes:
+                break
+            shutil.rmtree(dirpath, ignore_errors=True)
+            total -= size
+            evicted += 1
+        self.stored_bytes = total
+        if evicted:
+            record('chunk_store', 'evictions', evicted)
+
+def get_chunk_store():
+    '''
+    The chunk store of the current application
+    '''
+    store = current_app.extensions.get('chunk_store')
+    if store is None:
+        store = ChunkStore(basedir + current_app.config['CHUNK_STORE_DIR'],
+                           current_app.config['CHUNK_SECONDS'],
+                           current_app.config['CHUNK_STORE_BUDGET'])
+        current_app.extensions['chunk_store'] = store
+    return store
+
+size_reporters['chunk_store'] = lambda: get_chunk_store().usage()
@@ -7,14 +7,28 @@ __author__ = 'Andy Bird'
 #base
 from flask import jsonify, request, current_app, url_for, Flask, make_response
 from ooiservices.app import db, cache, celery
+from ooiservices.app.cache_metrics import memoize, get_or_set, lookup, store, make_key
+from ooiservices.app.tracing import traced_get, traced_json, traced, current_trace
 from ooiservices.app.uframe import uframe as api
 from ooiservices.app.models import Array, PlatformDeployment, InstrumentDeployment,Stream, StreamParameter, Organization, Instrumentname,Annotation
 from ooiservices.app.main.authentication import auth,verify_auth
-from ooiservices.app.main.errors import internal_server_error
+from ooiservices.app.main.errors import internal_server_error, bad_request, service_unavailable
 from urllib import urlencode
 #data ones
-from ooiservices.app.uframe.data import get_data, _get_annotation_content, COSMO_CONSTANT
-from ooiservices.app.uframe.plotting import generate_plot
+from ooiservices.app.uframe.data import get_data, get_data_columns, get_annotation_overlay, COSMO_CONSTANT
+from ooiservices.app.uframe.data import get_uframe_data_url, fetch_uframe_columns
+from ooiservices.app.uframe.data import align_nearest, align_interp, nan_to_none, density_grid
+from ooiservices.app.uframe.data import get_resampled_columns, parse_interval, parse_window, RESAMPLE_AGGREGATES
+from ooiservices.app.uframe.data import record_stream_request, parse_date
+from ooiservices.app.uframe.data import parse_qc, qc_rejected, to_column, QC_FIELD
+from ooiservices.app.uframe.times import parse_time_format, times_to_list, convert_times, TIME_FORMATS, TIME_UNITS
+from ooiservices.app.uframe.trajectory import get_trajectory, simplify_for_zoom, zoom_tolerance, MAX_ZOOM
+from ooiservices.app.uframe.profiles import profile_plot_data, section_plot_data
+from ooiservices.app.uframe.profiles import MAX_OVERLAID_PROFILES, MAX_SECTION_COLUMNS, MAX_DEPTH_BINS
+from ooiservices.app.uframe.render_pool import render_plot, submit_plot, plot_digest, RenderPoolBusy, PLOT_CACHE
+from ooiservices.app.uframe.render_pool import render_profile_plot, render_section_plot
+from ooiservices.app.uframe.render_pool import render_scatter_plot, render_density_plot
+from multiprocessing import TimeoutError
 import requests
 #additional ones
 import json
@@ -23,41 +37,72 @@ import math
 import csv
 import io
 import numpy as np
+from multiprocessing.pool import ThreadPool
+from base64 import urlsafe_b64encode, urlsafe_b64decode, b64encode
+from collections import deque
+from bisect import bisect_left, bisect_right
+
+#upper bound on concurrent uframe requests made for a single api call
+MAX_FETCH_THREADS = 8
+#upper bound on the plots of one batch plot request
+MAX_BATCH_PLOTS = 50
+#upper bound on the bins per axis of a density scatter plot
+MAX_DENSITY_BINS = 500
 
 @api.route('/stream')
 @auth.login_required
 def streams_list():
-    UFRAME_DATA = current_app.config['UFRAME_URL'] + '/sensor/m2m/inv'
-
-
+    '''
+    Lists the streams, ordered by stream name and reference designator.
+    usage: /uframe/stream?limit=50&cursor=<next_cursor of the previous page>
+    Only the entries of the requested page are fetched from uframe.
+    '''
     HOST = str(current_app.config['HOST'])
     PORT = str(current_app.config['PORT'])
     SERVICE_LOCATION = 'http://'+HOST+":"+PORT
 
+    try:
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+        after = decode_cursor(request.args['cursor']) if 'cursor' in request.args else None
+    except (TypeError, ValueError):
+        return bad_request('limit must be an integer and cursor a next_cursor value')
+    if limit is not None and limit < 1:
+        return bad_request('limit must be positive')
+
     response = get_uframe_streams()
     if response.status_code != 200:
         return response
-    streams = response.json()
+    streams = sorted(traced_json(response))
+    if request.args.get('stream_name'):
+        streams = [s for s in streams if request.args.get('stream_name') in s]
 
     retval = []
-    for stream in streams:
-        if request.args.get('stream_name'):
-            if request.args.get('stream_name') not in stream:
-                continue
+    next_cursor = None
+    first = bisect_left(streams, after[0]) if after else 0
+    for stream in streams[first:]:
+        #a page filled by the previous stream ends before this one is fetched
+        if limit is not None and len(retval) == limit:
+            next_cursor = encode_cursor(retval[-1]['stream_name'], retval[-1]['reference_designator'])
+            break
         response = get_uframe_stream(stream)
         if response.status_code != 200:
             return response
-        refs = response.json()
+        refs = sorted(traced_json(response))
 
         if request.args.get('reference_designator'):
             refs = [r for r in refs if request.args.get('reference_designator') in r]
+        if after and stream == after[0]:
+            refs = refs[bisect_right(refs, after[1]):]
 
         for ref in refs:
-            data_dict = {}
+            if limit is not None and len(retval) == limit:
+                next_cursor = encode_cursor(retval[-1]['stream_name'], retval[-1]['reference_designator'])
+                break
             response = get_uframe_stream_contents(stream, ref)
             if response.status_code != 200:
                 return response
-            data =  response.json()
+            data = traced_json(response)
+            data_dict = {}
             preferred = data[0][u'preferred_timestamp']
             data_dict['start'] = data[0][preferred] - COSMO_CONSTANT
             data_dict['end'] = data[-1][preferred] - COSMO_CONSTANT
@@ -70,41 +115,61 @@ def streams_list():
             data_dict['variable_types'] = {k : type(data[1][k]).__name__ for k in data[1].keys() }
             data_dict['preferred_timestamp'] = data[0]['preferred_timestamp']
             retval.append(data_dict)
+        if next_cursor:
+            break
 
+    if limit is not None:
+        return jsonify(streams=retval, next_cursor=next_cursor)
     return jsonify(streams=retval)
 
-@cache.memoize(timeout=3600)
+def encode_cursor(stream, ref):
+    '''
+    Opaque cursor pointing after the entry stream/ref
+    '''
+    return urlsafe_b64encode(json.dumps([stream, ref]))
+
+def decode_cursor(cursor):
+    '''
+    The (stream, ref) of a cursor, ValueError if it is not one
+    '''
+    try:
+        stream, ref = json.loads(urlsafe_b64decode(str(cursor)))
+    except Exception:
+        raise ValueError('invalid cursor')
+    return stream, ref
+
+@memoize('uframe_streams', timeout=3600)
 def get_uframe_streams():
     '''
     Lists all the streams
     '''
     try:
         UFRAME_DATA = current_app.config['UFRAME_URL'] + '/sensor/m2m/inv'
-        response = requests.get(UFRAME_DATA)
+        response = traced_get(UFRAME_DATA)
         return response
     except:
         return internal_server_error('uframe connection cannot be made.')
 
-@cache.memoize(timeout=3600)
+@memoize('uframe_stream', timeout=3600)
 def get_uframe_stream(stream):
     '''
     Lists the reference designators for the streams
     '''
     try:
         UFRAME_DATA = current_app.config['UFRAME_URL'] + '/sensor/m2m/inv'
-        response = requests.get("/".join([UFRAME_DATA,stream]))
+        response = traced_get("/".join([UFRAME_DATA,stream]))
         return response
     except:
         return internal_server_error('uframe connection cannot be made.')
 
-@cache.memoize(timeout=3600)
+@memoize('uframe_stream_contents', timeout=3600)
 def get_uframe_stream_contents(stream, ref):
     '''
     Gets the stream contents
     '''
     try:
         UFRAME_DATA = current_app.config['UFRAME_URL'] + '/sensor/m2m/inv'
-        response =  requests.get("/".join([UFRAME_DATA,stream,ref]))
+        response = traced_get("/".join([UFRAME_DATA,stream,ref]))
         return response
     except:
         return internal_server_error('uframe connection cannot be made.')
@@ -112,34 +177,122 @@ def get_uframe_stream_contents(stream, ref):
 @auth.login_required
 @api.route('/get_csv/<string:stream>/<string:ref>',methods=['GET'])
 def get_csv(stream,ref):
+    record_stream_request(stream, ref)
+    if 'interval' in request.args:
+        return get_resampled_csv(stream, ref)
+    try:
+        qc_flags, qc_mode = parse_qc()
+        time_format = parse_time_format()
+    except ValueError, e:
+        return bad_request(str(e))
+
     data = get_uframe_stream_contents(stream,ref)
     if data.status_code != 200:
         return data.text, data.status_code, dict(data.headers)
 
+    data = traced_json(data)
+    if qc_flags and data and QC_FIELD not in data[0]:
+        return bad_request('%s/%s has no %s' % (stream, ref, QC_FIELD))
+    buf = records_to_csv(data, qc_flags, qc_mode, time_format)
+
+    filename = '-'.join([stream,ref])
+
+    returned_csv = make_response(buf)
+    returned_csv.headers["Content-Disposition"] = "attachment; filename=%s.csv"%filename
+    returned_csv.headers["Content-Type"] = "text/csv"
+    return returned_csv
+
+def convert_record_times(data, time_format):
+    '''
+    Converts the preferred timestamp of uframe records to time_format, in
+    place
+    '''
+    if time_format != 'ntp' and data:
+        pref_timestamp = data[0]['preferred_timestamp']
+        times = times_to_list(to_column(data, pref_timestamp), time_format)
+        for record, time_value in zip(data, times):
+            record[pref_timestamp] = time_value
+    return data
+
+def records_to_csv(data, qc_flags=None, qc_mode='drop', time_format='ntp'):
+    '''
+    uframe records as csv, with the samples rejected by qc_flags dropped or
+    masked and the preferred timestamp in time_format. The header comes from
+    the first record, so it is kept when every sample is dropped; no records
+    give an empty csv.
+    '''
+    if not data:
+        return ''
+    fieldnames = data[0].keys()
+    if qc_flags:
+        rejected = qc_rejected(to_column(data, QC_FIELD), qc_flags)
+        if qc_mode == 'drop':
+            data = [data[i] for i in np.flatnonzero(~rejected)]
+        else:
+            pref_timestamp = data[0]['preferred_timestamp']
+            kept = set(['preferred_timestamp', pref_timestamp, QC_FIELD])
+            for i in np.flatnonzero(rejected):
+                data[i] = dict((k, v if k in kept else None) for k, v in data[i].iteritems())
+    convert_record_times(data, time_format)
     output = io.BytesIO()
-    data = data.json()
-    f = csv.DictWriter(output, fieldnames = data[0].keys())
+    f = csv.DictWriter(output, fieldnames=fieldnames)
     f.writeheader()
     for row in data:
         f.writerow(row)
+    return output.getvalue()
 
-    filename = '-'.join([stream,ref])
+def get_resampled_csv(stream, ref):
+    '''
+    CSV of a stream resampled to the interval and agg request arguments
+    '''
+    agg = request.args.get('agg', 'mean')
+    if agg not in RESAMPLE_AGGREGATES:
+        return bad_request('agg must be one of %s' % ', '.join(RESAMPLE_AGGREGATES))
+    try:
+        interval = parse_interval(request.args['interval'])
+        qc_flags, qc_mode = parse_qc()
+        time_format = parse_time_format()
+        start, end = parse_window()
+    except ValueError, e:
+        return bad_request(str(e))
+    try:
+        pref_timestamp, t, columns = get_resampled_columns(stream, ref, interval, agg, ','.join(qc_flags), start, end)
+    except Exception, e:
+        return internal_server_error('uframe connection cannot be made: ' + str(e))
+    if pref_timestamp is None:
+        return bad_request('no data available for %s/%s' % (stream, ref))
 
-    buf = output.getvalue()
-    returned_csv = make_response(buf)
+    fields = sorted(columns.keys())
+    output = io.BytesIO()
+    f = csv.writer(output)
+    f.writerow([pref_timestamp] + fields)
+    table = np.column_stack([columns[k] for k in fields]) if fields else np.empty((len(t), 0))
+    for time_value, row in zip(convert_times(t, time_format).tolist(), table.tolist()):
+        f.writerow([time_value] + ['' if v != v else v for v in row])
+
+    filename = '-'.join([stream, ref, request.args['interval'], agg])
+    returned_csv = make_response(output.getvalue())
     returned_csv.headers["Content-Disposition"] = "attachment; filename=%s.csv"%filename
     returned_csv.headers["Content-Type"] = "text/csv"
-
     output.close()
     return returned_csv
 
 @auth.login_required
 @api.route('/get_json/<string:stream>/<string:ref>',methods=['GET'])
 def get_json(stream,ref):
+    record_stream_request(stream, ref)
+    try:
+        time_format = parse_time_format()
+    except ValueError, e:
+        return bad_request(str(e))
     data = get_uframe_stream_contents(stream,ref)
     if data.status_code != 200:
         return data.text, data.status_code, dict(data.headers)
-    response = '{"data":%s}' % data.content
+    if time_format == 'ntp':
+        #uframe's own times, passed through without decoding
+        response = '{"data":%s}' % data.content
+    else:
+        response = json.dumps({'data': convert_record_times(traced_json(data), time_format)})
     filename = '-'.join([stream,ref])
     returned_json = make_response(response)
     returned_json.headers["Content-Disposition"] = "attachment; filename=%s.json"%filename
@@ -152,7 +305,7 @@ def get_netcdf(stream,ref):
     UFRAME_DATA = current_app.config['UFRAME_URL'] + '/sensor/m2m/inv/%s/%s'%(stream,ref)
     NETCDF_LINK = UFRAME_DATA+'?format=application/netcdf3'
 
-    response = requests.get(NETCDF_LINK)
+    response = traced_get(NETCDF_LINK)
     if response.status_code != 200:
         return response.text, response.status_code
 
@@ -168,12 +321,24 @@ def get_netcdf(stream,ref):
 @auth.login_required
 @api.route('/get_data/<string:instrument>/<string:stream>/<string:field>',methods=['GET'])
 def get_data_api(stream, instrument,field):    
-    return jsonify(**get_data(stream,instrument,field))
+    try:
+        time_format = parse_time_format()
+    except ValueError, e:
+        return bad_request(str(e))
+    data = get_data(stream,instrument,field)
+    if 'error' not in data:
+        data.update(get_annotation_overlay(instrument, stream, data['x_field'], field, data['x']))
+        if time_format != 'ntp':
+            data['x'] = times_to_list(data['x'], time_format)
+            data['dt_units'] = TIME_UNITS[time_format]
+    return jsonify(**data)
 
 @auth.login_required
 @api.route('/plot/<string:instrument>/<string:stream>', methods=['GET'])
 def get_svg_plot(instrument, stream):
     plot_format = request.args.get('format', 'svg')
+    if plot_format not in ['svg', 'png']:
+        plot_format = 'svg'
     xvar = request.args.get('xvar', 'internal_timestamp')
     yvar = request.args.get('yvar',None)
     title = request.args.get('title', '%s Data' % stream)
@@ -189,22 +354,440 @@ def get_svg_plot(instrument, stream):
     height_in = height / 96.
     width_in = width / 96.
 
-    data = get_data(stream,instrument,yvar);
+    plot_type = request.args.get('plot_type', 'time_series')
+    if plot_type in ('profile', 'section'):
+        return get_depth_plot(instrument, stream, plot_type, yvar, title, ylabel, width_in, height_in, plot_format)
+    if plot_type == 'scatter':
+        return get_scatter_plot(instrument, stream, xvar, yvar, title, xlabel, ylabel, width_in, height_in, plot_format)
+    if plot_type != 'time_series':
+        return bad_request('plot_type must be time_series, profile, section or scatter')
+
+    #the columns as fetched, not converted to lists and back
+    data = get_data_columns(stream, instrument, yvar)
+    if 'error' in data:
+        return bad_request(data['error'])
+    x, y = data['x'], data['y']
+    if y.dtype != np.float64:
+        return bad_request('field %s is not numeric' % yvar)
+
+    digest = plot_digest([instrument, stream, xvar, yvar, title, ylabel, width, height, plot_format], x, y)
+    return plot_response(digest, plot_format,
+                         lambda: render_plot(title, ylabel, x, y, width_in, height_in, plot_format))
+
+def get_depth_plot(instrument, stream, plot_type, yvar, title, label, width_in, height_in, plot_format):
+    '''
+    Profile and depth-time section plots of yvar against the depth field
+    zvar (pressure by default), see ooiservices/app/uframe/profiles.py
+    usage: /uframe/plot/<instrument>/<stream>?plot_type=profile|section&yvar=<field>&zvar=<field>
+           &profiles=<last n profiles overlaid>&bins=<depth bins>&startdate=<date>&enddate=<date>
+    '''
+    zvar = request.args.get('zvar', 'pressure')
+    zlabel = request.args.get('zlabel', zvar)
+    try:
+        bins = min(int(request.args.get('bins', 100)), MAX_DEPTH_BINS)
+        count = min(int(request.args.get('profiles', 5)), MAX_OVERLAID_PROFILES)
+    except ValueError:
+        return bad_request('bins and profiles must be integers')
+    if bins < 1 or count < 1:
+        return bad_request('bins and profiles must be positive')
+    try:
+        start = parse_date(request.args.get('startdate'))
+        end = parse_date(request.args.get('enddate'))
+    except ValueError:
+        return bad_request('dates must be formatted as %Y-%m-%d %H:%M:%S')
+
+    record_stream_request(stream, instrument)
+    try:
+        url = get_uframe_data_url(stream, instrument)
+        pref_timestamp, t, columns = fetch_uframe_columns(url, list(set([yvar, zvar])), start, end)
+    except KeyError, e:
+        return bad_request('field %s not in stream' % e.args[0])
+    except Exception, e:
+        return internal_server_error('uframe connection cannot be made: ' + str(e))
+    if not len(t):
+        return bad_request('non data available')
+    depth = columns[zvar]
+    values = columns[yvar]
+    if depth.dtype != np.float64 or values.dtype != np.float64:
+        return bad_request('%s and %s must be numeric' % (yvar, zvar))
+    if np.isnan(depth).all():
+        return bad_request('no %s data available' % zvar)
+
+    params = [instrument, stream, plot_type, yvar, zvar, title, label, zlabel, bins, count,
+              width_in, height_in, plot_format]
+    digest = plot_digest(params, t, np.concatenate((depth, values)))
+
+    def render():
+        #the data is only binned when the plot is not cached
+        if plot_type == 'profile':
+            depth_centers, grid, times = profile_plot_data(t, depth, values, count, bins)
+            return render_profile_plot(title, label, zlabel, depth_centers, grid, times,
+                                       width_in, height_in, plot_format)
+        #no more time columns than the image has pixel columns
+        time_columns = max(min(MAX_SECTION_COLUMNS, int(width_in * 96)), 1)
+        t_edges, depth_edges, grid = section_plot_data(t, depth, values, time_columns, bins)
+        return render_section_plot(title, label, zlabel, t_edges, depth_edges, grid,
+                                   width_in, height_in, plot_format)
+
+    return plot_response(digest, plot_format, render)
+
+def get_scatter_plot(instrument, stream, xvar, yvar, title, xlabel, ylabel, width_in, height_in, plot_format):
+    '''
+    yvar against xvar. Above SCATTER_DENSITY_POINTS samples the pairs are
+    counted on a bins by bins grid and drawn as a density instead of one
+    marker per sample.
+    usage: /uframe/plot/<instrument>/<stream>?plot_type=scatter&xvar=<field>&yvar=<field>
+           &bins=<density bins>&startdate=<date>&enddate=<date>
+    '''
+    try:
+        bins = min(int(request.args.get('bins', 100)), MAX_DENSITY_BINS)
+    except ValueError:
+        return bad_request('bins must be an integer')
+    if bins < 1:
+        return bad_request('bins must be positive')
+    try:
+        start = parse_date(request.args.get('startdate'))
+        end = parse_date(request.args.get('enddate'))
+    except ValueError:
+        return bad_request('dates must be formatted as %Y-%m-%d %H:%M:%S')
 
-    buf = generate_plot(title,
-                        ylabel,
-                        data['x'],
-                        data['y'],
-                        width_in,
-                        height_in,
-                        plot_format)
+    record_stream_request(stream, instrument)
+    try:
+        url = get_uframe_data_url(stream, instrument)
+        pref_timestamp, t, columns = fetch_uframe_columns(url, list(set([xvar, yvar])), start, end)
+    except KeyError, e:
+        return bad_request('field %s not in stream' % e.args[0])
+    except Exception, e:
+        return internal_server_error('uframe connection cannot be made: ' + str(e))
+    x = columns[xvar]
+    y = columns[yvar]
+    if x.dtype != np.float64 or y.dtype != np.float64:
+        return bad_request('%s and %s must be numeric' % (xvar, yvar))
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    if not valid.any():
+        return bad_request('non data available')
+    x = x[valid]
+    y = y[valid]
+
+    density = len(x) > current_app.config['SCATTER_DENSITY_POINTS']
+    params = [instrument, stream, 'scatter', xvar, yvar, title, xlabel, ylabel, bins if density else None,
+              width_in, height_in, plot_format]
+    digest = plot_digest(params, x, y)
+
+    def render():
+        if density:
+            x_edges, y_edges, counts = density_grid(x, y, bins)
+            return render_density_plot(title, xlabel, ylabel, x_edges, y_edges, counts,
+                                       width_in, height_in, plot_format)
+        return render_scatter_plot(title, xlabel, ylabel, x, y, width_in, height_in, plot_format)
+
+    return plot_response(digest, plot_format, render)
+
+def plot_response(digest, plot_format, render):
+    '''
+    The image of a plot, served from the plot cache when the same plot of
+    the same data was rendered before
+    '''
+    try:
+        image = get_or_set(PLOT_CACHE, make_key(PLOT_CACHE, [digest]), current_app.config['PLOT_CACHE_TIMEOUT'],
+                           render)
+    except RenderPoolBusy, e:
+        return service_unavailable(str(e))
+    except TimeoutError:
+        return service_unavailable('plot rendering timed out')
+    except RuntimeError, e:
+        return bad_request('plot rendering failed: ' + str(e))
 
     content_header_map = {
         'svg' : 'image/svg+xml',
         'png' : 'image/png'
     }
 
-    return buf.read(), 200, {'Content-Type':content_header_map[plot_format]}
+    response = make_response(image)
+    response.headers['Content-Type'] = content_header_map[plot_format]
+    response.set_etag(digest)
+    return response.make_conditional(request)
+
+@api.route('/plots', methods=['POST'])
+@auth.login_required
+def get_batch_plots():
+    '''
+    Renders several plots in one request. Each instrument/stream is fetched
+    and decoded once for all of its plots, and the plots are rendered
+    concurrently in the renderer pool.
+    usage: POST {"plots": [{"id": ..., "instrument": ..., "stream": ..., "yvar": ...,
+                            "title": ..., "ylabel": ..., "width": <px>, "height": <px>,
+                            "format": "svg"|"png"}, ...]}
+    returns {"plots": {<id>: {"format", "etag", "encoding": "utf-8"|"base64", "image"}
+                       or {"error": ...}}}
+    '''
+    try:
+        specs = json.loads(request.data)['plots']
+    except (ValueError, KeyError, TypeError):
+        return bad_request('Invalid request')
+    if not isinstance(specs, list) or not specs:
+        return bad_request('plots must be a non empty list')
+    if len(specs) > MAX_BATCH_PLOTS:
+        return bad_request('at most %d plots per request' % MAX_BATCH_PLOTS)
+
+    plots = []
+    for i, spec in enumerate(specs):
+        if not isinstance(spec, dict) or any(k not in spec for k in ('instrument', 'stream', 'yvar')):
+            return bad_request('plot %d needs an instrument, stream and yvar' % i)
+        try:
+            width = float(spec.get('width', 100))
+            height = float(spec.get('height', 100))
+        except (TypeError, ValueError):
+            return bad_request('plot %d width and height must be numbers' % i)
+        plot_format = spec.get('format', 'svg')
+        plots.append({'id': unicode(spec.get('id', i)),
+                      'instrument': spec['instrument'],
+                      'stream': spec['stream'],
+                      'xvar': spec.get('xvar', 'internal_timestamp'),
+                      'yvar': spec['yvar'],
+                      'title': spec.get('title', '%s Data' % spec['stream']),
+                      'ylabel': spec.get('ylabel', spec['yvar']),
+                      'width': width,
+                      'height': height,
+                      'format': plot_format if plot_format in ('svg', 'png') else 'svg'})
+
+    #fetch each instrument/stream once, with the fields of all of its plots
+    sources = []
+    for plot in plots:
+        if (plot['instrument'], plot['stream']) not in sources:
+            sources.append((plot['instrument'], plot['stream']))
+            record_stream_request(plot['stream'], plot['instrument'])
+    fetches = []
+    for instrument, stream in sources:
+        fields = sorted(set(p['yvar'] for p in plots if (p['instrument'], p['stream']) == (instrument, stream)))
+        fetches.append((get_uframe_data_url(stream, instrument), fields))
+
+    def fetch(args):
+        try:
+            return fetch_uframe_columns(*args), None
+        except KeyError, e:
+            return None, 'stream has no field %s' % e.args[0]
+        except Exception, e:
+            return None, 'uframe connection cannot be made: %s' % e
+
+    pool = ThreadPool(min(len(sources), MAX_FETCH_THREADS))
+    try:
+        fetched = dict(zip(sources, pool.map(traced(current_trace(), fetch), fetches)))
+    finally:
+        pool.close()
+
+    results = {}
+    timeout = current_app.config['PLOT_CACHE_TIMEOUT']
+
+    def plot_entry(image, plot_format, digest):
+        if plot_format == 'png':
+            return {'format': plot_format, 'etag': digest, 'encoding': 'base64', 'image': b64encode(image)}
+        return {'format': plot_format, 'etag': digest, 'encoding': 'utf-8', 'image': image.decode('utf-8')}
+
+    def finish(plot_id, digest, plot_format, job):
+        try:
+            image = job.get()
+        except TimeoutError:
+            results[plot_id] = {'error': 'plot rendering timed out'}
+            return
+        except Exception, e:
+            results[plot_id] = {'error': str(e)}
+            return
+        store(PLOT_CACHE, make_key(PLOT_CACHE, [digest]), image, timeout)
+        results[plot_id] = plot_entry(image, plot_format, digest)
+
+    pending = deque()
+    for plot in plots:
+        columns, error = fetched[(plot['instrument'], plot['stream'])]
+        if error is None and columns[0] is None:
+            error = 'no data available'
+        if error is None and columns[2][plot['yvar']].dtype != np.float64:
+            error = 'field %s is not numeric' % plot['yvar']
+        if error is not None:
+            results[plot['id']] = {'error': error}
+            continue
+        x, y = columns[1], columns[2][plot['yvar']]
+        digest = plot_digest([plot['instrument'], plot['stream'], plot['xvar'], plot['yvar'], plot['title'],
+                              plot['ylabel'], plot['width'], plot['height'], plot['format']], x, y)
+        image = lookup(PLOT_CACHE, make_key(PLOT_CACHE, [digest]))
+        if image is not None:
+            results[plot['id']] = plot_entry(image, plot['format'], digest)
+            continue
+        while True:
+            try:
+                job = submit_plot(plot['title'], plot['ylabel'], x, y,
+                                  plot['width'] / 96., plot['height'] / 96., plot['format'])
+                pending.append((plot['id'], digest, plot['format'], job))
+                break
+            except RenderPoolBusy, e:
+                #wait for our own oldest render to free a slot
+                if not pending:
+                    results[plot['id']] = {'error': str(e)}
+                    break
+                finish(*pending.popleft())
+            except Exception, e:
+                #rendered in this process, the renderer failed on this plot
+                results[plot['id']] = {'error': str(e)}
+                break
+    while pending:
+        finish(*pending.popleft())
+
+    return jsonify(plots=results)
+
+@api.route('/merge', methods=['GET'])
+@auth.login_required
+def get_merged_data():
+    '''
+    Merges several instrument/stream/field triples onto the time base of the
+    first one.
+
+    usage: /uframe/merge?streams=<instrument>/<stream>/<field>&streams=...
+           &method=nearest|interp&tolerance=<seconds>&format=json|csv|binary
+    '''
+    triples = [s.split('/') for s in request.args.getlist('streams')]
+    if not triples or any(len(t) != 3 for t in triples):
+        return bad_request('streams must be given as instrument/stream/field')
+    if len(set(map(tuple, triples))) != len(triples):
+        return bad_request('streams must not be repeated')
+    method = request.args.get('method', 'nearest')
+    if method not in ('nearest', 'interp'):
+        return bad_request('method must be nearest or interp')
+    merge_format = request.args.get('format', 'json')
+    if merge_format not in ('json', 'csv', 'binary'):
+        return bad_request('format must be json, csv or binary')
+    try:
+        tolerance = float(request.args.get('tolerance', 1.0))
+    except ValueError:
+        return bad_request('tolerance must be a number of seconds')
+    try:
+        #binary output can hold datetime64 times
+        time_format = parse_time_format(TIME_FORMATS + ['datetime64'] if merge_format == 'binary' else TIME_FORMATS)
+    except ValueError, e:
+        return bad_request(str(e))
+
+    #fetch each instrument/stream once, concurrently
+    sources = []
+    for instrument, stream, field in triples:
+        if (instrument, stream) not in sources:
+            sources.append((instrument, stream))
+    fetches = []
+    for instrument, stream in sources:
+        fields = [f for i, s, f in triples if (i, s) == (instrument, stream)]
+        fetches.append((get_uframe_data_url(stream, instrument), fields))
+    pool = ThreadPool(min(len(sources), MAX_FETCH_THREADS))
+    try:
+        fetched = pool.map(traced(current_trace(), lambda r: fetch_uframe_columns(*r)), fetches)
+    except KeyError, e:
+        return bad_request('stream has no field %s' % e.args[0])
+    except Exception, e:
+        return internal_server_error('uframe connection cannot be made: ' + str(e))
+    finally:
+        pool.close()
+
+    columns = {}
+    for (instrument, stream), result in zip(sources, fetched):
+        if result[0] is None:
+            return bad_request('no data available for %s/%s' % (instrument, stream))
+        columns[(instrument, stream)] = result
+
+    labels = ['/'.join(t) for t in triples]
+    base_t = columns[sources[0]][1]
+    merged = []
+    for instrument, stream, field in triples:
+        pref_timestamp, t, cols = columns[(instrument, stream)]
+        if cols[field].dtype != np.float64:
+            return bad_request('field %s is not numeric' % field)
+        if method == 'nearest':
+            merged.append(align_nearest(base_t, t, cols[field], tolerance))
+        else:
+            merged.append(align_interp(base_t, t, cols[field]))
+
+    filename = 'merged-%s' % sources[0][1]
+    if merge_format == 'json':
+        return jsonify(time=times_to_list(base_t, time_format),
+                       fields=labels,
+                       data=dict((l, nan_to_none(v)) for l, v in zip(labels, merged)),
+                       data_length=len(base_t),
+                       dt_units=TIME_UNITS[time_format])
+
+    if merge_format == 'csv':
+        output = io.BytesIO()
+        f = csv.writer(output)
+        f.writerow(['time'] + labels)
+        table = np.column_stack(merged)
+        for time_value, row in zip(convert_times(base_t, time_format).tolist(), table.tolist()):
+            f.writerow([time_value] + ['' if v != v else v for v in row])
+        response = make_response(output.getvalue())
+        output.close()
+        response.headers["Content-Disposition"] = "attachment; filename=%s.csv" % filename
+        response.headers["Content-Type"] = "text/csv"
+        return response
+
+    #binary is a structured numpy array, readable with numpy.load
+    times = convert_times(base_t, time_format)
+    if time_format == 'iso':
+        times = times.astype('S32')
+    table = np.empty(len(base_t), dtype=[('time', times.dtype)] + [(str(l), np.float64) for l in labels])
+    table['time'] = times
+    for l, v in zip(labels, merged):
+        table[str(l)] = v
+    output = io.BytesIO()
+    np.save(output, table)
+    response = make_response(output.getvalue())
+    output.close()
+    response.headers["Content-Disposition"] = "attachment; filename=%s.npy" % filename
+    response.headers["Content-Type"] = "application/octet-stream"
+    return response
+
+@api.route('/trajectory/<string:instrument>/<string:stream>', methods=['GET'])
+@auth.login_required
+def get_trajectory_api(instrument, stream):
+    '''
+    Tracks of a mobile platform (glider, AUV), one per deployment, simplified
+    for a map zoom level.
+    usage: /uframe/trajectory/<instrument>/<stream>?zoom=<0-18>&lat=lat&lon=lon
+           &time_format=ntp|unix|iso
+    '''
+    lat_field = request.args.get('lat', 'lat')
+    lon_field = request.args.get('lon', 'lon')
+    try:
+        time_format = parse_time_format()
+    except ValueError, e:
+        return bad_request(str(e))
+    try:
+        zoom = int(request.args.get('zoom', MAX_ZOOM))
+    except ValueError:
+        return bad_request('zoom must be an integer')
+    if not 0 <= zoom <= MAX_ZOOM:
+        return bad_request('zoom must be between 0 and %d' % MAX_ZOOM)
+
+    record_stream_request(stream, instrument)
+    try:
+        tracks = get_trajectory(stream, instrument, lat_field, lon_field)
+    except KeyError, e:
+        return bad_request('stream has no field %s' % e.args[0])
+    except ValueError, e:
+        return bad_request(str(e))
+    except Exception, e:
+        return internal_server_error('uframe connection cannot be made: ' + str(e))
+
+    deployments = []
+    for deployment_id, start, end, track in tracks:
+        t, lat, lon = simplify_for_zoom(track, zoom)
+        #a missing start or end (None, nan) comes out as null
+        start, end = times_to_list(np.array([start, end], dtype=np.float64), time_format)
+        deployments.append({'deployment_id': deployment_id,
+                            'start': start,
+                            'end': end,
+                            'time': times_to_list(t, time_format),
+                            'lat': lat.tolist(),
+                            'lon': lon.tolist(),
+                            'points': len(t),
+                            'total_points': track[4]})
+    return jsonify(deployments=deployments,
+                   zoom=zoom,
+                   tolerance=zoom_tolerance(zoom),
+                   dt_units=TIME_UNITS[time_format])
 
 @api.route('/get_profiles/<string:reference_designator>/<string:stream_name>')
 def get_profiles(reference_designator, stream_name):
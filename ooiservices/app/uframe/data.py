@@ -12,19 +12,52 @@ from ooiservices.app.uframe import uframe as api
 
 import numpy as np
 import calendar
+import math
 import time
 from dateutil.parser import parse
-from datetime import datetime
+from datetime import datetime, timedelta
+from urllib import urlencode
 from ooiservices.app.main.errors import internal_server_error
-from ooiservices.app import cache
+from ooiservices.app import cache, redis_store
+from ooiservices.app.cache_metrics import memoize
+from ooiservices.app.tracing import span, traced_get, traced_json
+from ooiservices.app.models import Annotation
+from ooiservices.app.uframe.times import COSMO_CONSTANT
+from array import array
+import codecs
+import json
 import requests
 
 #ignore list for data fields
 FIELDS_IGNORE = ["stream_name","quality_flag"]
-COSMO_CONSTANT = 2208988800
 
+#resampling interval suffixes, in seconds
+INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+RESAMPLE_AGGREGATES = ['mean', 'min', 'max', 'median', 'count']
 
-def get_data(stream, instrument,field):
+#per sample quality flag, rejected samples are dropped or masked to null
+QC_FIELD = 'quality_flag'
+QC_MODES = ['drop', 'mask']
+
+#sorted set of request counts per <stream>/<ref>, used to warm caches
+STREAM_REQUESTS_KEY = 'ooiservices:stream_requests'
+
+#origin of uframe timestamps
+UFRAME_EPOCH = datetime(1900, 1, 1)
+
+
+def get_data(stream, instrument, field):
+    '''
+    get_data_columns with the series as JSON serializable lists
+    '''
+    data = get_data_columns(stream, instrument, field)
+    if 'error' not in data:
+        y = data['y']
+        data['x'] = data['x'].tolist()
+        data['y'] = nan_to_none(y) if y.dtype == np.float64 else y.tolist()
+    return data
+
+def get_data_columns(stream, instrument,field):
     #get data from uframe
     #-------------------
     # m@c: 02/01/2015
@@ -33,46 +66,33 @@ def get_data(stream, instrument,field):
     #
     #-------------------
     #TODO: create better error handler if uframe is not online/responding
-    data = []
+    record_stream_request(stream, instrument)
+    if 'interval' in request.args:
+        return get_resampled_data(stream, instrument, field)
+    if 'startdate' in request.args or 'enddate' in request.args:
+        return get_window_data(stream, instrument, field)
     try:
-        url = current_app.config['UFRAME_URL'] + '/sensor/m2m/inv/' + stream + '/' + instrument
-        data = requests.get(url)
-        data = data.json()        
+        qc_flags, qc_mode = parse_qc()
+    except ValueError, e:
+        return {'error': str(e)}
+
+    try:
+        url = get_uframe_data_url(stream, instrument)
+        pref_timestamp, x, columns = fetch_uframe_columns(url, list(set([field, QC_FIELD])) if qc_flags else [field])
+    except KeyError, e:
+        return {'error':'field %s not in stream' % e.args[0]}
     except Exception,e:
         return {'error':'uframe connection cannot be made:'+str(e)}
 
-    if len(data)==0:
-        return {'error':'non data available'}    
-
-    hasStartDate = False
-    hasEndDate = False
-
-    if 'startdate' in request.args:
-        st_date = datetime.datetime.strptime(request.args['startdate'], "%Y-%m-%d %H:%M:%S")
-        hasStartDate = True
-
-    if 'enddate' in request.args:
-        ed_date = datetime.datetime.strptime(request.args['enddate'], "%Y-%m-%d %H:%M:%S")
-        hasEndDate = True
-
-    #got normal data plot
-    #create the data fields,assumes the same data fields throughout
-    d_row = data[0]    
-    #data store
-    some_data = []
-
-    pref_timestamp = d_row["preferred_timestamp"]
-    #figure out the header rows
-    inital_fields = d_row.keys()
-    #move timestamp to the front
-    inital_fields.insert(0, inital_fields.pop(inital_fields.index(pref_timestamp)))
+    if pref_timestamp is None:
+        return {'error':'non data available'}
 
-    data_cols,data_field_list = _get_col_outline(data,pref_timestamp,inital_fields,field)
+    if qc_flags:
+        rejected = qc_rejected(columns[QC_FIELD], qc_flags)
+        x, columns = apply_qc(x, {field: columns[field]}, rejected, qc_mode)
+    y = columns[field]
 
-    x = [ d[pref_timestamp] for d in data ]
-    y = [ d[field] for d in data ]    
-
-    #genereate dict for the data thing
+    #genereate dict for the data thing, x and y stay arrays
     resp_data = {'x':x,
                  'y':y,
                  'data_length':len(x),
@@ -86,6 +106,464 @@ def get_data(stream, instrument,field):
     #return jsonify(**resp_data)
     return resp_data
 
+def record_stream_request(stream, ref):
+    '''
+    Counts a request for a stream, for the cache warmer. Never fails the
+    request it is counting.
+    '''
+    try:
+        redis_store.zincrby(name=STREAM_REQUESTS_KEY, value='/'.join([stream, ref]), amount=1)
+    except Exception, e:
+        current_app.logger.warning('stream request not recorded: %s' % e)
+
+def get_popular_streams(top_n):
+    '''
+    The top_n most requested (stream, ref) pairs
+    '''
+    members = redis_store.zrevrange(STREAM_REQUESTS_KEY, 0, top_n - 1)
+    return [tuple(m.split('/', 1)) for m in members]
+
+def get_window_data(stream, instrument, field):
+    '''
+    get_data_columns for a request with a startdate and/or enddate argument,
+    read through the local chunk store
+    '''
+    from ooiservices.app.uframe.chunk_store import get_chunk_store
+    try:
+        start, end = parse_window()
+        qc_flags, qc_mode = parse_qc()
+    except ValueError, e:
+        return {'error': str(e)}
+    start = start or 0
+    end = end or float('inf')
+
+    fields = list(set([field, QC_FIELD])) if qc_flags else [field]
+    store = get_chunk_store()
+    try:
+        x, columns = store.read(stream, instrument, fields, start, end,
+                                lambda start, end: fetch_uframe_data(get_uframe_data_url(stream, instrument, start, end)))
+    except KeyError, e:
+        return {'error': 'field %s not in stream' % e.args[0]}
+    except Exception, e:
+        return {'error': 'uframe connection cannot be made:' + str(e)}
+    if len(x) == 0:
+        return {'error': 'non data available'}
+
+    if qc_flags:
+        rejected = qc_rejected(columns[QC_FIELD], qc_flags)
+        x, columns = apply_qc(x, {field: columns[field]}, rejected, qc_mode)
+    return {'x': x,
+            'y': columns[field],
+            'data_length': len(x),
+            'x_field': store.timestamp_field(stream, instrument),
+            'y_field': field,
+            'dt_units': 'seconds since 1900-01-01 00:00:00'}
+
+def parse_qc():
+    '''
+    The quality flags rejected by the qc request argument (comma separated)
+    and the qc_mode, drop or mask. No flags without a qc argument.
+    '''
+    flags = [f for f in request.args.get('qc', '').split(',') if f]
+    qc_mode = request.args.get('qc_mode', 'drop')
+    if qc_mode not in QC_MODES:
+        raise ValueError('qc_mode must be one of %s' % ', '.join(QC_MODES))
+    return flags, qc_mode
+
+def qc_rejected(flag_values, flags):
+    '''
+    Boolean mask of the samples whose quality flag is one of flags. Numeric
+    flags are compared as numbers, anything else as text.
+    '''
+    if flag_values.dtype == np.float64:
+        try:
+            return np.in1d(flag_values, [float(f) for f in flags])
+        except ValueError:
+            return np.zeros(len(flag_values), dtype=bool)
+    return np.in1d(flag_values.astype(unicode), [unicode(f) for f in flags])
+
+def apply_qc(t, columns, rejected, qc_mode):
+    '''
+    Drops the rejected samples, or masks them to NaN (None in non numeric
+    columns) keeping the time base intact
+    '''
+    if not rejected.any():
+        return t, columns
+    if qc_mode == 'drop':
+        keep = ~rejected
+        return t[keep], dict((k, v[keep]) for k, v in columns.iteritems())
+    masked = {}
+    for field, values in columns.iteritems():
+        #copy, the columns may be read-only memory maps
+        values = values.copy() if values.dtype == np.float64 else values.astype(object)
+        values[rejected] = np.nan if values.dtype == np.float64 else None
+        masked[field] = values
+    return t, masked
+
+def parse_date(value):
+    '''
+    Converts a "%Y-%m-%d %H:%M:%S" date into seconds since 1900
+    '''
+    if value is None:
+        return None
+    return calendar.timegm(datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timetuple()) + COSMO_CONSTANT
+
+def parse_window():
+    '''
+    The startdate and enddate request arguments in seconds since 1900, None
+    when not given
+    '''
+    try:
+        return parse_date(request.args.get('startdate')), parse_date(request.args.get('enddate'))
+    except ValueError:
+        raise ValueError('dates must be formatted as %Y-%m-%d %H:%M:%S')
+
+def get_uframe_data_url(stream, instrument, start=None, end=None, data_format=None):
+    '''
+    Builds the uframe url for the data of a stream on an instrument,
+    optionally limited to the times start to end (seconds since 1900) and
+    in a data_format other than JSON (e.g. application/netcdf3)
+    '''
+    url = current_app.config['UFRAME_URL'] + '/sensor/m2m/inv/' + stream + '/' + instrument
+    query = []
+    if start:
+        query.append(('beginDT', uframe_time(start)))
+    if end is not None and end != float('inf'):
+        query.append(('endDT', uframe_time(math.ceil(end))))
+    if data_format:
+        query.append(('format', data_format))
+    if query:
+        url += '?' + urlencode(query)
+    return url
+
+def uframe_time(t):
+    '''
+    uframe date parameter of a time in seconds since 1900
+    '''
+    return (UFRAME_EPOCH + timedelta(seconds=int(t))).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+def fetch_uframe_data(url):
+    '''
+    Fetches the stream records from uframe. Does not touch the application
+    context, so it is safe to call from worker threads.
+    '''
+    response = traced_get(url)
+    response.raise_for_status()
+    return traced_json(response)
+
+def iter_uframe_records(response, chunk_size=64 * 1024):
+    '''
+    Iterates the records of a uframe response (a JSON array of objects) as
+    the body arrives, without materializing the whole document.
+    '''
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = response.iter_content(chunk_size)
+    buf = u''
+    pos = 0
+    opened = False
+    while True:
+        #skip the array punctuation between records
+        while pos < len(buf) and buf[pos] in u' \t\r\n,[':
+            if buf[pos] == u'[':
+                opened = True
+            pos += 1
+        if pos < len(buf) and buf[pos] == u']' and opened:
+            return
+        if pos < len(buf):
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                record = None
+            if record is not None:
+                pos = end
+                yield record
+                continue
+        chunk = next(chunks, None)
+        if chunk is None:
+            if buf[pos:].strip():
+                raise ValueError('truncated uframe response')
+            return
+        buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+
+def fetch_uframe_columns(url, fields, start=None, end=None):
+    '''
+    Streams a uframe response and keeps only the preferred timestamp and the
+    requested fields, as columns. Records are expected in time order, so
+    parsing stops at the first record past end. Returns the timestamp field
+    (None when there is no data), the time array and a dict of field arrays.
+    Does not touch the application context.
+    '''
+    response = traced_get(url, stream=True)
+    response.raise_for_status()
+    pref_timestamp = None
+    t = array('d')
+    columns = dict((f, array('d')) for f in fields)
+    try:
+        with span('decode', url=url, fields=','.join(fields)) as decode_span:
+            for record in iter_uframe_records(response):
+                if pref_timestamp is None:
+                    if 'preferred_timestamp' not in record:
+                        raise ValueError('unexpected uframe response')
+                    pref_timestamp = record['preferred_timestamp']
+                    for field in fields:
+                        if field not in record:
+                            raise KeyError(field)
+                ts = record[pref_timestamp]
+                if end is not None and ts > end:
+                    break
+                if start is not None and ts < start:
+                    continue
+                t.append(ts)
+                for field in fields:
+                    value = record.get(field)
+                    column = columns[field]
+                    if isinstance(column, array):
+                        try:
+                            column.append(float('nan') if value is None else value)
+                            continue
+                        except TypeError:
+                            #not numeric, keep the values as they are
+                            column = columns[field] = list(column)
+                    column.append(value)
+            decode_span['records'] = len(t)
+    finally:
+        response.close()
+
+    t = np.frombuffer(t, dtype=np.float64) if len(t) else np.array([], dtype=np.float64)
+    for field, column in columns.iteritems():
+        if isinstance(column, array):
+            columns[field] = np.frombuffer(column, dtype=np.float64) if len(column) else np.array([])
+        else:
+            columns[field] = np.array(column, dtype=object)
+    t, columns = _sort_columns(t, columns)
+    return pref_timestamp, t, columns
+
+def to_columns(data, fields):
+    '''
+    Converts a list of uframe records into columns sorted by the preferred
+    timestamp. Returns the timestamp field, the time array and a dict of
+    field arrays.
+    '''
+    pref_timestamp = data[0]['preferred_timestamp']
+    t = np.array([d[pref_timestamp] for d in data], dtype=np.float64)
+    columns = dict((field, to_column(data, field)) for field in fields)
+    t, columns = _sort_columns(t, columns)
+    return pref_timestamp, t, columns
+
+def to_column(data, field):
+    '''
+    The values of field in uframe records as a float array, or an object
+    array when they are not numeric. Keeps the record order.
+    '''
+    values = [d.get(field) for d in data]
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array(values, dtype=object)
+
+def _sort_columns(t, columns):
+    '''
+    Sorts the columns by time, if they are not sorted already
+    '''
+    if len(t) > 1 and np.any(np.diff(t) < 0):
+        order = np.argsort(t, kind='mergesort')
+        t = t[order]
+        columns = dict((k, v[order]) for k, v in columns.iteritems())
+    return t, columns
+
+def align_nearest(base_t, t, values, tolerance):
+    '''
+    Aligns values sampled at the sorted times t onto base_t, taking the
+    nearest sample within tolerance seconds. Unmatched points are NaN.
+    '''
+    aligned = np.empty(len(base_t), dtype=np.float64)
+    aligned.fill(np.nan)
+    if len(t) == 0 or len(base_t) == 0:
+        return aligned
+
+    idx = np.clip(np.searchsorted(t, base_t), 1, max(len(t) - 1, 1))
+    if len(t) > 1:
+        # step back to the left neighbour where it is the closer one
+        idx -= (base_t - t[idx - 1]) < (t[idx] - base_t)
+    else:
+        idx[:] = 0
+    matched = np.abs(t[idx] - base_t) <= tolerance
+    aligned[matched] = values[idx[matched]]
+    return aligned
+
+def align_interp(base_t, t, values):
+    '''
+    Linearly interpolates values sampled at the sorted times t onto base_t.
+    Points outside of the sampled range are NaN.
+    '''
+    valid = ~np.isnan(values)
+    if not np.any(valid):
+        aligned = np.empty(len(base_t), dtype=np.float64)
+        aligned.fill(np.nan)
+        return aligned
+    return np.interp(base_t, t[valid], values[valid], left=np.nan, right=np.nan)
+
+def nan_to_none(values):
+    '''
+    Converts a float array into a list with NaN replaced by None, so that it
+    serializes to valid JSON.
+    '''
+    out = values.astype(object)
+    out[np.isnan(values)] = None
+    return out.tolist()
+
+def density_grid(x, y, bins):
+    '''
+    Sample counts of the x, y pairs on a bins by bins grid spanning their
+    range, pairs with a NaN left out. Returns the x edges, the y edges and
+    the (x, y) counts.
+    '''
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    counts, x_edges, y_edges = np.histogram2d(x[valid], y[valid], bins=bins)
+    return x_edges, y_edges, counts
+
+def decimate(x, y, columns):
+    '''
+    Reduces a time sorted series to the minimum and maximum sample of each
+    of columns equal time bins, in time order. Drawn one pixel column per
+    bin this keeps the envelope of the full series. Bins without a valid
+    sample keep a NaN, so gaps stay visible.
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) <= 2 * columns or x[-1] <= x[0]:
+        return x, y
+    bins = ((x - x[0]) * (columns / (x[-1] - x[0]))).astype(np.int64)
+    np.minimum(bins, columns - 1, out=bins)
+    starts = np.flatnonzero(np.concatenate(([True], bins[1:] != bins[:-1])))
+    #within each bin, in value order with NaNs last
+    order = np.lexsort((y, bins))
+    valid = np.add.reduceat((~np.isnan(y)).astype(np.int64), starts)
+    lo = order[starts]
+    hi = order[starts + np.maximum(valid - 1, 0)]
+    keep = np.unique(np.concatenate((lo, hi)))
+    return x[keep], y[keep]
+
+def parse_interval(interval):
+    '''
+    Parses an interval such as 30m, 1h or 1d into seconds
+    '''
+    try:
+        seconds = int(interval[:-1]) * INTERVAL_UNITS[interval[-1]]
+    except (KeyError, ValueError, IndexError):
+        raise ValueError('interval must be a number followed by one of s, m, h or d')
+    if seconds <= 0:
+        raise ValueError('interval must be positive')
+    return seconds
+
+def resample(t, columns, interval, agg):
+    '''
+    Resamples the sorted times t into regular bins of interval seconds,
+    reducing every numeric column with agg. Returns the bin start times and
+    the reduced columns.
+    '''
+    if agg not in RESAMPLE_AGGREGATES:
+        raise ValueError('agg must be one of %s' % ', '.join(RESAMPLE_AGGREGATES))
+    if len(t) == 0:
+        return t, dict((k, t) for k, v in columns.iteritems() if v.dtype == np.float64)
+
+    bins = np.floor_divide(t, interval).astype(np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], bins[1:] != bins[:-1])))
+    bin_t = (bins[starts] * interval).astype(np.float64)
+
+    resampled = {}
+    for field, values in columns.iteritems():
+        if values.dtype != np.float64:
+            continue
+        valid = ~np.isnan(values)
+        counts = np.add.reduceat(valid.astype(np.int64), starts)
+        if agg == 'count':
+            reduced = counts.astype(np.float64)
+        elif agg == 'mean':
+            sums = np.add.reduceat(np.where(valid, values, 0.), starts)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                reduced = sums / counts
+        elif agg == 'min':
+            reduced = np.fmin.reduceat(values, starts)
+        elif agg == 'max':
+            reduced = np.fmax.reduceat(values, starts)
+        else:
+            #sort within each bin, NaNs sort to the end of their bin
+            ordered = values[np.lexsort((values, bins))]
+            lo = starts + np.maximum(counts - 1, 0) // 2
+            hi = starts + counts // 2
+            reduced = (ordered[lo] + ordered[hi]) / 2.
+            reduced[counts == 0] = np.nan
+        resampled[field] = reduced
+    return bin_t, resampled
+
+@memoize('resampled_columns', timeout=3600)
+def get_resampled_columns(stream, instrument, interval, agg, qc='', start=None, end=None):
+    '''
+    Fetches a stream, limited to start to end (seconds since 1900) when
+    given, and resamples all of its numeric fields, cached per stream,
+    instrument, interval, aggregate, rejected quality flags (comma
+    separated) and window. Rejected samples are left out of the aggregates.
+    Memoized on the positional arguments, so pass them all positionally.
+    '''
+    data = fetch_uframe_data(get_uframe_data_url(stream, instrument, start, end))
+    if len(data) == 0:
+        return None, np.array([]), {}
+    fields = [f for f in data[0].keys() if f not in FIELDS_IGNORE and f != 'preferred_timestamp']
+    if qc:
+        fields.append(QC_FIELD)
+    pref_timestamp, t, columns = to_columns(data, fields)
+    columns.pop(pref_timestamp, None)
+    if start is not None or end is not None:
+        #uframe works to the second, trim to the window
+        outside = np.zeros(len(t), dtype=bool)
+        if start is not None:
+            outside |= t < start
+        if end is not None:
+            outside |= t > end
+        t, columns = apply_qc(t, columns, outside, 'drop')
+    if qc:
+        rejected = qc_rejected(columns.pop(QC_FIELD), qc.split(','))
+        t, columns = apply_qc(t, columns, rejected, 'mask')
+    bin_t, resampled = resample(t, columns, interval, agg)
+    return pref_timestamp, bin_t, resampled
+
+def get_resampled_data(stream, instrument, field):
+    '''
+    get_data_columns for a request with an interval (and optional agg)
+    argument
+    '''
+    agg = request.args.get('agg', 'mean')
+    if agg not in RESAMPLE_AGGREGATES:
+        return {'error': 'agg must be one of %s' % ', '.join(RESAMPLE_AGGREGATES)}
+    try:
+        interval = parse_interval(request.args['interval'])
+        qc_flags, qc_mode = parse_qc()
+        start, end = parse_window()
+    except ValueError, e:
+        return {'error': str(e)}
+    try:
+        pref_timestamp, x, columns = get_resampled_columns(stream, instrument, interval, agg, ','.join(qc_flags),
+                                                           start, end)
+    except Exception, e:
+        return {'error': 'uframe connection cannot be made:' + str(e)}
+
+    if pref_timestamp is None:
+        return {'error': 'non data available'}
+    if field not in columns:
+        return {'error': 'field %s cannot be resampled' % field}
+
+    return {'x': x,
+            'y': columns[field],
+            'data_length': len(x),
+            'x_field': pref_timestamp,
+            'y_field': field,
+            'interval': interval,
+            'agg': agg,
+            'dt_units': 'seconds since 1900-01-01 00:00:00'}
+
 def gen_data(start_date, end_date, sampling_rate, mean, std_dev):
     '''
     Returns a dictionary that contains the x coordinate time and the y
@@ -107,7 +585,6 @@ def gen_data(start_date, end_date, sampling_rate, mean, std_dev):
 
     return {'size' : x.shape[0], 'start_time':iso0, 'end_time':iso1, 'cols':['x','y'], 'rows':row_order_xy.tolist()}
 
-@cache.memoize(timeout=3600)
 def plot_time_series(fig, ax, x, y, fill=False, title='', ylabel='',
                          title_font={}, axis_font={}, **kwargs):
 
@@ -210,22 +687,50 @@ def _get_col_outline(data,pref_timestamp,inital_fields,requested_field):
 
     return data_fields,data_field_list
 
-def _get_annotation_content(annotation_field, pref_timestamp, annotations_list, d, data_field):
+def annotation_times(annotations, pref_timestamp, data_field):
     '''
-    creates the annotation content for a given field
+    The annotations that apply to a field, sorted by time, and their times in
+    seconds since 1900. pos_x is given as "%Y-%m-%dT%H:%M:%S" (UTC) or
+    already in seconds since 1900; annotations without a usable pos_x are
+    left out. Each date is parsed once.
     '''
-    #right now x and y are timeseries data
-    for an in annotations_list:
-        if an['field_x'] == pref_timestamp or an['field_y'] == data_field:
-            # and and y value
-            an_date_time = datetime.datetime.strptime(an['pos_x'], "%Y-%m-%dT%H:%M:%S")
-            an_int_date_time = int(an_date_time.strftime("%s"))
-
-            if int(d['fixed_dt']) == an_int_date_time:
-                if annotation_field == "annotation":
-                    return {"v":an["title"]}
-                elif annotation_field == "annotationText":
-                    return {"v":an['comment']}
+    matching = []
+    times = []
+    for an in annotations:
+        if an['field_x'] != pref_timestamp and an['field_y'] != data_field:
+            continue
+        pos_x = an['pos_x']
+        try:
+            if isinstance(pos_x, basestring):
+                pos_x = calendar.timegm(datetime.strptime(pos_x, "%Y-%m-%dT%H:%M:%S").timetuple()) + COSMO_CONSTANT
+            times.append(float(pos_x))
+        except (TypeError, ValueError):
+            continue
+        matching.append(an)
+    order = np.argsort(times, kind='mergesort')
+    return [matching[i] for i in order], np.array(times, dtype=np.float64)[order]
 
-    #return nothing
-    return {"v":None,"f":None}
+def match_annotations(x, an_times):
+    '''
+    For each sample time in x, the index of the annotation placed on the same
+    whole second, or -1. an_times must be sorted.
+    '''
+    x = np.floor(np.asarray(x, dtype=np.float64))
+    index = np.empty(len(x), dtype=np.int64)
+    index.fill(-1)
+    if len(an_times) == 0 or len(x) == 0:
+        return index
+    pos = np.searchsorted(an_times, x)
+    found = pos < len(an_times)
+    found[found] = an_times[pos[found]] == x[found]
+    index[found] = pos[found]
+    return index
+
+def get_annotation_overlay(instrument, stream, pref_timestamp, data_field, x):
+    '''
+    The annotations of a stream field and, per sample of x, the index of its
+    annotation in that list (-1 for none)
+    '''
+    annotations, an_times = annotation_times(_get_annotation(instrument, stream), pref_timestamp, data_field)
+    return {'annotations': annotations,
+            'annotation_index': match_annotations(x, an_times).tolist()}
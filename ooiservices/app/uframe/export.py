@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+'''
+uframe export job endpoints
+
+Large exports run on the celery worker; these endpoints only submit jobs,
+report their status and hand back the finished file.
+'''
+
+from flask import jsonify, request, current_app, url_for, send_file, Response, stream_with_context
+from ooiservices.app import celery
+from ooiservices.app.uframe import uframe as api
+from ooiservices.app.main.authentication import auth
+from ooiservices.app.main.errors import bad_request, service_unavailable
+from ooiservices.app.uframe.data import parse_date, get_uframe_data_url, iter_uframe_records
+from ooiservices.app.tracing import traced_get
+from ooiservices.app.uframe.tasks import export_stream, EXPORT_EXTENSIONS
+from ooiservices.app.uframe.controller import get_uframe_streams, get_uframe_stream
+from itertools import islice
+import threading
+import Queue
+import zipfile
+import struct
+import zlib
+import time
+import csv
+import io
+import json
+import os
+
+#members of a bulk export fetched at the same time
+BULK_EXPORT_THREADS = 4
+#size of the csv pieces a member is written in
+EXPORT_PIECE_SIZE = 64 * 1024
+#data descriptor after the member data, utf-8 file names
+ZIP_FLAGS = 0x08 | 0x800
+ZIP_MAX = 0xffffffff
+
+
+@api.route('/export', methods=['POST'])
+@auth.login_required
+def submit_export():
+    '''
+    Submits an export job.
+    usage: POST {"stream": ..., "ref": ..., "format": "csv"|"netcdf",
+                 "startdate": "%Y-%m-%d %H:%M:%S", "enddate": ...}
+    '''
+    try:
+        data = json.loads(request.data)
+    except ValueError:
+        return bad_request('Invalid request')
+    for field in ['stream', 'ref']:
+        if field not in data:
+            return bad_request('%s not defined' % field)
+    export_format = data.get('format', 'csv')
+    if export_format not in EXPORT_EXTENSIONS:
+        return bad_request('format must be one of %s' % ', '.join(EXPORT_EXTENSIONS))
+    try:
+        start = parse_date(data.get('startdate'))
+        end = parse_date(data.get('enddate'))
+    except ValueError:
+        return bad_request('dates must be formatted as %Y-%m-%d %H:%M:%S')
+
+    job = export_stream.delay(data['stream'], data['ref'], export_format, start, end)
+    response = jsonify(job_id=job.id, status_url=url_for('uframe.get_export', job_id=job.id))
+    response.status_code = 202
+    return response
+
+@api.route('/export/<string:job_id>', methods=['GET'])
+@auth.login_required
+def get_export(job_id):
+    '''
+    Status and progress of an export job
+    '''
+    job = celery.AsyncResult(job_id)
+    status = {'job_id': job_id, 'state': job.state, 'progress': 0.0}
+    if job.state == 'PROGRESS':
+        status['progress'] = job.info.get('progress', 0.0)
+    elif job.state == 'SUCCESS':
+        status['progress'] = 1.0
+        status['size'] = job.info['size']
+        status['download_url'] = url_for('uframe.download_export', job_id=job_id)
+    elif job.state == 'FAILURE':
+        status['error'] = str(job.info)
+    return jsonify(status)
+
+@api.route('/export/<string:job_id>/download', methods=['GET'])
+@auth.login_required
+def download_export(job_id):
+    '''
+    Downloads the file of a finished export job
+    '''
+    job = celery.AsyncResult(job_id)
+    if job.state != 'SUCCESS':
+        return bad_request('export %s is not finished' % job_id)
+    if not os.path.exists(job.info['path']):
+        return jsonify(error='export %s has expired' % job_id), 410
+    return send_file(job.info['path'], as_attachment=True,
+                     attachment_filename=job.info['filename'])
+
+class _ZipStream(object):
+    '''
+    Writes a zip archive as a sequence of byte strings. A member is deflated
+    piece by piece as its content arrives: the local header leaves the crc
+    and sizes empty and they follow the data in a data descriptor (general
+    purpose flag bit 3), so a member is never held whole. Members must stay
+    under 4 GiB; the archive itself switches to zip64 records when its
+    directory needs them.
+    '''
+    def __init__(self):
+        self.offset = 0
+        self.entries = []
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def iter_member(self, filename, pieces):
+        '''
+        Yields the bytes of a member whose content is the iterable pieces
+        '''
+        if isinstance(filename, unicode):
+            filename = filename.encode('utf-8')
+        offset = self.offset
+        now = time.localtime()
+        dos_time = now.tm_hour << 11 | now.tm_min << 5 | now.tm_sec // 2
+        dos_date = (now.tm_year - 1980) << 9 | now.tm_mon << 5 | now.tm_mday
+        yield self._emit(struct.pack('<4s5H3L2H', 'PK\x03\x04', 20, ZIP_FLAGS, zipfile.ZIP_DEFLATED,
+                                     dos_time, dos_date, 0, 0, 0, len(filename), 0) + filename)
+        deflate = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        crc = size = 0
+        start = self.offset
+        for piece in pieces:
+            crc = zlib.crc32(piece, crc)
+            size += len(piece)
+            data = deflate.compress(piece)
+            if data:
+                yield self._emit(data)
+        yield self._emit(deflate.flush())
+        crc &= 0xffffffff
+        compressed = self.offset - start
+        if size > ZIP_MAX or compressed > ZIP_MAX:
+            raise zipfile.LargeZipFile('%s is over 4 GiB' % filename)
+        yield self._emit(struct.pack('<4s3L', 'PK\x07\x08', crc, compressed, size))
+        self.entries.append((filename, offset, crc, compressed, size, dos_time, dos_date))
+
+    def close(self):
+        '''
+        The central directory and end records
+        '''
+        directory = []
+        for filename, offset, crc, compressed, size, dos_time, dos_date in self.entries:
+            extra = ''
+            version = 20
+            if offset > ZIP_MAX:
+                extra = struct.pack('<2HQ', 1, 8, offset)
+                offset = 0xffffffff
+                version = 45
+            directory.append(struct.pack('<4s6H3L5H2L', 'PK\x01\x02', 3 << 8 | version, version, ZIP_FLAGS,
+                                         zipfile.ZIP_DEFLATED, dos_time, dos_date, crc, compressed, size,
+                                         len(filename), len(extra), 0, 0, 0, 0600 << 16, offset) +
+                             filename + extra)
+        directory = ''.join(directory)
+        start = self.offset
+        end = []
+        count = len(self.entries)
+        if count > 0xffff or start > ZIP_MAX or len(directory) > ZIP_MAX:
+            zip64_end = start + len(directory)
+            end.append(struct.pack('<4sQ2H2L4Q', 'PK\x06\x06', 44, 3 << 8 | 45, 45, 0, 0,
+                                   count, count, len(directory), start))
+            end.append(struct.pack('<4sLQL', 'PK\x06\x07', 0, zip64_end, 1))
+            count = min(count, 0xffff)
+            start = min(start, 0xffffffff)
+        end.append(struct.pack('<4s4H2LH', 'PK\x05\x06', 0, 0, count, count,
+                               min(len(directory), 0xffffffff), start, 0))
+        return self._emit(directory + ''.join(end))
+
+def _put(pieces, item, cancelled):
+    '''
+    Puts item in the bounded queue pieces, giving up once the archive is
+    abandoned
+    '''
+    while not cancelled.is_set():
+        try:
+            pieces.put(item, timeout=1)
+            return True
+        except Queue.Full:
+            pass
+    return False
+
+def _fetch_csv_member(url, pieces, cancelled, ready):
+    '''
+    Streams one stream from uframe as csv, in a worker thread. Puts
+    ('data', bytes) items of about EXPORT_PIECE_SIZE bytes in the queue
+    pieces, then ('done', None) or ('error', message); ready() is called
+    once the first item is in. The columns are the keys of the first
+    record; keys that only later records have are left out.
+    '''
+    announced = []
+
+    def put(item):
+        if not _put(pieces, item, cancelled):
+            return False
+        if not announced:
+            announced.append(True)
+            ready()
+        return True
+
+    try:
+        response = traced_get(url, stream=True)
+        response.raise_for_status()
+        try:
+            output = io.BytesIO()
+            writer = None
+            for record in iter_uframe_records(response):
+                if writer is None:
+                    writer = csv.DictWriter(output, fieldnames=record.keys(), extrasaction='ignore')
+                    writer.writeheader()
+                writer.writerow(record)
+                if output.tell() >= EXPORT_PIECE_SIZE:
+                    if not put(('data', output.getvalue())):
+                        return
+                    output.seek(0)
+                    output.truncate()
+            if output.tell() and not put(('data', output.getvalue())):
+                return
+        finally:
+            response.close()
+        put(('done', None))
+    except Exception, e:
+        put(('error', 'export failed: %s' % e))
+
+def _iter_members(members):
+    '''
+    Yields (filename, pieces) per member, pieces iterating over its content.
+    BULK_EXPORT_THREADS members are fetched at the same time, each holding
+    at most one piece until it is written. Members are written in the order
+    their first piece arrives, so a slow stream does not hold up the ones
+    behind it; once started, a member is written to its end. A member that
+    fails is replaced by, or followed by, a <name>.error.txt member.
+    '''
+    cancelled = threading.Event()
+    pending = enumerate(members)
+    running = {}
+    #indices of the running members whose first piece is in
+    ready = Queue.Queue()
+
+    def start(member):
+        i, (name, url) = member
+        pieces = Queue.Queue(maxsize=1)
+        thread = threading.Thread(target=_fetch_csv_member,
+                                  args=(url, pieces, cancelled, lambda: ready.put(i)))
+        thread.daemon = True
+        thread.start()
+        running[i] = (name, pieces)
+
+    try:
+        for member in islice(pending, BULK_EXPORT_THREADS):
+            start(member)
+        while running:
+            name, pieces = running.pop(ready.get())
+            for member in islice(pending, 1):
+                start(member)
+            kind, value = pieces.get()
+            if kind == 'error':
+                yield name + '.error.txt', [value]
+                continue
+            errors = []
+
+            def content(kind=kind, value=value, pieces=pieces):
+                while kind == 'data':
+                    yield value
+                    kind, value = pieces.get()
+                if kind == 'error':
+                    errors.append(value)
+
+            yield name + '.csv', content()
+            if errors:
+                yield name + '.error.txt', errors
+    finally:
+        cancelled.set()
+
+@api.route('/bulk_export', methods=['GET'])
+@auth.login_required
+def get_bulk_export():
+    '''
+    Streams a zip archive with a csv per stream. Served by the stream
+    process, like the tails.
+    usage: /uframe/bulk_export?platform=<reference designator>
+           /uframe/bulk_export?streams=<stream>/<ref>&streams=...
+    '''
+    if not current_app.config['SERVE_STREAMS']:
+        return service_unavailable('bulk exports are served by the stream process')
+    pairs = []
+    if 'platform' in request.args:
+        platform = request.args['platform']
+        response = get_uframe_streams()
+        if response.status_code != 200:
+            return response
+        for stream in response.json():
+            response = get_uframe_stream(stream)
+            if response.status_code != 200:
+                return response
+            pairs.extend((stream, ref) for ref in response.json() if ref.startswith(platform))
+    else:
+        pairs = [s.split('/') for s in request.args.getlist('streams')]
+        if any(len(p) != 2 for p in pairs):
+            return bad_request('streams must be given as stream/ref')
+    if not pairs:
+        return bad_request('no streams to export')
+
+    members = [('-'.join([stream, ref]), get_uframe_data_url(stream, ref)) for stream, ref in pairs]
+
+    def generate():
+        archive = _ZipStream()
+        for filename, pieces in _iter_members(members):
+            for data in archive.iter_member(filename, pieces):
+                yield data
+        yield archive.close()
+
+    filename = request.args.get('platform', 'bulk_export')
+    return Response(stream_with_context(generate()), mimetype='application/zip',
+                    headers={'Content-Disposition': 'attachment; filename=%s.zip' % filename})
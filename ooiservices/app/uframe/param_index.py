@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+'''
+Parameter search
+
+An inverted index from parameter name (the variables of each stream in the
+uframe inventory, plus the names and standard names of the StreamParameters
+linked to the stream) to the <stream>/<reference designator> pairs carrying
+it. Kept in redis: the terms in a lexicographically ordered sorted set for
+prefix lookups, one set of pairs per term, and per pair the variables and
+terms it was indexed with so that refreshes only touch what changed.
+'''
+
+from flask import jsonify, request, current_app
+from ooiservices.app import db, redis_store
+from ooiservices.app.uframe import uframe as api
+from ooiservices.app.main.authentication import auth
+from ooiservices.app.main.errors import bad_request
+from ooiservices.app.models import Stream, StreamParameter, StreamParameterLink
+from ooiservices.app.tracing import traced_json
+from ooiservices.app.uframe.data import FIELDS_IGNORE
+from ooiservices.app.uframe.controller import get_uframe_streams, get_uframe_stream, get_uframe_stream_contents
+import json
+
+PARAM_TERMS_KEY = 'ooiservices:param_index:terms'
+PARAM_STREAMS_KEY = 'ooiservices:param_index:streams:%s'
+PARAM_INDEXED_KEY = 'ooiservices:param_index:indexed'
+#most terms a search returns
+MAX_SEARCH_LIMIT = 500
+
+
+def linked_parameter_names():
+    '''
+    stream name -> names and standard names of its linked StreamParameters
+    '''
+    rows = db.session.query(Stream.stream_name, StreamParameter.stream_parameter_name,
+                            StreamParameter.standard_name).\
+        join(StreamParameterLink, StreamParameterLink.stream_id == Stream.id).\
+        join(StreamParameter, StreamParameterLink.parameter_id == StreamParameter.id).all()
+    names = {}
+    for stream_name, parameter_name, standard_name in rows:
+        names.setdefault(stream_name, set()).update(n for n in (parameter_name, standard_name) if n)
+    return names
+
+def index_terms(variables, linked):
+    '''
+    The lower case terms a stream is found under
+    '''
+    terms = set(v.lower() for v in variables if v not in FIELDS_IGNORE and v != 'preferred_timestamp')
+    terms.update(n.lower() for n in linked)
+    return terms
+
+def _inventory():
+    '''
+    Every (stream, ref) pair of the uframe inventory
+    '''
+    response = get_uframe_streams()
+    if response.status_code != 200:
+        raise IOError('uframe inventory returned %s' % response.status_code)
+    for stream in traced_json(response):
+        response = get_uframe_stream(stream)
+        if response.status_code != 200:
+            raise IOError('uframe inventory of %s returned %s' % (stream, response.status_code))
+        for ref in traced_json(response):
+            yield stream, ref
+
+def _variables(stream, ref):
+    response = get_uframe_stream_contents(stream, ref)
+    if response.status_code != 200:
+        raise IOError('uframe contents of %s/%s returned %s' % (stream, ref, response.status_code))
+    data = traced_json(response)
+    return data[0].keys() if data else []
+
+def refresh_index():
+    '''
+    Brings the index up to date with the inventory. Only pairs new to the
+    inventory have their contents fetched; the terms of known pairs are
+    recomputed from their stored variables, which picks up changed
+    StreamParameter links. Returns the counts of added, updated and removed
+    pairs.
+    '''
+    indexed = dict((k, json.loads(v)) for k, v in redis_store.hgetall(PARAM_INDEXED_KEY).iteritems())
+    linked = linked_parameter_names()
+    added = updated = 0
+    seen = set()
+    for stream, ref in _inventory():
+        key = '/'.join([stream, ref])
+        seen.add(key)
+        entry = indexed.get(key)
+        if entry is None:
+            try:
+                variables = _variables(stream, ref)
+            except Exception, e:
+                current_app.logger.warning('parameter index skipped %s: %s' % (key, e))
+                continue
+            old_terms = set()
+            added += 1
+        else:
+            variables = entry['variables']
+            old_terms = set(entry['terms'])
+        terms = index_terms(variables, linked.get(stream, ()))
+        if entry is not None and terms == old_terms:
+            continue
+        if entry is not None:
+            updated += 1
+        _update_postings(key, old_terms, terms)
+        redis_store.hset(PARAM_INDEXED_KEY, key, json.dumps({'variables': variables, 'terms': sorted(terms)}))
+
+    removed = [k for k in indexed if k not in seen]
+    for key in removed:
+        _update_postings(key, set(indexed[key]['terms']), set())
+        redis_store.hdel(PARAM_INDEXED_KEY, key)
+    return added, updated, len(removed)
+
+def _update_postings(key, old_terms, terms):
+    pipe = redis_store.pipeline()
+    for term in terms - old_terms:
+        pipe.sadd(PARAM_STREAMS_KEY % term, key)
+        #ZADD key score member, the same on redis-py 2.x and later
+        pipe.execute_command('ZADD', PARAM_TERMS_KEY, 0, term)
+    for term in old_terms - terms:
+        pipe.srem(PARAM_STREAMS_KEY % term, key)
+    pipe.execute()
+    for term in old_terms - terms:
+        if not redis_store.exists(PARAM_STREAMS_KEY % term):
+            redis_store.zrem(PARAM_TERMS_KEY, term)
+
+def search_parameters(prefix, limit):
+    '''
+    Up to limit terms starting with prefix, in order, with their sorted
+    <stream>/<ref> pairs. limit is clamped to 1..MAX_SEARCH_LIMIT.
+    '''
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    prefix = prefix.lower().encode('utf-8')
+    terms = redis_store.zrangebylex(PARAM_TERMS_KEY, '[' + prefix, '[' + prefix + '\xff', start=0, num=limit)
+    pipe = redis_store.pipeline()
+    for term in terms:
+        pipe.smembers(PARAM_STREAMS_KEY % term)
+    return [(term, sorted(pairs)) for term, pairs in zip(terms, pipe.execute())]
+
+@api.route('/parameters/search', methods=['GET'])
+@auth.login_required
+def get_parameter_search():
+    '''
+    Streams carrying the parameters that start with q.
+    usage: /uframe/parameters/search?q=<prefix>&limit=<n, 1 to 500>
+    '''
+    prefix = request.args.get('q', '')
+    if not prefix:
+        return bad_request('q is required')
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return bad_request('limit must be an integer')
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    parameters = []
+    for term, pairs in search_parameters(prefix, limit):
+        streams = [dict(zip(['stream_name', 'reference_designator'], p.split('/', 1))) for p in pairs]
+        parameters.append({'name': term, 'streams': streams})
+    return jsonify(parameters=parameters)
@@ -3,21 +3,30 @@
 ooiservices/app/main/plotting.py
 
 Support for generating svg plots
+
+Figures are built on the object oriented matplotlib API (Figure and the Agg
+canvas) and never touch pyplot's global current figure or the global
+rcParams, so every render owns its figure and renders can run in parallel
+threads. The prettyplotlib look is applied explicitly.
 '''
 
 __author__ = 'Andy Bird'
 
 #plotting
 import matplotlib
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import io
 import numpy as np
 import time
 import matplotlib.dates as mdates
 from matplotlib.ticker import FuncFormatter
-import prettyplotlib as ppl
-from netCDF4 import num2date
-from ooiservices.app import cache
+from matplotlib.colors import LogNorm
+from prettyplotlib.colors import set2, almost_black
+from prettyplotlib.utils import remove_chartjunk
+from ooiservices.app.uframe.times import to_datenum
+from ooiservices.app.uframe.data import decimate
+from ooiservices.app.tracing import span
 
 axis_font = {'fontname': 'Calibri',
                      'size': '14',
@@ -31,40 +40,162 @@ title_font = {'fontname': 'Arial',
                       'weight': 'bold',
                       'verticalalignment': 'bottom'}
 
-def generate_plot(title,ylabel,x,y,width_in,height_in,plot_format):
-    fig, ax = ppl.subplots(1, 1, figsize=(width_in, height_in))
-    kwargs = dict(linewidth=1.0,alpha=0.7)
-    date_list = num2date(x, units='seconds since 1900-01-01 00:00:00', calendar='gregorian')
-    plot_time_series(fig, ax, date_list, y,
-                                     title=title,
-                                     ylabel=ylabel,
-                                     title_font=title_font,
-                                     axis_font=axis_font,
-                                     **kwargs)
+axis_font_default = axis_font
+title_font_default = title_font
+
+#samples per pixel column above which markers are no longer drawn
+MARKER_DENSITY = 0.2
+
+
+def generate_plot(title,ylabel,x,y,width_in,height_in,plot_format,points=None):
+    '''
+    points is the number of samples before the series was decimated, if it
+    was, and chooses between lines and markers
+    '''
+    points = len(x) if points is None else points
+    with span('render', format=plot_format, points=points) as render_span:
+        fig = Figure(figsize=(width_in, height_in))
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1, 1, 1)
+        kwargs = dict(linewidth=1.0,alpha=0.7)
+        #never draw more than the image has pixel columns; the series
+        #normally comes decimated already and this does nothing
+        columns = max(int(width_in * fig.dpi), 1)
+        markers = points <= MARKER_DENSITY * columns
+        x, y = decimate(x, y, columns)
+        render_span['drawn'] = len(x)
+        dates = to_datenum(x)
+        plot_time_series(fig, ax, dates, y,
+                                         title=title,
+                                         ylabel=ylabel,
+                                         title_font=title_font,
+                                         axis_font=axis_font,
+                                         markers=markers,
+                                         **kwargs)
+
+        buf = save_figure(fig, canvas, plot_format)
+
+    return buf
 
+def save_figure(fig, canvas, plot_format):
+    '''
+    Prints the figure into a buffer and releases it
+    '''
     buf = io.BytesIO()
-    
+
     if plot_format not in ['svg', 'png']:
         plot_format = 'svg'
-    plt.savefig(buf, format=plot_format)
+    canvas.print_figure(buf, format=plot_format)
     buf.seek(0)
 
-    plt.clf()
-    plt.cla()
+    #break the figure/axes reference cycles so the memory goes now
+    fig.clf()
+    return buf
+
+def generate_profile_plot(title, xlabel, ylabel, depth, grid, times, width_in, height_in, plot_format):
+    '''
+    Overlaid profiles: every row of grid against the depth bin centers,
+    labeled with the profile start times
+    '''
+    with span('render', format=plot_format, points=grid.size):
+        fig = Figure(figsize=(width_in, height_in))
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1, 1, 1)
+        labels = [d.strftime('%Y-%m-%d %H:%M') for d in mdates.num2date(to_datenum(times))]
+        plot_profiles(fig, ax, grid, depth, labels,
+                      title=title,
+                      xlabel=xlabel,
+                      ylabel=ylabel,
+                      linewidth=1.0)
+        buf = save_figure(fig, canvas, plot_format)
+    return buf
+
+def generate_section_plot(title, label, ylabel, t_edges, depth_edges, grid, width_in, height_in, plot_format):
+    '''
+    Depth-time section: grid colored between the time and depth edges
+    '''
+    with span('render', format=plot_format, points=grid.size):
+        fig = Figure(figsize=(width_in, height_in))
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1, 1, 1)
+        plot_section(fig, ax, to_datenum(t_edges), depth_edges, grid,
+                     title=title,
+                     label=label,
+                     ylabel=ylabel)
+        buf = save_figure(fig, canvas, plot_format)
+    return buf
+
+def generate_tile(x, y, start, end, ymin, ymax, width_px, height_px):
+    '''
+    A transparent png tile of the series between the times start and end,
+    without axes or labels so that neighbouring tiles line up. ymin and
+    ymax fix the value range; None scales to the data of the tile.
+    '''
+    with span('render', format='png', points=len(x)) as render_span:
+        fig = Figure(figsize=(width_px / 96., height_px / 96.), dpi=96)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        #decimated before submission already, a guard
+        x, y = decimate(x, y, width_px)
+        render_span['drawn'] = len(x)
+        ax.plot(x, y, color=set2[0], linewidth=1.0)
+        ax.set_xlim(start, end)
+        if ymin is not None and ymax is not None:
+            ax.set_ylim(ymin, ymax)
+
+        buf = io.BytesIO()
+        canvas.print_figure(buf, format='png', dpi=96, transparent=True)
+        buf.seek(0)
+        fig.clf()
+    return buf
 
-    return buf 
+def generate_scatter_plot(title, xlabel, ylabel, x, y, width_in, height_in, plot_format):
+    '''
+    Property-property plot with one marker per sample
+    '''
+    with span('render', format=plot_format, points=len(x)):
+        fig = Figure(figsize=(width_in, height_in))
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1, 1, 1)
+        plot_scatter(fig, ax, x, y,
+                     title=title,
+                     xlabel=xlabel,
+                     ylabel=ylabel,
+                     alpha=0.7)
+        fig.tight_layout()
+        buf = save_figure(fig, canvas, plot_format)
+    return buf
+
+def generate_density_plot(title, xlabel, ylabel, x_edges, y_edges, counts, width_in, height_in, plot_format):
+    '''
+    Property-property plot of the sample counts per bin, for series too
+    long for one marker per sample
+    '''
+    with span('render', format=plot_format, points=counts.size):
+        fig = Figure(figsize=(width_in, height_in))
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1, 1, 1)
+        plot_density(fig, ax, x_edges, y_edges, counts,
+                     title=title,
+                     xlabel=xlabel,
+                     ylabel=ylabel)
+        buf = save_figure(fig, canvas, plot_format)
+    return buf
 
-@cache.memoize(timeout=3600)
 def plot_time_series(fig, ax, x, y, fill=False, title='', ylabel='',
-                         title_font={}, axis_font={}, **kwargs):
+                         title_font={}, axis_font={}, markers=True, **kwargs):
 
     if not title_font:
         title_font = title_font_default
     if not axis_font:
         axis_font = axis_font_default
 
-    h = ppl.plot(ax, x, y, **kwargs)
-    ppl.scatter(ax, x, y, **kwargs)
+    h = ax.plot(x, y, color=set2[0], **kwargs)
+    if markers:
+        ax.scatter(x, y, color=set2[1], edgecolor=almost_black, **kwargs)
+    remove_chartjunk(ax, ['top', 'right'])
+    ax.xaxis_date()
     get_time_label(ax, x)
     fig.autofmt_xdate()
 
@@ -78,12 +209,11 @@ def plot_time_series(fig, ax, x, y, fill=False, title='', ylabel='',
     if fill:
         miny = min(ax.get_ylim())
         ax.fill_between(x, y, miny+1e-7, facecolor = h[0].get_color(), alpha=0.15)
-    # plt.subplots_adjust(top=0.85)
-    plt.tight_layout()
+    fig.tight_layout()
 
 def get_time_label(ax, dates):
     '''
-    Custom date axis formatting
+    Custom date axis formatting, dates are matplotlib date numbers
     '''
     def format_func(x, pos=None):
         x = mdates.num2date(x)
@@ -95,7 +225,7 @@ def get_time_label(ax, dates):
         # label = label.rstrip("0")
         # label = label.rstrip(".")
         return label
-    day_delta = (max(dates)-min(dates)).days
+    day_delta = np.nanmax(dates) - np.nanmin(dates)
 
     if day_delta < 1:
         ax.xaxis.set_major_formatter(FuncFormatter(format_func))
@@ -118,7 +248,8 @@ def plot_scatter(fig, ax, x, y, title='', xlabel='', ylabel='',
         if not axis_font:
             axis_font = axis_font_default
 
-        ppl.scatter(ax, x, y, **kwargs)
+        ax.scatter(x, y, color=set2[0], edgecolor=almost_black, **kwargs)
+        remove_chartjunk(ax, ['top', 'right'])
         if xlabel:
             ax.set_xlabel(xlabel, labelpad=10, **axis_font)
         if ylabel:
@@ -127,3 +258,78 @@ def plot_scatter(fig, ax, x, y, title='', xlabel='', ylabel='',
         ax.grid(True)
         ax.set_aspect(1./ax.get_data_ratio())  # make axes square
 
+def plot_profiles(fig, ax, grid, depth, labels, title='', xlabel='', ylabel='',
+                      title_font={}, axis_font={}, **kwargs):
+
+    if not title_font:
+        title_font = title_font_default
+    if not axis_font:
+        axis_font = axis_font_default
+
+    for i, (values, label) in enumerate(zip(grid, labels)):
+        #join the line over depth bins without samples
+        valid = ~np.isnan(values)
+        ax.plot(values[valid], depth[valid], color=set2[i % len(set2)], label=label, **kwargs)
+    remove_chartjunk(ax, ['top', 'right'])
+    #depth grows downwards
+    ax.invert_yaxis()
+    if xlabel:
+        ax.set_xlabel(xlabel, labelpad=10, **axis_font)
+    if ylabel:
+        ax.set_ylabel(ylabel, labelpad=10, **axis_font)
+    if title:
+        ax.set_title(title, **title_font)
+    if len(labels) > 1:
+        ax.legend(loc='best', fontsize='small', frameon=False)
+    ax.grid(True)
+    fig.tight_layout()
+
+def plot_section(fig, ax, dates, depth_edges, grid, title='', label='', ylabel='',
+                     title_font={}, axis_font={}, cmap='RdYlBu_r'):
+
+    if not title_font:
+        title_font = title_font_default
+    if not axis_font:
+        axis_font = axis_font_default
+
+    #grid is (time, depth), pcolormesh wants rows along y
+    mesh = ax.pcolormesh(dates, depth_edges, np.ma.masked_invalid(grid.T), cmap=cmap)
+    remove_chartjunk(ax, ['top', 'right'])
+    ax.set_xlim(dates[0], dates[-1])
+    ax.set_ylim(depth_edges[-1], depth_edges[0])
+    ax.xaxis_date()
+    get_time_label(ax, dates)
+    fig.autofmt_xdate()
+    colorbar = fig.colorbar(mesh, ax=ax)
+    if label:
+        colorbar.set_label(label, **dict(axis_font, verticalalignment='top'))
+    if ylabel:
+        ax.set_ylabel(ylabel, **axis_font)
+    if title:
+        ax.set_title(title, **title_font)
+    fig.tight_layout()
+
+def plot_density(fig, ax, x_edges, y_edges, counts, title='', xlabel='', ylabel='',
+                     title_font={}, axis_font={}, cmap='Blues'):
+
+    if not title_font:
+        title_font = title_font_default
+    if not axis_font:
+        axis_font = axis_font_default
+
+    #counts is (x, y), empty bins stay blank, the counts span decades
+    counts = np.ma.masked_equal(counts.T, 0)
+    mesh = ax.pcolormesh(x_edges, y_edges, counts, cmap=cmap, norm=LogNorm())
+    remove_chartjunk(ax, ['top', 'right'])
+    ax.set_xlim(x_edges[0], x_edges[-1])
+    ax.set_ylim(y_edges[0], y_edges[-1])
+    colorbar = fig.colorbar(mesh, ax=ax)
+    colorbar.set_label('samples', **dict(axis_font, verticalalignment='top'))
+    if xlabel:
+        ax.set_xlabel(xlabel, labelpad=10, **axis_font)
+    if ylabel:
+        ax.set_ylabel(ylabel, labelpad=10, **axis_font)
+    if title:
+        ax.set_title(title, **title_font)
+    ax.grid(True)
+    fig.tight_layout()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/profiles.py
+
+Profiler data (wire following profilers, gliders) split into profiles and
+averaged on a regular depth grid. A profile is a run of samples in which the
+smoothed depth keeps moving in one direction. Binning is done with bincount,
+so the grids handed to the plots have a bounded size whatever the number of
+samples.
+'''
+
+import numpy as np
+
+#samples of the moving averages the profile segmentation smooths with
+PROFILE_SMOOTHING = 5
+#most profiles overlaid in a profile plot
+MAX_OVERLAID_PROFILES = 20
+#largest depth section, in time columns and depth bins
+MAX_SECTION_COLUMNS = 400
+MAX_DEPTH_BINS = 200
+
+
+def _moving_average(values, window):
+    '''
+    Moving average of the same length as values, the ends use the first
+    and last full window
+    '''
+    window = min(window, len(values))
+    average = np.convolve(values, np.ones(window) / window, mode='valid')
+    index = np.clip(np.arange(len(values)) - window // 2, 0, len(average) - 1)
+    return average[index]
+
+def segment_profiles(depth, window=PROFILE_SMOOTHING):
+    '''
+    Profile number, counting from 0, of every sample of a time ordered
+    depth series. A new profile starts where the depth, smoothed over window
+    samples, changes direction; the direction itself is smoothed too so that
+    jitter while parked does not start profiles.
+    '''
+    depth = np.asarray(depth, dtype=np.float64)
+    n = len(depth)
+    valid = ~np.isnan(depth)
+    if n < 2 or valid.sum() < 2:
+        return np.zeros(n, dtype=np.int64)
+    index = np.arange(n)
+    depth = np.interp(index, index[valid], depth[valid])
+    direction = np.sign(np.diff(_moving_average(depth, window)))
+    direction = np.sign(_moving_average(direction, window))
+    #a sample without direction keeps the previous one, leading ones the first
+    moving = np.flatnonzero(direction)
+    if not len(moving):
+        return np.zeros(n, dtype=np.int64)
+    last = np.maximum.accumulate(np.where(direction != 0, np.arange(len(direction)), moving[0]))
+    direction = direction[last]
+    profile = np.concatenate(([0, 0], np.cumsum(direction[1:] != direction[:-1])))
+    return profile
+
+def depth_edges(depth, bins):
+    '''
+    bins + 1 regularly spaced edges covering the valid depths
+    '''
+    low, high = np.nanmin(depth), np.nanmax(depth)
+    if not high > low:
+        high = low + 1.
+    return np.linspace(low, high, bins + 1)
+
+def bin_profiles(profile, depth, values, edges, columns=None):
+    '''
+    Mean of values per profile and depth bin, as a (profiles, bins) grid
+    with NaN in the empty cells. With more profiles than columns, runs of
+    consecutive profiles share a column. Also returns the column of every
+    sample.
+    '''
+    depth = np.asarray(depth, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    bins = len(edges) - 1
+    profiles = int(profile.max()) + 1 if len(profile) else 0
+    if columns is not None and profiles > columns:
+        column = profile * columns // profiles
+        profiles = columns
+    else:
+        column = profile
+    #the deepest edge belongs to the last bin
+    cell = np.minimum(np.searchsorted(edges, depth, side='right') - 1, bins - 1)
+    keep = (cell >= 0) & ~np.isnan(depth) & ~np.isnan(values)
+    flat = column[keep] * bins + cell[keep]
+    sums = np.bincount(flat, weights=values[keep], minlength=profiles * bins)
+    counts = np.bincount(flat, minlength=profiles * bins)
+    grid = np.empty(profiles * bins)
+    grid.fill(np.nan)
+    filled = counts > 0
+    grid[filled] = sums[filled] / counts[filled]
+    return grid.reshape(profiles, bins), column
+
+def column_edges(t, column):
+    '''
+    Time edges of the columns of a time ordered series: the first sample of
+    every column and the last sample
+    '''
+    starts = np.flatnonzero(np.concatenate(([True], column[1:] != column[:-1])))
+    return np.append(t[starts], t[-1])
+
+def profile_plot_data(t, depth, values, count, bins):
+    '''
+    The last count profiles binned on bins depth bins: bin centers, the
+    (profiles, bins) grid and the start time of each profile
+    '''
+    profile = segment_profiles(depth)
+    first = max(int(profile[-1]) + 1 - count, 0)
+    recent = profile >= first
+    t, depth, values, profile = t[recent], depth[recent], values[recent], profile[recent] - first
+    edges = depth_edges(depth, bins)
+    grid, column = bin_profiles(profile, depth, values, edges)
+    return (edges[:-1] + edges[1:]) / 2, grid, column_edges(t, column)[:-1]
+
+def section_plot_data(t, depth, values, columns, bins):
+    '''
+    Depth-time section of the series: time edges, depth edges and the
+    (columns, bins) grid
+    '''
+    profile = segment_profiles(depth)
+    edges = depth_edges(depth, bins)
+    grid, column = bin_profiles(profile, depth, values, edges, columns)
+    return column_edges(t, column), edges, grid
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/render_pool.py
+
+Plot rendering in a bounded pool of renderer processes, so that CPU bound
+matplotlib work does not hold the GIL of the web worker serving other
+requests. The renderers import matplotlib and load the fonts when they
+start. Time series are decimated to the image width before they are handed
+over, as float64 arrays, which pickle as raw bytes.
+Jobs beyond RENDER_QUEUE_DEPTH are refused (RenderPoolBusy) rather than
+queued. A job that runs past RENDER_TIMEOUT has its renderer process
+killed, which the pool replaces; the other renders carry on. Renderers
+report the job they start on a queue so the web worker knows which process
+to kill, and skip jobs whose deadline passed while they were queued.
+
+start_pool is called once a web worker is up (see gunicorn.conf.py), so
+that the first plot does not wait for the renderers and the pool is not
+forked from a worker already running request threads.
+
+With RENDER_PROCESSES set to 0 plots are rendered in the calling thread.
+matplotlib is only imported where a plot is rendered, so web workers that
+hand their plots to the pool never load it.
+'''
+
+from flask import current_app
+from ooiservices.app.tracing import span
+from ooiservices.app.uframe.data import decimate
+from multiprocessing import Pool, Queue, TimeoutError
+from itertools import count
+import numpy as np
+import threading
+import signal
+import hashlib
+import json
+import math
+import time
+import os
+
+#cache name of the rendered images, see cache_metrics
+PLOT_CACHE = 'rendered_plots'
+#pixels per inch the time series are decimated to before submission, at
+#least the figure dpi of the renderers (80 in matplotlib 1.4, 100 from 2.0)
+SUBMIT_DPI = 100
+
+#the renderers a job can name, functions of uframe/plotting.py that return
+#a buffer with the image
+RENDERERS = {'time_series': 'generate_plot',
+             'tile': 'generate_tile',
+             'profile': 'generate_profile_plot',
+             'section': 'generate_section_plot',
+             'scatter': 'generate_scatter_plot',
+             'density': 'generate_density_plot'}
+
+
+class RenderPoolBusy(Exception):
+    pass
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = None
+#job id -> pid of the renderer running it, and the jobs that finished
+#before their start was reported
+_running = {}
+_finished = set()
+_running_lock = threading.Lock()
+_job_ids = count()
+#in a renderer process, the queue it reports the jobs it starts on
+_started = None
+
+
+def get_renderer(renderer):
+    '''
+    The plotting function of a renderer, importing matplotlib on first use
+    '''
+    from ooiservices.app.uframe import plotting
+    return getattr(plotting, RENDERERS[renderer])
+
+def _init_renderer(started):
+    '''
+    Renderer process start up: renders a tiny figure so that matplotlib and
+    the fonts are loaded before the first job arrives
+    '''
+    global _started
+    _started = started
+    try:
+        #a day from 1970-01-01, in seconds since 1900
+        get_renderer('time_series')('', '', np.array([2208988800., 2209075200.]), np.array([0., 1.]), 1, 1, 'png')
+    except Exception:
+        #the first real job will load them instead
+        pass
+
+def _render(job):
+    '''
+    Runs in a renderer process. Never raises, so the completion callback
+    always fires; failures come back as ('error', message).
+    '''
+    job_id, deadline, renderer, args = job
+    if time.time() > deadline:
+        #nobody waits for it any more
+        return 'expired', None
+    _started.put((job_id, os.getpid()))
+    try:
+        return 'ok', get_renderer(renderer)(*args).getvalue()
+    except Exception, e:
+        return 'error', '%s: %s' % (type(e).__name__, e)
+
+def _watch_started(started):
+    '''
+    Records which renderer runs which job, in a thread of the web worker
+    '''
+    while True:
+        job_id, pid = started.get()
+        with _running_lock:
+            if job_id in _finished:
+                _finished.discard(job_id)
+            else:
+                _running[job_id] = pid
+
+def _new_pool(config):
+    global _pool, _pool_pid, _slots
+    started = Queue()
+    _pool = Pool(config['RENDER_PROCESSES'], initializer=_init_renderer, initargs=(started,),
+                 maxtasksperchild=config['RENDER_TASKS_PER_PROCESS'])
+    _pool_pid = os.getpid()
+    _slots = threading.BoundedSemaphore(config['RENDER_QUEUE_DEPTH'])
+    _running.clear()
+    _finished.clear()
+    watcher = threading.Thread(target=_watch_started, args=(started,))
+    watcher.daemon = True
+    watcher.start()
+
+def start_pool(config):
+    '''
+    Starts the renderer pool of this process, unless it is already running
+    or RENDER_PROCESSES is 0. Returns the pool and its slots.
+    '''
+    if not config['RENDER_PROCESSES']:
+        return None, None
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _new_pool(config)
+        return _pool, _slots
+
+def _get_pool():
+    '''
+    The renderer pool of this process and its slots, started here when no
+    start up hook did it
+    '''
+    return start_pool(current_app.config)
+
+def plot_digest(params, x, y):
+    '''
+    Content address of a plot: sha1 of the json serializable request
+    parameters and of the bytes of the plotted series
+    '''
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True))
+    digest.update(np.ascontiguousarray(x, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+class RenderJob(object):
+    '''
+    A submitted render; get() waits for the image bytes until its deadline,
+    RENDER_TIMEOUT after submission, then kills the renderer running it and
+    raises TimeoutError
+    '''
+    def __init__(self, job_id, deadline, job, pool, release, plot_format, points):
+        self.job_id = job_id
+        self.deadline = deadline
+        self.job = job
+        self.pool = pool
+        self.release = release
+        self.plot_format = plot_format
+        self.points = points
+
+    def get(self):
+        with span('render', format=self.plot_format, points=self.points, pooled=True):
+            try:
+                status, result = self.job.get(max(self.deadline - time.time(), 0))
+            except TimeoutError:
+                self.kill()
+                raise
+        if status == 'expired':
+            raise TimeoutError()
+        if status == 'error':
+            raise RuntimeError(result)
+        return result
+
+    def kill(self):
+        '''
+        Kills the renderer of a job that has started; a job still queued is
+        skipped by the renderer that picks it up
+        '''
+        with _running_lock:
+            pid = _running.pop(self.job_id, None)
+        if pid is None or self.job.ready():
+            return
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            return
+        #its result never comes: free its slot and forget it
+        self.pool._cache.pop(self.job._job, None)
+        self.release()
+
+class _Rendered(object):
+    def __init__(self, image):
+        self.image = image
+
+    def get(self):
+        return self.image
+
+def submit(renderer, args, plot_format, points):
+    '''
+    Submits a job for one of the RENDERERS to the renderer pool and returns
+    a job whose get() returns the image bytes. Raises RenderPoolBusy when
+    RENDER_QUEUE_DEPTH jobs are already pending; get() raises TimeoutError
+    when the render takes over RENDER_TIMEOUT and RuntimeError when the
+    renderer fails.
+    '''
+    if not current_app.config['RENDER_PROCESSES']:
+        try:
+            return _Rendered(get_renderer(renderer)(*args).getvalue())
+        except Exception, e:
+            raise RuntimeError('%s: %s' % (type(e).__name__, e))
+
+    pool, slots = _get_pool()
+    if not slots.acquire(False):
+        raise RenderPoolBusy('all %d render slots are busy' % current_app.config['RENDER_QUEUE_DEPTH'])
+    job_id = next(_job_ids)
+    deadline = time.time() + current_app.config['RENDER_TIMEOUT']
+    released = []
+    release_lock = threading.Lock()
+
+    def release():
+        #once, whether the job finished or its renderer was killed
+        with release_lock:
+            if not released:
+                released.append(True)
+                slots.release()
+
+    def finished(result):
+        if result[0] != 'expired':
+            with _running_lock:
+                if _running.pop(job_id, None) is None:
+                    _finished.add(job_id)
+        release()
+
+    #the slot is released when the job finishes, even if nobody waits for it
+    try:
+        job = pool.apply_async(_render, ((job_id, deadline, renderer, args),), callback=finished)
+    except Exception:
+        release()
+        raise
+    return RenderJob(job_id, deadline, job, pool, release, plot_format, points)
+
+def submit_plot(title, ylabel, x, y, width_in, height_in, plot_format):
+    '''
+    Submits a time series plot, see submit. The series is decimated to the
+    image width here so that only what gets drawn is sent to the renderer.
+    '''
+    points = len(x)
+    x, y = decimate(x, y, max(int(math.ceil(width_in * SUBMIT_DPI)), 1))
+    return submit('time_series', (title, ylabel, x, y, width_in, height_in, plot_format, points),
+                  plot_format, points)
+
+def render_plot(title, ylabel, x, y, width_in, height_in, plot_format):
+    '''
+    Renders a time series plot in the renderer pool and returns the image
+    bytes, see submit_plot
+    '''
+    return submit_plot(title, ylabel, x, y, width_in, height_in, plot_format).get()
+
+def render_tile(x, y, start, end, ymin, ymax, width_px, height_px):
+    '''
+    Renders a time tile in the renderer pool and returns the png bytes
+    '''
+    points = len(x)
+    x, y = decimate(x, y, width_px)
+    return submit('tile', (x, y, start, end, ymin, ymax, width_px, height_px), 'png', points).get()
+
+def render_profile_plot(title, xlabel, ylabel, depth, grid, times, width_in, height_in, plot_format):
+    '''
+    Renders overlaid profiles in the renderer pool and returns the image bytes
+    '''
+    return submit('profile', (title, xlabel, ylabel, depth, grid, times, width_in, height_in, plot_format),
+                  plot_format, grid.size).get()
+
+def render_section_plot(title, label, ylabel, t_edges, depth_edges, grid, width_in, height_in, plot_format):
+    '''
+    Renders a depth-time section in the renderer pool and returns the image
+    bytes
+    '''
+    return submit('section', (title, label, ylabel, t_edges, depth_edges, grid, width_in, height_in, plot_format),
+                  plot_format, grid.size).get()
+
+def render_scatter_plot(title, xlabel, ylabel, x, y, width_in, height_in, plot_format):
+    '''
+    Renders a scatter plot in the renderer pool and returns the image bytes
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    return submit('scatter', (title, xlabel, ylabel, x, y, width_in, height_in, plot_format),
+                  plot_format, len(x)).get()
+
+def render_density_plot(title, xlabel, ylabel, x_edges, y_edges, counts, width_in, height_in, plot_format):
+    '''
+    Renders a binned scatter plot in the renderer pool and returns the
+    image bytes
+    '''
+    return submit('density', (title, xlabel, ylabel, x_edges, y_edges, counts, width_in, height_in, plot_format),
+                  plot_format, counts.size).get()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+'''
+uframe live tail
+
+New records of a stream are pushed to clients as server-sent events. One
+poller thread per stream, across all web workers (a redis lock elects it),
+fetches uframe and publishes the new records on a redis channel that every
+client of the stream subscribes to, so uframe load grows with the number of
+streams followed and not with the number of viewers.
+
+A tail holds its connection open for as long as it is watched, so tails are
+served by the gevent workers of the stream process (gunicorn_stream.conf.py);
+the sync web workers refuse them, see SERVE_STREAMS.
+'''
+
+from flask import request, current_app, Response, stream_with_context
+from ooiservices.app import redis_store
+from ooiservices.app.uframe import uframe as api
+from ooiservices.app.main.authentication import auth
+from ooiservices.app.main.errors import service_unavailable
+from ooiservices.app.uframe.data import get_uframe_data_url, iter_uframe_records, record_stream_request
+from ooiservices.app.uframe.times import COSMO_CONSTANT
+from ooiservices.app.tracing import traced_get
+from uuid import uuid4
+import threading
+import json
+import time
+
+TAIL_CHANNEL = 'ooiservices:tail:%s/%s'
+TAIL_LOCK = 'ooiservices:tail_lock:%s/%s'
+#newest timestamp published for a stream, so a restarted poller goes on from there
+TAIL_LAST = 'ooiservices:tail_last:%s/%s'
+TAIL_LAST_TTL = 86400
+#without a TAIL_LAST, a poller starts this many poll intervals back from now
+TAIL_SEED_POLLS = 3
+
+
+class LockLost(Exception):
+    pass
+
+def fetch_new_records(url, last, keepalive=None, timeout=None):
+    '''
+    The records of a stream newer than last, in time order, and the newest
+    timestamp seen. Without last no record is kept, only the newest
+    timestamp. keepalive is called for every record read; timeout bounds
+    the wait for each read from uframe.
+    '''
+    response = traced_get(url, stream=True, timeout=timeout)
+    response.raise_for_status()
+    records = []
+    newest = last
+    try:
+        for record in iter_uframe_records(response):
+            if keepalive is not None:
+                keepalive()
+            ts = record[record['preferred_timestamp']]
+            if last is not None and ts > last:
+                records.append(record)
+            if newest is None or ts > newest:
+                newest = ts
+    finally:
+        response.close()
+    records.sort(key=lambda r: r[r['preferred_timestamp']])
+    return records, newest
+
+def poll_stream(app, stream, ref, token):
+    '''
+    Poller thread of a stream. Publishes the records newer than the ones
+    seen so far every TAIL_POLL_INTERVAL seconds, as long as the stream has
+    subscribers and this thread holds the lock. Every poll asks uframe for
+    the records after the newest one seen, which is kept in TAIL_LAST across
+    poller restarts; a stream without one starts TAIL_SEED_POLLS intervals
+    back from now, never from the start of its history. The lock is renewed
+    while a poll reads its response, however long that takes.
+    '''
+    with app.app_context():
+        channel = TAIL_CHANNEL % (stream, ref)
+        lock = TAIL_LOCK % (stream, ref)
+        last_key = TAIL_LAST % (stream, ref)
+        interval = app.config['TAIL_POLL_INTERVAL']
+        ttl = interval * 3
+        renewed = [0]
+        last = redis_store.get(last_key)
+        if last is not None:
+            last = float(last)
+        else:
+            last = time.time() + COSMO_CONSTANT - interval * TAIL_SEED_POLLS
+
+        def keepalive():
+            now = time.time()
+            if now - renewed[0] < interval:
+                return
+            if redis_store.get(lock) != token:
+                raise LockLost()
+            redis_store.expire(lock, ttl)
+            renewed[0] = now
+
+        try:
+            while True:
+                renewed[0] = 0
+                keepalive()
+                if not redis_store.pubsub_numsub(channel)[0][1]:
+                    break
+                try:
+                    url = get_uframe_data_url(stream, ref, last)
+                    records, last = fetch_new_records(url, last, keepalive, timeout=interval)
+                except LockLost:
+                    break
+                except Exception, e:
+                    app.logger.warning('tail of %s/%s failed: %s' % (stream, ref, e))
+                    records = []
+                for record in records:
+                    redis_store.publish(channel, json.dumps(record))
+                if records:
+                    redis_store.set(last_key, repr(last), ex=TAIL_LAST_TTL)
+                time.sleep(interval)
+        except LockLost:
+            pass
+        finally:
+            if redis_store.get(lock) == token:
+                redis_store.delete(lock)
+
+def ensure_poller(stream, ref):
+    '''
+    Starts a poller thread for the stream unless one runs in any worker
+    '''
+    token = uuid4().hex
+    ttl = current_app.config['TAIL_POLL_INTERVAL'] * 3
+    if redis_store.set(TAIL_LOCK % (stream, ref), token, ex=ttl, nx=True):
+        thread = threading.Thread(target=poll_stream,
+                                  args=(current_app._get_current_object(), stream, ref, token))
+        thread.daemon = True
+        thread.start()
+
+def select_fields(record, fields):
+    '''
+    The time and the requested fields of a record, the whole record without
+    fields
+    '''
+    if not fields:
+        return record
+    selected = dict((f, record.get(f)) for f in fields)
+    selected['time'] = record[record['preferred_timestamp']]
+    return selected
+
+@api.route('/tail/<string:instrument>/<string:stream>', methods=['GET'])
+@auth.login_required
+def tail_stream(instrument, stream):
+    '''
+    Server-sent events with the new records of a stream.
+    usage: /uframe/tail/<instrument>/<stream>?fields=<field>,<field>...
+    '''
+    if not current_app.config['SERVE_STREAMS']:
+        return service_unavailable('tails are served by the stream process')
+    fields = [f for f in request.args.get('fields', '').split(',') if f]
+    heartbeat = current_app.config['TAIL_HEARTBEAT']
+    record_stream_request(stream, instrument)
+
+    def generate():
+        pubsub = redis_store.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(TAIL_CHANNEL % (stream, instrument))
+        try:
+            ensure_poller(stream, instrument)
+            yield 'retry: %d\n\n' % (heartbeat * 1000)
+            while True:
+                message = pubsub.get_message(timeout=heartbeat)
+                if message is None:
+                    #the poller may have stopped just before we subscribed
+                    ensure_poller(stream, instrument)
+                    yield ': heartbeat\n\n'
+                    continue
+                record = json.loads(message['data'])
+                yield 'data: %s\n\n' % json.dumps(select_fields(record, fields))
+        finally:
+            pubsub.close()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
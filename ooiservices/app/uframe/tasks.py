@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/tasks.py
+
+Celery tasks for long running uframe work, run on the celery worker
+(see ooiservices/celery_worker.py) rather than in the web workers.
+'''
+
+from flask import current_app
+from ooiservices.app import celery, basedir, redis_store
+from ooiservices.app.tracing import traced_get
+from ooiservices.app.uframe.data import get_uframe_data_url, iter_uframe_records
+from ooiservices.app.uframe.data import get_popular_streams, STREAM_REQUESTS_KEY, COSMO_CONSTANT
+from ooiservices.app.uframe.controller import get_uframe_stream_contents
+from ooiservices.app.uframe.chunk_store import get_chunk_store
+from ooiservices.app.uframe.param_index import refresh_index
+import csv
+import os
+import time
+
+#how often the progress of a job is reported, in rows
+PROGRESS_ROWS = 10000
+EXPORT_EXTENSIONS = {'csv': 'csv', 'netcdf': 'nc'}
+
+
+def get_export_dir():
+    '''
+    Directory the finished export files are written to
+    '''
+    export_dir = basedir + current_app.config['EXPORT_DIR']
+    if not os.path.exists(export_dir):
+        os.makedirs(export_dir)
+    return export_dir
+
+@celery.task(bind=True)
+def export_stream(self, stream, ref, export_format, start=None, end=None):
+    '''
+    Exports a stream to a file in the export directory. start and end are
+    optional bounds in seconds since 1900 on the preferred timestamp, passed
+    on to uframe. The csv columns are the keys of the first record; keys
+    that only later records have are left out.
+    '''
+    filename = '%s-%s.%s' % (stream, ref, EXPORT_EXTENSIONS[export_format])
+    path = os.path.join(get_export_dir(), '%s.%s' % (self.request.id, EXPORT_EXTENSIONS[export_format]))
+    partial = path + '.part'
+
+    if export_format == 'netcdf':
+        url = get_uframe_data_url(stream, ref, start, end, data_format='application/netcdf3')
+        response = traced_get(url, stream=True)
+        response.raise_for_status()
+        try:
+            total = float(response.headers.get('content-length') or 0)
+            written = 0
+            with open(partial, 'wb') as f:
+                for chunk in response.iter_content(1024 * 1024):
+                    f.write(chunk)
+                    written += len(chunk)
+                    if total:
+                        self.update_state(state='PROGRESS', meta={'progress': written / total})
+        finally:
+            response.close()
+    else:
+        response = traced_get(get_uframe_data_url(stream, ref, start, end), stream=True)
+        response.raise_for_status()
+        try:
+            with open(partial, 'wb') as f:
+                writer = None
+                written = 0
+                for row in iter_uframe_records(response):
+                    if writer is None:
+                        pref_timestamp = row['preferred_timestamp']
+                        writer = csv.DictWriter(f, fieldnames=row.keys(), extrasaction='ignore')
+                        writer.writeheader()
+                        #progress is how far the rows are through the window
+                        first = start if start is not None else row[pref_timestamp]
+                        last = end if end is not None else time.time() + COSMO_CONSTANT
+                    #uframe works to the second, the window is checked again here
+                    if start is not None and row[pref_timestamp] < start:
+                        continue
+                    if end is not None and row[pref_timestamp] > end:
+                        continue
+                    writer.writerow(row)
+                    written += 1
+                    if written % PROGRESS_ROWS == 0 and last > first:
+                        progress = min(max((row[pref_timestamp] - first) / (last - first), 0.0), 1.0)
+                        self.update_state(state='PROGRESS', meta={'progress': progress})
+        finally:
+            response.close()
+
+    os.rename(partial, path)
+    return {'path': path, 'filename': filename, 'size': os.path.getsize(path), 'progress': 1.0}
+
+@celery.task
+def cleanup_exports():
+    '''
+    Removes export files older than EXPORT_TTL seconds
+    '''
+    export_dir = get_export_dir()
+    expires = time.time() - current_app.config['EXPORT_TTL']
+    removed = 0
+    for name in os.listdir(export_dir):
+        path = os.path.join(export_dir, name)
+        if os.path.isfile(path) and os.path.getmtime(path) < expires:
+            os.remove(path)
+            removed += 1
+    return removed
+
+def warm_streams(top_n):
+    '''
+    Refreshes the cached contents of the top_n most requested streams and
+    stores their decoded data in the chunk store. Request counts are halved
+    afterwards so that the ranking follows recent use.
+    '''
+    warmed = []
+    for stream, ref in get_popular_streams(top_n):
+        try:
+            get_uframe_stream_contents.invalidate(stream, ref)
+            response = get_uframe_stream_contents(stream, ref)
+            if response.status_code != 200:
+                continue
+            data = response.json()
+            get_chunk_store().read(stream, ref, [], 0, time.time() + COSMO_CONSTANT, lambda start, end: data)
+            warmed.append('/'.join([stream, ref]))
+        except Exception, e:
+            current_app.logger.warning('cache warming of %s/%s failed: %s' % (stream, ref, e))
+    redis_store.zunionstore(STREAM_REQUESTS_KEY, {STREAM_REQUESTS_KEY: 0.5})
+    current_app.logger.info('Warmed %d streams' % len(warmed))
+    return warmed
+
+@celery.task
+def warm_cache():
+    '''
+    Scheduled cache warming, see CACHE_WARM_INTERVAL
+    '''
+    return warm_streams(current_app.config['CACHE_WARM_TOP_N'])
+
+@celery.task
+def refresh_parameter_index():
+    '''
+    Scheduled parameter index refresh, see PARAM_INDEX_INTERVAL
+    '''
+    added, updated, removed = refresh_index()
+    current_app.logger.info('Parameter index: %d added, %d updated, %d removed' % (added, updated, removed))
+    return added, updated, removed
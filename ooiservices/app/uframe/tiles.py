@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+'''
+Time tiles
+
+Fixed size png plot tiles of a stream field, addressed by zoom level and
+tile index over the time axis. A zoom 0 tile spans the whole NTP era
+(2**32 seconds from 1900) and each zoom level halves the span, so panning
+and zooming only ever asks for a few new tiles. The data is read from the
+chunk store. Tiles whose time range is in the past never change: they are
+kept in the plot cache and sent with an immutable Cache-Control.
+'''
+
+from flask import request, current_app, make_response
+from ooiservices.app.uframe import uframe as api
+from ooiservices.app.main.authentication import auth
+from ooiservices.app.main.errors import bad_request, internal_server_error, service_unavailable
+from ooiservices.app.cache_metrics import lookup, store, make_key
+from ooiservices.app.uframe.data import get_uframe_data_url, fetch_uframe_data, record_stream_request, COSMO_CONSTANT
+from ooiservices.app.uframe.chunk_store import get_chunk_store
+from ooiservices.app.uframe.render_pool import render_tile, RenderPoolBusy, PLOT_CACHE
+from multiprocessing import TimeoutError
+import numpy as np
+import time
+
+TILE_ROOT_SECONDS = 2 ** 32
+TILE_MAX_ZOOM = 32
+TILE_SIZE = 256
+
+
+def tile_range(zoom, index):
+    '''
+    Start and end, in seconds since 1900, of a tile
+    '''
+    span = float(TILE_ROOT_SECONDS) / 2 ** zoom
+    return index * span, (index + 1) * span
+
+@api.route('/tile/<string:instrument>/<string:stream>/<string:field>/<int:zoom>/<int:index>.png', methods=['GET'])
+@auth.login_required
+def get_plot_tile(instrument, stream, field, zoom, index):
+    '''
+    A 256x256 png tile of a field. Pass the same ymin and ymax to all the
+    tiles of a view so that they line up.
+    usage: /uframe/tile/<instrument>/<stream>/<field>/<zoom>/<index>.png?ymin=<n>&ymax=<n>
+    '''
+    if not 0 <= zoom <= TILE_MAX_ZOOM:
+        return bad_request('zoom must be between 0 and %d' % TILE_MAX_ZOOM)
+    if not 0 <= index < 2 ** zoom:
+        return bad_request('index must be between 0 and %d at zoom %d' % (2 ** zoom - 1, zoom))
+    try:
+        ymin = float(request.args['ymin']) if 'ymin' in request.args else None
+        ymax = float(request.args['ymax']) if 'ymax' in request.args else None
+    except ValueError:
+        return bad_request('ymin and ymax must be numbers')
+
+    start, end = tile_range(zoom, index)
+    historic = end <= time.time() + COSMO_CONSTANT
+    key = make_key(PLOT_CACHE, ['tile', instrument, stream, field, zoom, index, ymin, ymax])
+    image = lookup(PLOT_CACHE, key) if historic else None
+    if image is None:
+        record_stream_request(stream, instrument)
+        fetch = lambda start, end: fetch_uframe_data(get_uframe_data_url(stream, instrument, start, end))
+        try:
+            x, columns = get_chunk_store().read(stream, instrument, [field], start, end, fetch)
+        except KeyError:
+            return bad_request('field %s not in stream' % field)
+        except Exception, e:
+            return internal_server_error('uframe connection cannot be made: ' + str(e))
+        y = columns[field]
+        if y.dtype != np.float64:
+            return bad_request('field %s is not numeric' % field)
+        try:
+            image = render_tile(x, y, start, end, ymin, ymax, TILE_SIZE, TILE_SIZE)
+        except RenderPoolBusy, e:
+            return service_unavailable(str(e))
+        except TimeoutError:
+            return service_unavailable('tile rendering timed out')
+        except RuntimeError, e:
+            return bad_request('tile rendering failed: ' + str(e))
+        if historic:
+            store(PLOT_CACHE, key, image, current_app.config['TILE_CACHE_TIMEOUT'])
+
+    response = make_response(image)
+    response.headers['Content-Type'] = 'image/png'
+    if historic:
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, max-age=%d' % current_app.config['TILE_LIVE_MAX_AGE']
+    response.add_etag()
+    return response.make_conditional(request)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/times.py
+
+Vectorized conversions of uframe timestamps, which are seconds since
+1900-01-01 (NTP epoch), to unix seconds, datetime64, ISO 8601 strings and
+matplotlib date numbers. Every function takes and returns whole arrays.
+'''
+
+from flask import request
+import numpy as np
+
+COSMO_CONSTANT = 2208988800
+#matplotlib date number of 1970-01-01
+UNIX_EPOCH_DATENUM = 719163.0
+
+TIME_FORMATS = ['ntp', 'unix', 'iso']
+TIME_UNITS = {'ntp': 'seconds since 1900-01-01 00:00:00',
+              'unix': 'seconds since 1970-01-01 00:00:00',
+              'iso': 'ISO 8601 UTC',
+              'datetime64': 'datetime64[us] UTC'}
+
+
+def to_unix(t):
+    '''
+    Seconds since 1970
+    '''
+    return np.asarray(t, dtype=np.float64) - COSMO_CONSTANT
+
+def to_datetime64(t):
+    '''
+    datetime64[us], NaT where t is NaN
+    '''
+    unix = to_unix(t)
+    valid = ~np.isnan(unix)
+    us = np.zeros(len(unix), dtype=np.int64)
+    us[valid] = np.round(unix[valid] * 1e6).astype(np.int64)
+    dt = us.astype('datetime64[us]')
+    dt[~valid] = np.datetime64('NaT')
+    return dt
+
+def to_iso(t):
+    '''
+    ISO 8601 strings in UTC with microseconds, None where t is NaN
+    '''
+    dt = to_datetime64(t)
+    iso = np.datetime_as_string(dt, timezone='UTC').astype(object)
+    iso[np.isnan(np.asarray(t, dtype=np.float64))] = None
+    return iso
+
+def to_datenum(t):
+    '''
+    matplotlib date numbers (days since 0001-01-01, plus one)
+    '''
+    return to_unix(t) / 86400. + UNIX_EPOCH_DATENUM
+
+def convert_times(t, time_format):
+    '''
+    Converts uframe timestamps to one of TIME_FORMATS or datetime64
+    '''
+    if time_format == 'ntp':
+        return np.asarray(t, dtype=np.float64)
+    if time_format == 'unix':
+        return to_unix(t)
+    if time_format == 'iso':
+        return to_iso(t)
+    if time_format == 'datetime64':
+        return to_datetime64(t)
+    raise ValueError('time_format must be one of %s' % ', '.join(TIME_FORMATS))
+
+def times_to_list(t, time_format):
+    '''
+    Converted timestamps as a JSON serializable list
+    '''
+    values = convert_times(t, time_format)
+    if values.dtype == np.float64:
+        out = values.astype(object)
+        out[np.isnan(values)] = None
+        return out.tolist()
+    return values.tolist()
+
+def parse_time_format(allowed=TIME_FORMATS):
+    '''
+    The time_format request argument, ntp (uframe's own) by default
+    '''
+    time_format = request.args.get('time_format', 'ntp')
+    if time_format not in allowed:
+        raise ValueError('time_format must be one of %s' % ', '.join(allowed))
+    return time_format
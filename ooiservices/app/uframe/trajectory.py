@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/trajectory.py
+
+Simplified tracks of mobile platforms (gliders, AUVs). A track is reduced
+once per deployment with Douglas-Peucker, keeping for every point the
+tolerance below which it is needed; a map zoom level then only selects the
+points whose weight exceeds the size of a pixel at that zoom.
+
+Deployments are the InstrumentDeployment rows of the reference designator.
+Each track is fetched for its deployment's window only and cached per
+deployment; the track of an ended deployment does not change, so it is
+kept as long as the cache allows.
+'''
+
+from ooiservices.app.models import InstrumentDeployment
+from ooiservices.app.cache_metrics import get_or_set, make_key
+from ooiservices.app.uframe.data import get_uframe_data_url, fetch_uframe_columns
+from ooiservices.app.uframe.times import COSMO_CONSTANT
+from datetime import timedelta
+import numpy as np
+import calendar
+import time
+
+#finest zoom level served, its pixel size is the simplification floor
+MAX_ZOOM = 18
+#cache timeouts of the track of a deployment still running and of an ended
+#one; the cache backends have no timeout for never
+TRACK_TIMEOUT = 3600
+ENDED_TRACK_TIMEOUT = 365 * 86400
+
+
+def zoom_tolerance(zoom):
+    '''
+    Size in degrees of a 256 pixel map tile pixel at a zoom level
+    '''
+    return 360. / (256 * 2 ** zoom)
+
+def simplification_weights(x, y, floor=0.):
+    '''
+    Douglas-Peucker weight of every vertex of the polyline x, y: the largest
+    tolerance at which the vertex is kept. The end points are always kept
+    (infinite weight). Segments are not split below floor, their inner
+    vertices get weight 0. Distances are computed per segment with numpy.
+    '''
+    n = len(x)
+    weights = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return weights
+    weights[0] = weights[-1] = np.inf
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        xs = x[first + 1:last] - x[first]
+        ys = y[first + 1:last] - y[first]
+        dx = x[last] - x[first]
+        dy = y[last] - y[first]
+        norm = np.hypot(dx, dy)
+        if norm == 0:
+            distances = np.hypot(xs, ys)
+        else:
+            distances = np.abs(dy * xs - dx * ys) / norm
+        i = np.argmax(distances)
+        #a vertex never outweighs the one that split its segment
+        weight = min(distances[i], parent)
+        if weight <= floor:
+            continue
+        index = first + 1 + i
+        weights[index] = weight
+        stack.append((first, index, weight))
+        stack.append((index, last, weight))
+    return weights
+
+def _date_seconds(date):
+    '''
+    Seconds since 1900 of the start of a date
+    '''
+    return calendar.timegm(date.timetuple()) + COSMO_CONSTANT
+
+def get_deployments(ref):
+    '''
+    The deployments of a reference designator as (id, start, end) in
+    seconds since 1900, in start order. end is None while the deployment
+    runs; an end date counts in full. Without any deployment recorded the
+    whole stream is one deployment, (None, None, None).
+    '''
+    deployments = []
+    for deployment in InstrumentDeployment.query.filter_by(reference_designator=ref) \
+            .order_by(InstrumentDeployment.start_date).all():
+        start = _date_seconds(deployment.start_date) if deployment.start_date else None
+        end = _date_seconds(deployment.end_date + timedelta(days=1)) if deployment.end_date else None
+        deployments.append((deployment.id, start, end))
+    return deployments or [(None, None, None)]
+
+def get_track(stream, ref, lat_field, lon_field, start=None, end=None):
+    '''
+    The track between start and end as time, lat, lon and Douglas-Peucker
+    weight arrays, holding only the vertices needed at MAX_ZOOM, and the
+    number of valid positions
+    '''
+    url = get_uframe_data_url(stream, ref, start, end)
+    pref_timestamp, t, columns = fetch_uframe_columns(url, [lat_field, lon_field], start, end)
+    lat = columns[lat_field]
+    lon = columns[lon_field]
+    if lat.dtype != np.float64 or lon.dtype != np.float64:
+        raise ValueError('position fields must be numeric')
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+    t, lat, lon = t[valid], lat[valid], lon[valid]
+    weights = simplification_weights(lon, lat, zoom_tolerance(MAX_ZOOM))
+    kept = weights > 0
+    return t[kept], lat[kept], lon[kept], weights[kept], len(t)
+
+def get_trajectory(stream, ref, lat_field, lon_field):
+    '''
+    The tracks of the deployments of a platform, as a list of
+    (deployment id, start, end, track), see get_deployments and get_track.
+    Cached per deployment and position fields.
+    '''
+    now = time.time() + COSMO_CONSTANT
+    tracks = []
+    for deployment_id, start, end in get_deployments(ref):
+        ended = end is not None and end <= now
+        #the dates are in the key, so an edited deployment is fetched again
+        key = make_key('trajectory', [stream, ref, lat_field, lon_field, deployment_id, start, end])
+        track = get_or_set('trajectory', key, ENDED_TRACK_TIMEOUT if ended else TRACK_TIMEOUT,
+                           lambda: get_track(stream, ref, lat_field, lon_field, start, end))
+        tracks.append((deployment_id, start, end, track))
+    return tracks
+
+def simplify_for_zoom(trajectory, zoom):
+    '''
+    The vertices of a cached trajectory needed at a zoom level
+    '''
+    t, lat, lon, weights, total = trajectory
+    kept = weights > zoom_tolerance(zoom)
+    return t[kept], lat[kept], lon[kept]
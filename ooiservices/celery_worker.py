@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+'''
+Celery worker entry point. Creates the application so tasks run with its
+configuration and inside an application context.
+
+    celery worker --app=ooiservices.celery_worker.celery
+    celery beat --app=ooiservices.celery_worker.celery
+'''
+import os
+from ooiservices.app import create_app, celery
+
+app = create_app(os.environ.get('OOISERVICES_CONFIG', 'LOCAL_DEVELOPMENT'))
+app.app_context().push()
@@ -230,6 +230,95 @@ def load_data():
         except Exception, err:
             app.logger.error('Bulk test data failed: ' + err.message)
 
+@manager.option('-n', '--top', default=None)
+def warm_cache(top):
+    '''
+    Warms the caches of the most requested streams, as the scheduled celery
+    task does. Run at deploy time.
+    usage: python manage.py warm_cache --top 20
+    '''
+    from ooiservices.app.uframe.tasks import warm_streams
+    top_n = int(top) if top else app.config['CACHE_WARM_TOP_N']
+    warmed = warm_streams(top_n)
+    app.logger.info('Warmed streams: %s' % ', '.join(warmed))
+
+@manager.command
+def index_parameters():
+    '''
+    Builds or refreshes the parameter search index, as the scheduled celery
+    task does
+    usage: python manage.py index_parameters
+    '''
+    from ooiservices.app.uframe.param_index import refresh_index
+    added, updated, removed = refresh_index()
+    app.logger.info('Parameter index: %d added, %d updated, %d removed' % (added, updated, removed))
+
+@manager.command
+def cache_stats():
+    '''
+    Prints hits, misses, expirations, evictions, entries and bytes for each cache
+    usage: python manage.py cache_stats
+    '''
+    from ooiservices.app.cache_metrics import get_cache_stats
+    for name, stats in sorted(get_cache_stats().iteritems()):
+        print '%-24s %s' % (name, ' '.join('%s=%s' % kv for kv in sorted(stats.iteritems())))
+
+@manager.option('-n', '--name', default=None)
+@manager.option('-s', '--stream', default=None)
+@manager.option('-r', '--ref', default=None)
+@manager.option('-p', '--pattern', default=None)
+def invalidate_cache(name, stream, ref, pattern):
+    '''
+    Deletes cached entries by stream, reference designator or key pattern
+    usage: python manage.py invalidate_cache --stream ctdbp_cdef_instrument
+           python manage.py invalidate_cache --name uframe_stream_contents --pattern '*CP02PMUO*'
+    '''
+    from ooiservices.app.cache_metrics import invalidate
+    if not (stream or ref or pattern):
+        print 'One of --stream, --ref or --pattern is required'
+        return
+    deleted = invalidate(name=name, stream=stream, ref=ref, pattern=pattern)
+    app.logger.info('Invalidated %d cache entries' % len(deleted))
+    for key in deleted:
+        print key
+
+@manager.command
+def startup_benchmark(config='TESTING_CONFIG', runs=5):
+    '''
+    Times worker start up in fresh interpreters: package import, create_app
+    and the first request of each blueprint (median of runs), with the
+    heavy modules loaded at each point
+    usage: python manage.py startup_benchmark --config PRODUCTION --runs 10
+    '''
+    import subprocess
+    import json
+    import sys
+    from ooiservices.startup_benchmark import probe_urls
+
+    def measure(blueprint=None):
+        command = [sys.executable, '-m', 'ooiservices.startup_benchmark', config]
+        if blueprint:
+            command.append(blueprint)
+        results = []
+        for i in range(int(runs)):
+            output = subprocess.check_output(command, cwd=os.path.dirname(basedir))
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        return results
+
+    def median(values):
+        return sorted(values)[len(values) // 2]
+
+    boot = measure()
+    print '%-24s %8.3fs' % ('import', median([r['import'] for r in boot]))
+    print '%-24s %8.3fs  loaded: %s' % ('create_app', median([r['create_app'] for r in boot]),
+                                         ', '.join(boot[-1]['loaded_at_boot']) or '-')
+    for blueprint, url in sorted(probe_urls(app).iteritems()):
+        first = [r['first_request'] for r in measure(blueprint)]
+        print '%-24s %8.3fs  loaded: %s  (%s -> %s)' % ('first request ' + blueprint,
+                                                         median([f['seconds'] for f in first]),
+                                                         ', '.join(first[-1]['loaded']) or '-',
+                                                         url, first[-1]['status'])
+
 @manager.command
 def profile(length=25, profile_dir=None):
     """Start the application under the code profiler."""
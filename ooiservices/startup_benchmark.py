@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+'''
+Worker start up benchmark. Run in a fresh interpreter, it times importing
+the application package, create_app and the first request of a blueprint,
+and reports which of the heavy scientific modules got loaded on the way.
+Prints one JSON document; see manage.py startup_benchmark.
+
+    python -m ooiservices.startup_benchmark <config name> [blueprint]
+'''
+import time
+started = time.time()
+import json
+import sys
+
+HEAVY_MODULES = ['numpy', 'matplotlib', 'prettyplotlib', 'netCDF4']
+
+
+def loaded_heavy_modules():
+    return [m for m in HEAVY_MODULES if m in sys.modules]
+
+def probe_urls(app):
+    '''
+    blueprint -> the first GET url without arguments of the blueprint
+    '''
+    urls = {}
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        blueprint = rule.endpoint.split('.', 1)[0] if '.' in rule.endpoint else None
+        if blueprint and blueprint not in urls and 'GET' in rule.methods and not rule.arguments:
+            urls[blueprint] = rule.rule
+    return urls
+
+def run(config_name, blueprint=None):
+    from ooiservices.app import create_app
+    imported = time.time()
+    app = create_app(config_name)
+    created = time.time()
+    result = {'import': imported - started,
+              'create_app': created - imported,
+              'loaded_at_boot': loaded_heavy_modules(),
+              'first_request': None}
+    if blueprint is None:
+        return result
+
+    url = probe_urls(app)[blueprint]
+    before = time.time()
+    try:
+        status = app.test_client().get(url).status_code
+    except Exception, e:
+        status = 'error: %s' % e
+    result['first_request'] = {'url': url,
+                               'status': status,
+                               'seconds': time.time() - before,
+                               'loaded': loaded_heavy_modules()}
+    return result
+
+if __name__ == '__main__':
+    print json.dumps(run(*sys.argv[1:3]))
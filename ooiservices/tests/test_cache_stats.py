@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+'''
+unit testing for the cache metrics
+
+'''
+
+import unittest
+import numpy as np
+from base64 import b64encode
+from flask import url_for
+from ooiservices.app import create_app, db, cache
+from ooiservices.app.models import User, UserScope
+from ooiservices.app import cache_metrics
+from ooiservices.app.cache_metrics import make_key, _sizeof, lookup, store, get_cache_stats, invalidate
+from ooiservices.app.cache_metrics import CACHE_SIZES_KEY, CACHE_EXPIRY_KEY
+
+class FakePipeline(object):
+    '''
+    Queues the commands of a FakeRedis until execute
+    '''
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.redis, name), args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+class FakeRedis(object):
+    '''
+    The set, hash and sorted set commands of the cache metrics, in memory
+    '''
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def sadd(self, name, *values):
+        self.data.setdefault(name, set()).update(values)
+
+    def smembers(self, name):
+        return set(self.data.get(name, set()))
+
+    def hincrby(self, name, key, amount=1):
+        counts = self.data.setdefault(name, {})
+        counts[key] = counts.get(key, 0) + amount
+        return counts[key]
+
+    def hset(self, name, key, value):
+        self.data.setdefault(name, {})[key] = value
+
+    def hgetall(self, name):
+        return dict(self.data.get(name, {}))
+
+    def hdel(self, name, *keys):
+        return len([self.data.get(name, {}).pop(key) for key in keys if key in self.data.get(name, {})])
+
+    def delete(self, name):
+        self.data.pop(name, None)
+
+    def zadd(self, name, **scores):
+        self.data.setdefault(name, {}).update(scores)
+        return len(scores)
+
+    def zscore(self, name, value):
+        return self.data.get(name, {}).get(value)
+
+    def zrem(self, name, *values):
+        scores = self.data.get(name, {})
+        return len([scores.pop(value) for value in values if value in scores])
+
+    def zrangebyscore(self, name, low, high):
+        scores = self.data.get(name, {})
+        return sorted((m for m in scores if float(low) <= scores[m] <= float(high)), key=scores.get)
+
+    def zremrangebyscore(self, name, low, high):
+        return self.zrem(name, *self.zrangebyscore(name, low, high))
+
+class CacheStatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client(use_cookies=False)
+        User.insert_user(username='admin', password='test')
+        UserScope.insert_scopes()
+        self.redis_store = cache_metrics.redis_store
+        cache_metrics.redis_store = FakeRedis()
+
+    def tearDown(self):
+        cache_metrics.redis_store = self.redis_store
+        cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_api_headers(self, username, password):
+        return {
+            'Authorization': 'Basic ' + b64encode(
+                (username + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+    def test_cache_stats_requires_user_admin(self):
+        headers = self.get_api_headers('admin', 'test')
+        response = self.client.get(url_for('main.get_cache_stats_route'), headers=headers)
+        self.assertEqual(response.status_code, 403)
+
+    def test_make_key(self):
+        key = make_key('uframe_stream_contents', ['ctdbp_cdef_instrument', 'CP02PMUO-WFP01-03-CTDPFK000'])
+        self.assertEqual(key, 'uframe_stream_contents:ctdbp_cdef_instrument:CP02PMUO-WFP01-03-CTDPFK000')
+
+    def test_sizeof_arrays(self):
+        value = ('internal_timestamp', np.zeros(10), {'temp': np.zeros(5)})
+        self.assertTrue(_sizeof(value) >= 15 * 8)
+
+    def expire(self, name, key):
+        '''
+        Ages the index entry of key past its timeout
+        '''
+        expires = cache_metrics.redis_store.zscore(CACHE_EXPIRY_KEY % name, key)
+        cache_metrics.redis_store.zadd(CACHE_EXPIRY_KEY % name, **{key: expires - 7200})
+
+    def test_lookup_accounting(self):
+        key = make_key('test_cache', ['ctdbp_cdef_instrument', 'CP02PMUO-WFP01-03-CTDPFK000'])
+        self.assertIsNone(lookup('test_cache', key))
+        store('test_cache', key, 'contents', 3600)
+        self.assertEqual(lookup('test_cache', key), 'contents')
+        #dropped by the backend before its timeout
+        cache.delete(key)
+        self.assertIsNone(lookup('test_cache', key))
+        #past its timeout
+        store('test_cache', key, 'contents', 3600)
+        self.expire('test_cache', key)
+        cache.delete(key)
+        self.assertIsNone(lookup('test_cache', key))
+        #each loss is counted once
+        self.assertIsNone(lookup('test_cache', key))
+        stats = get_cache_stats()['test_cache']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 4))
+        self.assertEqual((stats['evictions'], stats['expirations']), (1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.2)
+        self.assertEqual(stats['entries'], 0)
+
+    def test_stats_entries(self):
+        store('test_cache', make_key('test_cache', ['a']), np.zeros(10), 3600)
+        store('test_cache', make_key('test_cache', ['b']), np.zeros(20), 3600)
+        store('test_cache', make_key('test_cache', ['c']), np.zeros(30), 3600)
+        self.expire('test_cache', make_key('test_cache', ['c']))
+        lookup('test_cache', make_key('test_cache', ['a']))
+        stats = get_cache_stats()['test_cache']
+        self.assertEqual((stats['entries'], stats['bytes']), (2, 30 * 8))
+        #the entry past its timeout is pruned from the index as an expiration
+        self.assertEqual((stats['expirations'], stats['evictions']), (1, 0))
+
+    def test_store_prunes_index(self):
+        store('test_cache', make_key('test_cache', ['a']), 'contents', 3600)
+        self.expire('test_cache', make_key('test_cache', ['a']))
+        store('test_cache', make_key('test_cache', ['b']), 'contents', 3600)
+        #the index only holds the live entry, without a stats call
+        redis = cache_metrics.redis_store
+        self.assertEqual(redis.hgetall(CACHE_SIZES_KEY % 'test_cache').keys(), ['test_cache:b'])
+        self.assertEqual(redis.zrangebyscore(CACHE_EXPIRY_KEY % 'test_cache', '-inf', 'inf'), ['test_cache:b'])
+        self.assertEqual(redis.hgetall('ooiservices:cache_stats:test_cache')['expirations'], 1)
+
+    def test_invalidate(self):
+        keys = [make_key('test_cache', [stream, 'CP02PMUO-WFP01-03-CTDPFK000'])
+                for stream in ('ctdbp_cdef_instrument', 'flort_kn_instrument')]
+        for key in keys:
+            lookup('test_cache', key)
+            store('test_cache', key, 'contents', 3600)
+        self.assertEqual(invalidate(stream='ctdbp_cdef_instrument'), [keys[0]])
+        self.assertIsNone(cache.get(keys[0]))
+        self.assertEqual(cache.get(keys[1]), 'contents')
+        self.assertEqual(sorted(invalidate(name='test_cache', pattern='*CP02PMUO*')), [keys[1]])
+        self.assertEqual(get_cache_stats()['test_cache']['entries'], 0)
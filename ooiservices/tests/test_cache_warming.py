@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+'''
+unit testing for the stream request ranking and the cache warmer
+
+'''
+
+import unittest
+import shutil
+import json
+from ooiservices.app import create_app, cache, basedir
+from ooiservices.app import cache_metrics
+from ooiservices.app.cache_metrics import make_key
+from ooiservices.app.uframe import data, tasks, controller
+from ooiservices.app.uframe.data import record_stream_request, get_popular_streams
+from ooiservices.app.uframe.chunk_store import get_chunk_store
+from ooiservices.app.uframe.tasks import warm_streams
+
+RECORDS = [{'preferred_timestamp': 'internal_timestamp', 'internal_timestamp': 3600000000.0 + i, 'temp': float(i)}
+           for i in range(10)]
+
+class FakePipeline(object):
+    '''
+    Queues the commands of a FakeRedis until execute
+    '''
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.redis, name), args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+class FakeRedis(object):
+    '''
+    The sorted set, set and hash commands of the request ranking and the
+    cache metrics, in memory
+    '''
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def zincrby(self, name, value, amount=1):
+        scores = self.data.setdefault(name, {})
+        scores[value] = scores.get(value, 0) + amount
+        return scores[value]
+
+    def zrevrange(self, name, start, end):
+        scores = self.data.get(name, {})
+        members = sorted(scores, key=lambda m: (-scores[m], m))
+        return members[start:end + 1]
+
+    def zunionstore(self, dest, keys):
+        scores = {}
+        for key, weight in keys.iteritems():
+            for member, score in self.data.get(key, {}).iteritems():
+                scores[member] = scores.get(member, 0) + score * weight
+        self.data[dest] = scores
+
+    def sadd(self, name, *values):
+        self.data.setdefault(name, set()).update(values)
+
+    def hincrby(self, name, key, amount=1):
+        counts = self.data.setdefault(name, {})
+        counts[key] = counts.get(key, 0) + amount
+
+    def hset(self, name, key, value):
+        self.data.setdefault(name, {})[key] = value
+
+    def hdel(self, name, *keys):
+        for key in keys:
+            self.data.get(name, {}).pop(key, None)
+
+    def zadd(self, name, **scores):
+        self.data.setdefault(name, {}).update(scores)
+        return len(scores)
+
+    def zscore(self, name, value):
+        return self.data.get(name, {}).get(value)
+
+    def zrem(self, name, *values):
+        scores = self.data.get(name, {})
+        return len([scores.pop(value) for value in values if value in scores])
+
+    def zrangebyscore(self, name, low, high):
+        scores = self.data.get(name, {})
+        return sorted((m for m in scores if float(low) <= scores[m] <= float(high)), key=scores.get)
+
+    def zremrangebyscore(self, name, low, high):
+        return self.zrem(name, *self.zrangebyscore(name, low, high))
+
+class FakeResponse(object):
+    def __init__(self, body):
+        self.body = body
+        self.status_code = 200
+
+    def json(self):
+        return json.loads(self.body)
+
+class CacheWarmingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app.config['CHUNK_STORE_DIR'] = '/chunks_test/'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.redis = FakeRedis()
+        self.patched = [(module, name, getattr(module, name)) for module, name in
+                        [(data, 'redis_store'), (tasks, 'redis_store'), (cache_metrics, 'redis_store'),
+                         (controller, 'traced_get')]]
+        data.redis_store = tasks.redis_store = cache_metrics.redis_store = self.redis
+        self.fetched = []
+        controller.traced_get = self.fake_traced_get
+
+    def tearDown(self):
+        for module, name, value in self.patched:
+            setattr(module, name, value)
+        cache.clear()
+        shutil.rmtree(basedir + '/chunks_test/', ignore_errors=True)
+        self.app_context.pop()
+
+    def fake_traced_get(self, url):
+        stream, ref = url.split('/')[-2:]
+        self.fetched.append('/'.join([stream, ref]))
+        return FakeResponse(json.dumps(RECORDS))
+
+    def request(self, stream, ref, times):
+        for i in range(times):
+            record_stream_request(stream, ref)
+
+    def test_ranking(self):
+        self.request('ctdbp_cdef_instrument', 'CP02PMUO-WFP01-03-CTDPFK000', 3)
+        self.request('flort_kn_instrument', 'CP02PMUO-WFP01-01-FLORDL000', 5)
+        self.request('dofst_k_instrument', 'CP02PMUO-WFP01-02-DOFSTK000', 1)
+        self.assertEqual(get_popular_streams(2), [('flort_kn_instrument', 'CP02PMUO-WFP01-01-FLORDL000'),
+                                                  ('ctdbp_cdef_instrument', 'CP02PMUO-WFP01-03-CTDPFK000')])
+
+    def test_warm_streams(self):
+        self.request('ctdbp_cdef_instrument', 'CP02PMUO-WFP01-03-CTDPFK000', 3)
+        self.request('flort_kn_instrument', 'CP02PMUO-WFP01-01-FLORDL000', 5)
+        self.request('dofst_k_instrument', 'CP02PMUO-WFP01-02-DOFSTK000', 1)
+        warmed = warm_streams(2)
+        #only the top 2 are fetched
+        self.assertEqual(warmed, ['flort_kn_instrument/CP02PMUO-WFP01-01-FLORDL000',
+                                  'ctdbp_cdef_instrument/CP02PMUO-WFP01-03-CTDPFK000'])
+        self.assertEqual(self.fetched, warmed)
+
+        for stream, ref in [('flort_kn_instrument', 'CP02PMUO-WFP01-01-FLORDL000'),
+                            ('ctdbp_cdef_instrument', 'CP02PMUO-WFP01-03-CTDPFK000')]:
+            key = make_key('uframe_stream_contents', [stream, ref])
+            self.assertIsNotNone(cache.get(key))
+            #the chunk store answers without going to uframe
+            t, columns = get_chunk_store().read(stream, ref, ['temp'], 3600000000.0, 3600000010.0, None)
+            self.assertEqual(columns['temp'].tolist(), [float(i) for i in range(10)])
+        self.assertIsNone(cache.get(make_key('uframe_stream_contents',
+                                             ['dofst_k_instrument', 'CP02PMUO-WFP01-02-DOFSTK000'])))
+
+        #the request counts are halved, keeping the order
+        scores = self.redis.data[data.STREAM_REQUESTS_KEY]
+        self.assertEqual(scores['flort_kn_instrument/CP02PMUO-WFP01-01-FLORDL000'], 2.5)
+        self.assertEqual(scores['dofst_k_instrument/CP02PMUO-WFP01-02-DOFSTK000'], 0.5)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+'''
+unit testing for the memory-mapped stream chunk store
+
+'''
+
+import unittest
+import shutil
+import tempfile
+import os
+import time
+import numpy as np
+from ooiservices.app import create_app
+from ooiservices.app.uframe.chunk_store import ChunkStore
+from ooiservices.app.uframe.times import COSMO_CONSTANT
+
+class ChunkStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.root = tempfile.mkdtemp()
+        self.store = ChunkStore(self.root, 100, 10 ** 9)
+        self.fetches = []
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.app_context.pop()
+
+    def fetch(self, start, end):
+        self.fetches.append((start, end))
+        return [{'preferred_timestamp': 'internal_timestamp',
+                 'internal_timestamp': float(t),
+                 'temp': t * 2.} for t in range(50, 450, 10) if start <= t < end]
+
+    def test_read_window(self):
+        t, columns = self.store.read('stream', 'ref', ['temp'], 120, 260, self.fetch)
+        self.assertEqual(t[0], 120.)
+        self.assertEqual(t[-1], 250.)
+        self.assertEqual(columns['temp'].tolist(), (t * 2).tolist())
+
+    def test_historic_chunks_are_not_refetched(self):
+        self.store.read('stream', 'ref', ['temp'], 120, 260, self.fetch)
+        t, columns = self.store.read('stream', 'ref', ['temp'], 130, 180, self.fetch)
+        self.assertEqual(len(self.fetches), 1)
+        self.assertTrue(isinstance(columns['temp'], np.memmap))
+        self.assertEqual(t.tolist(), [130., 140., 150., 160., 170.])
+
+    def test_evict_least_recently_read(self):
+        self.store.read('stream', 'ref', ['temp'], 50, 450, self.fetch)
+        self.store.budget_bytes = 0
+        self.store.evict()
+        chunks = [d for d in os.listdir(os.path.join(self.root, 'stream', 'ref')) if d.isdigit()]
+        self.assertEqual(chunks, [])
+
+    def test_live_chunk_fetches_its_range(self):
+        store = ChunkStore(self.root, 10 ** 9, 10 ** 9)
+        now = time.time() + COSMO_CONSTANT
+        live = int(now // 10 ** 9) * 10 ** 9
+        fetch = lambda start, end: self.fetch(start, end) + [
+            {'preferred_timestamp': 'internal_timestamp', 'internal_timestamp': t, 'temp': 0.}
+            for t in (live + 1., now - 1.) if start <= t < end]
+        store.read('stream', 'ref', ['temp'], 0, now, fetch)
+        #the first read fetches the history, later ones only the live chunk
+        self.assertEqual(self.fetches[0][0], 0)
+        t, columns = store.read('stream', 'ref', ['temp'], 120, now, fetch)
+        self.assertEqual(self.fetches[-1], (live, live + 10 ** 9))
+        self.assertEqual(t[0], 120.)
+        self.assertEqual(t[-1], now - 1.)
+        self.assertEqual(store.timestamp_field('stream', 'ref'), 'internal_timestamp')
+
+    def test_tracked_size(self):
+        self.store.read('stream', 'ref', ['temp'], 50, 450, self.fetch)
+        self.assertEqual(self.store.stored_bytes, self.store.usage()[1])
+        self.store.read('stream', 'ref2', ['temp'], 50, 450, self.fetch)
+        self.assertEqual(self.store.stored_bytes, self.store.usage()[1])
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+'''
+unit testing for the worker start up imports
+
+'''
+
+import unittest
+import subprocess
+import json
+import sys
+import os
+from ooiservices.app import create_app
+from ooiservices.app.uframe.render_pool import get_renderer, RENDERERS
+from ooiservices.startup_benchmark import probe_urls
+
+class StartupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_no_plotting_at_boot(self):
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.check_output([sys.executable, '-m', 'ooiservices.startup_benchmark', 'TESTING_CONFIG'],
+                                         cwd=root)
+        result = json.loads(output.strip().splitlines()[-1])
+        for module in ('matplotlib', 'prettyplotlib', 'netCDF4'):
+            self.assertNotIn(module, result['loaded_at_boot'])
+
+    def test_renderers(self):
+        for renderer in RENDERERS:
+            self.assertTrue(callable(get_renderer(renderer)))
+
+    def test_probe_urls(self):
+        urls = probe_urls(self.app)
+        self.assertIn('uframe', urls)
+        self.assertTrue(urls['uframe'].startswith('/uframe/'))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+'''
+unit testing for the request tracing
+
+'''
+
+import unittest
+from ooiservices.app import create_app
+from ooiservices.app.tracing import Trace, span, traced, current_trace
+
+class TracingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_summary(self):
+        trace = Trace()
+        for i in range(3):
+            with trace.span('http', url='http://localhost:12570/sensor/inv'):
+                pass
+        with trace.span('decode'):
+            pass
+        summary = trace.summary()
+        self.assertEqual(summary['http'][1], 3)
+        self.assertEqual(summary['decode'][1], 1)
+        header = trace.server_timing()
+        self.assertTrue(header.startswith('decode;dur='))
+        self.assertTrue('desc="3 calls"' in header)
+        self.assertTrue('total;dur=' in header)
+
+    def test_span_without_trace(self):
+        with span('http', url='http://localhost') as record:
+            record['status'] = 200
+        self.assertEqual(current_trace(), None)
+
+    def test_traced_binds_trace(self):
+        trace = Trace()
+        def work():
+            with span('http'):
+                return current_trace()
+        self.assertTrue(traced(trace, work)() is trace)
+        self.assertEqual(len(trace.spans), 1)
+        self.assertEqual(current_trace(), None)
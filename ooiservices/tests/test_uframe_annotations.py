@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+'''
+unit testing for the annotation overlay of data responses
+
+'''
+
+import unittest
+import numpy as np
+from ooiservices.app import create_app
+from ooiservices.app.uframe.data import annotation_times, match_annotations, COSMO_CONSTANT
+
+class UframeAnnotationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_annotation_times(self):
+        annotations = [{'field_x': 'internal_timestamp', 'field_y': 'temp', 'pos_x': '1970-01-01T00:01:00'},
+                       {'field_x': 'internal_timestamp', 'field_y': 'temp', 'pos_x': COSMO_CONSTANT + 10},
+                       {'field_x': 'port_timestamp', 'field_y': 'pressure', 'pos_x': '1970-01-01T00:00:30'},
+                       {'field_x': 'internal_timestamp', 'field_y': 'temp', 'pos_x': None}]
+        matching, times = annotation_times(annotations, 'internal_timestamp', 'temp')
+        self.assertEqual(times.tolist(), [COSMO_CONSTANT + 10, COSMO_CONSTANT + 60])
+        self.assertEqual(matching[0]['pos_x'], COSMO_CONSTANT + 10)
+
+    def test_match_annotations(self):
+        an_times = np.array([10., 60.])
+        index = match_annotations([5., 10.4, 11., 60.9, 70.], an_times)
+        self.assertEqual(index.tolist(), [-1, 0, -1, 1, -1])
+        self.assertEqual(match_annotations([1., 2.], np.array([])).tolist(), [-1, -1])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+'''
+unit testing for the batch plot endpoint
+
+'''
+
+import unittest
+import json
+import io
+import numpy as np
+from base64 import b64encode
+from flask import url_for
+from ooiservices.app import create_app, db
+from ooiservices.app.models import User, UserScope
+from ooiservices.app.uframe import controller, render_pool
+
+def fake_fetch_uframe_columns(url, fields, start=None, end=None):
+    t = 3600000000.0 + np.arange(10.)
+    return 'internal_timestamp', t, dict((f, np.arange(10.)) for f in fields)
+
+def fake_renderer(title, *args):
+    if title == 'broken':
+        raise ValueError('cannot render %s' % title)
+    return io.BytesIO('<svg>%s</svg>' % title)
+
+class UframeBatchPlotsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client(use_cookies=False)
+        User.insert_user(username='admin', password='test')
+        UserScope.insert_scopes()
+        self.fetch_uframe_columns = controller.fetch_uframe_columns
+        self.get_renderer = render_pool.get_renderer
+        controller.fetch_uframe_columns = fake_fetch_uframe_columns
+        render_pool.get_renderer = lambda renderer: fake_renderer
+
+    def tearDown(self):
+        controller.fetch_uframe_columns = self.fetch_uframe_columns
+        render_pool.get_renderer = self.get_renderer
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_api_headers(self, username, password):
+        return {
+            'Authorization': 'Basic ' + b64encode(
+                (username + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+    def test_invalid_batches(self):
+        headers = self.get_api_headers('admin', 'test')
+        url = url_for('uframe.get_batch_plots')
+        response = self.client.post(url, headers=headers, data='not json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, headers=headers, data=json.dumps({'plots': []}))
+        self.assertEqual(response.status_code, 400)
+        plots = [{'instrument': 'CP02PMUO-WFP01-03-CTDPFK000', 'stream': 'ctdpf_ckl_wfp_instrument'}]
+        response = self.client.post(url, headers=headers, data=json.dumps({'plots': plots}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_failed_plot(self):
+        headers = self.get_api_headers('admin', 'test')
+        url = url_for('uframe.get_batch_plots')
+        plots = [{'id': name, 'instrument': 'CP02PMUO-WFP01-03-CTDPFK000', 'stream': 'ctdpf_ckl_wfp_instrument',
+                  'yvar': 'temperature', 'title': name} for name in ('first', 'broken', 'last')]
+        response = self.client.post(url, headers=headers, data=json.dumps({'plots': plots}))
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.data)['plots']
+        self.assertIn('error', results['broken'])
+        self.assertEqual(results['first']['image'], '<svg>first</svg>')
+        self.assertEqual(results['last']['image'], '<svg>last</svg>')
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+'''
+unit testing for the incremental decoding of uframe responses
+
+'''
+
+import unittest
+import json
+from ooiservices.app import create_app
+from ooiservices.app.uframe.data import iter_uframe_records
+
+class FakeResponse(object):
+    '''
+    Hands back a body in small chunks, as a slow socket would
+    '''
+    def __init__(self, body, chunk_size=5):
+        self.body = body
+        self.chunk_size = chunk_size
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), self.chunk_size):
+            yield self.body[i:i + self.chunk_size]
+
+class UframeDecodeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_records_across_chunks(self):
+        records = [{'preferred_timestamp': 'internal_timestamp',
+                    'internal_timestamp': float(i),
+                    'stream_name': u'ctd \xe9'} for i in range(50)]
+        body = json.dumps(records, ensure_ascii=False).encode('utf-8')
+        self.assertEqual(list(iter_uframe_records(FakeResponse(body))), records)
+
+    def test_empty_response(self):
+        self.assertEqual(list(iter_uframe_records(FakeResponse('[]'))), [])
+
+    def test_truncated_response(self):
+        records = iter_uframe_records(FakeResponse('[{"a": 1}, {"a": 2'))
+        self.assertEqual(next(records), {'a': 1})
+        self.assertRaises(ValueError, list, records)
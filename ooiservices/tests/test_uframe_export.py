@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+'''
+unit testing for the export jobs
+
+'''
+
+import unittest
+import json
+import shutil
+import time
+import os
+import io
+import zipfile
+import threading
+from base64 import b64encode
+from flask import url_for
+from ooiservices.app import create_app, db, basedir
+from ooiservices.app.models import User, UserScope
+from ooiservices.app.uframe import tasks, export
+from ooiservices.app.uframe.tasks import export_stream, cleanup_exports
+
+RECORDS = [{'preferred_timestamp': 'internal_timestamp', 'internal_timestamp': 3600000000.0 + i, 'temp': float(i)}
+           for i in range(10)]
+
+class FakeResponse(object):
+    '''
+    A streamed uframe response
+    '''
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+        self.headers = {'content-length': str(len(body))}
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise IOError('uframe returned %d' % self.status_code)
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+def fake_traced_get(url, **kwargs):
+    if 'missing_instrument' in url:
+        return FakeResponse('', 404)
+    return FakeResponse(json.dumps(RECORDS))
+
+class UframeExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app.config['EXPORT_DIR'] = '/exports_test/'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client(use_cookies=False)
+        User.insert_user(username='admin', password='test')
+        UserScope.insert_scopes()
+        self.fetched = []
+        self.patched = [(module, 'traced_get', module.traced_get) for module in (tasks, export)]
+        tasks.traced_get = self.fake_traced_get
+        export.traced_get = fake_traced_get
+
+    def tearDown(self):
+        for module, name, value in self.patched:
+            setattr(module, name, value)
+        shutil.rmtree(basedir + self.app.config['EXPORT_DIR'], ignore_errors=True)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def fake_traced_get(self, url, **kwargs):
+        self.fetched.append(url)
+        if 'format=' in url:
+            return FakeResponse('CDF\x01netcdf')
+        return fake_traced_get(url, **kwargs)
+
+    def get_api_headers(self, username, password):
+        return {
+            'Authorization': 'Basic ' + b64encode(
+                (username + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+    def test_invalid_exports(self):
+        headers = self.get_api_headers('admin', 'test')
+        url = url_for('uframe.submit_export')
+        invalid = ['not json',
+                   json.dumps({'stream': 'ctdpf_ckl_wfp_instrument'}),
+                   json.dumps({'stream': 'ctdpf_ckl_wfp_instrument', 'ref': 'CP02PMUO-WFP01-03-CTDPFK000',
+                               'format': 'xls'}),
+                   json.dumps({'stream': 'ctdpf_ckl_wfp_instrument', 'ref': 'CP02PMUO-WFP01-03-CTDPFK000',
+                               'startdate': '2014-01-01'})]
+        for data in invalid:
+            response = self.client.post(url, headers=headers, data=data)
+            self.assertEqual(response.status_code, 400)
+
+    def test_export_csv(self):
+        result = export_stream.apply(args=('ctdpf_ckl_wfp_instrument', 'CP02PMUO-WFP01-03-CTDPFK000', 'csv',
+                                           3600000002.0, 3600000005.0), task_id='test-export').get()
+        self.assertEqual(result['filename'], 'ctdpf_ckl_wfp_instrument-CP02PMUO-WFP01-03-CTDPFK000.csv')
+        with open(result['path']) as f:
+            lines = f.read().splitlines()
+        #the header and the rows inside the window
+        self.assertEqual(len(lines), 5)
+        self.assertFalse(os.path.exists(result['path'] + '.part'))
+        #the window goes to uframe
+        self.assertEqual(self.fetched, [self.app.config['UFRAME_URL'] + '/sensor/m2m/inv/ctdpf_ckl_wfp_instrument/'
+                                        'CP02PMUO-WFP01-03-CTDPFK000?beginDT=2014-01-29T16%3A00%3A02.000Z'
+                                        '&endDT=2014-01-29T16%3A00%3A05.000Z'])
+
+    def test_export_csv_extra_keys(self):
+        records = RECORDS[:2] + [dict(RECORDS[2], extra=1.0)]
+        tasks.traced_get = lambda url, **kwargs: FakeResponse(json.dumps(records))
+        result = export_stream.apply(args=('ctdpf_ckl_wfp_instrument', 'CP02PMUO-WFP01-03-CTDPFK000', 'csv'),
+                                     task_id='test-export').get()
+        with open(result['path']) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertNotIn('extra', lines[0])
+
+    def test_export_netcdf(self):
+        result = export_stream.apply(args=('ctdpf_ckl_wfp_instrument', 'CP02PMUO-WFP01-03-CTDPFK000', 'netcdf',
+                                           3600000002.0, None), task_id='test-export').get()
+        self.assertEqual(result['filename'], 'ctdpf_ckl_wfp_instrument-CP02PMUO-WFP01-03-CTDPFK000.nc')
+        with open(result['path'], 'rb') as f:
+            self.assertEqual(f.read(), 'CDF\x01netcdf')
+        self.assertEqual(self.fetched, [self.app.config['UFRAME_URL'] + '/sensor/m2m/inv/ctdpf_ckl_wfp_instrument/'
+                                        'CP02PMUO-WFP01-03-CTDPFK000?beginDT=2014-01-29T16%3A00%3A02.000Z'
+                                        '&format=application%2Fnetcdf3'])
+
+    def test_cleanup_exports(self):
+        export_dir = tasks.get_export_dir()
+        old = os.path.join(export_dir, 'old.csv')
+        new = os.path.join(export_dir, 'new.csv')
+        for path in (old, new):
+            open(path, 'w').close()
+        expired = time.time() - self.app.config['EXPORT_TTL'] - 60
+        os.utime(old, (expired, expired))
+        self.assertEqual(cleanup_exports(), 1)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+
+    def test_bulk_export(self):
+        headers = self.get_api_headers('admin', 'test')
+        url = url_for('uframe.get_bulk_export', streams=['ctdpf_ckl_wfp_instrument/CP02PMUO-WFP01-03-CTDPFK000',
+                                                         'missing_instrument/CP02PMUO-WFP01-03-CTDPFK000'])
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(response.data))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(sorted(archive.namelist()),
+                         ['ctdpf_ckl_wfp_instrument-CP02PMUO-WFP01-03-CTDPFK000.csv',
+                          'missing_instrument-CP02PMUO-WFP01-03-CTDPFK000.error.txt'])
+        rows = archive.read('ctdpf_ckl_wfp_instrument-CP02PMUO-WFP01-03-CTDPFK000.csv').splitlines()
+        self.assertEqual(len(rows), len(RECORDS) + 1)
+        self.assertIn('export failed', archive.read('missing_instrument-CP02PMUO-WFP01-03-CTDPFK000.error.txt'))
+
+    def test_bulk_export_pieces(self):
+        #a member is written in pieces, a failure part way adds an error member
+        body = json.dumps(RECORDS)
+        export.traced_get = lambda url, **kwargs: FakeResponse(body[:-20])
+        export_piece_size = export.EXPORT_PIECE_SIZE
+        export.EXPORT_PIECE_SIZE = 100
+        try:
+            members = list((filename, list(pieces)) for filename, pieces in export._iter_members([('a', 'url')]))
+        finally:
+            export.EXPORT_PIECE_SIZE = export_piece_size
+        self.assertEqual([filename for filename, pieces in members], ['a.csv', 'a.error.txt'])
+        self.assertTrue(len(members[0][1]) > 1)
+
+    def test_bulk_export_completion_order(self):
+        #a slow first stream does not hold up the others
+        started = threading.Event()
+        def slow_traced_get(url, **kwargs):
+            if url == 'slow':
+                started.wait(5)
+            return FakeResponse(json.dumps(RECORDS))
+        export.traced_get = slow_traced_get
+        names = []
+        for filename, pieces in export._iter_members([('slow', 'slow'), ('fast', 'fast')]):
+            names.append(filename)
+            list(pieces)
+            started.set()
+        self.assertEqual(names, ['fast.csv', 'slow.csv'])
+
+    def test_bulk_export_extra_keys(self):
+        #keys missing from the first record are left out
+        records = RECORDS[:2] + [dict(RECORDS[2], extra=1.)]
+        export.traced_get = lambda url, **kwargs: FakeResponse(json.dumps(records))
+        members = list((filename, ''.join(pieces)) for filename, pieces in export._iter_members([('a', 'url')]))
+        self.assertEqual([filename for filename, content in members], ['a.csv'])
+        self.assertEqual(len(members[0][1].splitlines()), 4)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+'''
+unit testing for the time alignment used by the multi-stream merge
+
+'''
+
+import unittest
+import numpy as np
+from ooiservices.app import create_app
+from ooiservices.app.uframe.data import to_columns, align_nearest, align_interp, nan_to_none
+
+class UframeMergeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_to_columns_sorts_by_preferred_timestamp(self):
+        data = [{'preferred_timestamp': 'internal_timestamp', 'internal_timestamp': 20.0, 'temp': 2.0},
+                {'preferred_timestamp': 'internal_timestamp', 'internal_timestamp': 10.0, 'temp': 1.0}]
+        pref_timestamp, t, cols = to_columns(data, ['temp'])
+        self.assertEqual(pref_timestamp, 'internal_timestamp')
+        self.assertEqual(t.tolist(), [10.0, 20.0])
+        self.assertEqual(cols['temp'].tolist(), [1.0, 2.0])
+
+    def test_align_nearest_within_tolerance(self):
+        t = np.array([0., 10., 20., 30.])
+        values = np.array([1., 2., 3., 4.])
+        base_t = np.array([4., 6., 16., 45.])
+        aligned = align_nearest(base_t, t, values, 5)
+        self.assertEqual(aligned[:3].tolist(), [1., 2., 3.])
+        self.assertTrue(np.isnan(aligned[3]))
+
+    def test_align_interp_outside_range_is_nan(self):
+        t = np.array([0., 10.])
+        values = np.array([0., 1.])
+        aligned = align_interp(np.array([-1., 5., 11.]), t, values)
+        self.assertEqual(nan_to_none(aligned), [None, 0.5, None])
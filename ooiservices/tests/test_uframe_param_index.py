@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+'''
+unit testing for the parameter search index
+
+'''
+
+import unittest
+from ooiservices.app import create_app
+from ooiservices.app.uframe import param_index
+from ooiservices.app.uframe.param_index import index_terms, search_parameters, MAX_SEARCH_LIMIT
+
+class FakeRedis(object):
+    '''
+    The sorted set lookups of the parameter search
+    '''
+    def __init__(self, terms):
+        self.terms = sorted(terms)
+        self.results = []
+
+    def zrangebylex(self, key, low, high, start, num):
+        terms = [t for t in self.terms if low[1:] <= t <= high[1:]]
+        return terms[start:start + num]
+
+    def pipeline(self):
+        return self
+
+    def smembers(self, key):
+        self.results.append(set(['ctdbp_cdef_instrument/CP02PMUO-WFP01-03-CTDPFK000']))
+
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+class UframeParamIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.redis_store = param_index.redis_store
+
+    def tearDown(self):
+        param_index.redis_store = self.redis_store
+        self.app_context.pop()
+
+    def test_index_terms(self):
+        variables = [u'preferred_timestamp', u'internal_timestamp', u'Pressure', u'quality_flag']
+        terms = index_terms(variables, set([u'sea_water_pressure']))
+        self.assertEqual(terms, set([u'internal_timestamp', u'pressure', u'sea_water_pressure']))
+
+    def test_search_limit(self):
+        param_index.redis_store = FakeRedis(['temp%04d' % i for i in range(MAX_SEARCH_LIMIT + 10)])
+        self.assertEqual(len(search_parameters('temp', 3)), 3)
+        self.assertEqual(len(search_parameters('temp', -1)), 1)
+        self.assertEqual(len(search_parameters('temp', 10 ** 6)), MAX_SEARCH_LIMIT)
+        term, pairs = search_parameters('TEMP0001', 10)[0]
+        self.assertEqual((term, pairs), ('temp0001', ['ctdbp_cdef_instrument/CP02PMUO-WFP01-03-CTDPFK000']))
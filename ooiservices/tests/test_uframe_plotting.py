@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+'''
+unit testing for the plot rendering
+
+'''
+
+import unittest
+import numpy as np
+from multiprocessing.pool import ThreadPool
+from ooiservices.app import create_app
+from ooiservices.app.uframe.plotting import generate_plot, decimate
+from ooiservices.app.uframe import render_pool
+from ooiservices.app.uframe.render_pool import render_plot, render_tile, plot_digest, SUBMIT_DPI
+from ooiservices.app.uframe.render_pool import render_scatter_plot, render_density_plot
+from ooiservices.app.uframe.data import density_grid
+from ooiservices.app.uframe.tiles import tile_range, TILE_ROOT_SECONDS
+
+class UframePlottingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.x = np.arange(3600000000., 3600000000. + 3 * 86400, 600)
+        self.y = np.sin(np.arange(len(self.x)) / 10.)
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_svg(self):
+        buf = generate_plot('Test', 'temp', self.x, self.y, 4, 3, 'svg')
+        self.assertTrue(buf.read().startswith('<?xml'))
+
+    def test_decimate_keeps_envelope(self):
+        x = np.arange(10.)
+        y = np.array([1., 5., 2., np.nan, np.nan, 3., 9., 0., 4., 4.])
+        dx, dy = decimate(x, y, 2)
+        self.assertEqual(dx.tolist(), [0., 1., 6., 7.])
+        self.assertEqual(dy.tolist(), [1., 5., 9., 0.])
+        #short series are drawn as they are
+        self.assertEqual(len(decimate(x, y, 5)[0]), 10)
+
+    def test_render_plot_inline(self):
+        #the testing config renders in the calling thread
+        image = render_plot('Test', 'temp', self.x.tolist(), self.y, 4, 3, 'png')
+        self.assertTrue(image.startswith('\x89PNG'))
+
+    def test_decimated_before_submission(self):
+        submitted = []
+        def renderer(*args):
+            submitted.append(args)
+            return generate_plot(*args)
+        get_renderer = render_pool.get_renderer
+        render_pool.get_renderer = lambda name: renderer
+        try:
+            x = np.arange(3600000000., 3600000000. + 100000)
+            render_plot('Test', 'temp', x, np.sin(x), 2, 1, 'png')
+        finally:
+            render_pool.get_renderer = get_renderer
+        title, ylabel, x_sent, y_sent, width_in, height_in, plot_format, points = submitted[0]
+        self.assertTrue(len(x_sent) <= 2 * 2 * SUBMIT_DPI)
+        self.assertEqual(points, 100000)
+
+    def test_renderer_failure(self):
+        def renderer(*args):
+            raise ValueError('bad plot')
+        get_renderer = render_pool.get_renderer
+        render_pool.get_renderer = lambda name: renderer
+        try:
+            #the plot routes answer a RuntimeError with a 400
+            with self.assertRaises(RuntimeError):
+                render_plot('Test', 'temp', self.x, self.y, 4, 3, 'png')
+        finally:
+            render_pool.get_renderer = get_renderer
+
+    def test_render_tile(self):
+        start, end = self.x[0], self.x[-1]
+        image = render_tile(self.x, self.y, start, end, -1., 1., 256, 256)
+        self.assertTrue(image.startswith('\x89PNG'))
+        #an empty tile is still an image
+        image = render_tile([], [], start, end, None, None, 256, 256)
+        self.assertTrue(image.startswith('\x89PNG'))
+
+    def test_density_grid(self):
+        x = np.array([0., 0.1, 0.9, 1., np.nan])
+        y = np.array([0., 0.2, 0.8, 1., 1.])
+        x_edges, y_edges, counts = density_grid(x, y, 2)
+        self.assertEqual(counts.tolist(), [[2., 0.], [0., 2.]])
+        self.assertEqual(x_edges.tolist(), [0., 0.5, 1.])
+
+    def test_render_scatter(self):
+        image = render_scatter_plot('Test', 'x', 'y', self.y[:-1], self.y[1:], 4, 4, 'png')
+        self.assertTrue(image.startswith('\x89PNG'))
+        x_edges, y_edges, counts = density_grid(self.y[:-1], self.y[1:], 50)
+        image = render_density_plot('Test', 'x', 'y', x_edges, y_edges, counts, 4, 4, 'svg')
+        self.assertTrue(image.startswith('<?xml'))
+
+    def test_tile_range(self):
+        self.assertEqual(tile_range(0, 0), (0, TILE_ROOT_SECONDS))
+        self.assertEqual(tile_range(1, 1), (TILE_ROOT_SECONDS / 2, TILE_ROOT_SECONDS))
+        #the tiles of a zoom level cover the parent tile
+        start, end = tile_range(3, 5)
+        self.assertEqual((tile_range(4, 10)[0], tile_range(4, 11)[1]), (start, end))
+
+    def test_plot_digest(self):
+        params = ['CP02PMUO-WFP01-03-CTDPFK000', 'ctdpf_ckl_wfp_instrument', 'temp', 400, 300, 'svg']
+        digest = plot_digest(params, self.x, self.y)
+        self.assertEqual(digest, plot_digest(params, self.x.tolist(), self.y.tolist()))
+        self.assertNotEqual(digest, plot_digest(params, self.x, self.y * 2))
+        self.assertNotEqual(digest, plot_digest(params[:-1] + ['png'], self.x, self.y))
+
+    def test_parallel_renders_match(self):
+        pool = ThreadPool(4)
+        try:
+            sizes = pool.map(lambda i: len(generate_plot('Test', 'temp', self.x, self.y, 4, 3, 'png').read()),
+                             range(8))
+        finally:
+            pool.close()
+        self.assertEqual(len(set(sizes)), 1)
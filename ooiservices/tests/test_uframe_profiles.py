@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+'''
+unit testing for the profile segmentation and binning
+
+'''
+
+import unittest
+import numpy as np
+from ooiservices.app import create_app
+from ooiservices.app.uframe.profiles import segment_profiles, bin_profiles, depth_edges
+from ooiservices.app.uframe.profiles import profile_plot_data, section_plot_data
+from ooiservices.app.uframe.render_pool import render_profile_plot, render_section_plot
+
+class UframeProfilesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        #four casts between 0 and 100 dbar, one sample a minute
+        n = 400
+        phase = np.arange(n) % 200
+        self.t = 3600000000. + np.arange(n) * 60.
+        self.depth = np.where(phase < 100, phase, 200 - phase) + np.random.RandomState(0).normal(0, 0.3, n)
+        self.temp = 20 - self.depth * 0.1
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_segment_profiles(self):
+        profile = segment_profiles(self.depth)
+        self.assertEqual(len(profile), len(self.depth))
+        self.assertEqual(profile.max(), 3)
+        #profiles are numbered in time order
+        self.assertTrue(np.all(np.diff(profile) >= 0))
+        self.assertTrue(np.all(np.abs(np.bincount(profile) - 100) <= 2))
+        #a parked profiler is one profile
+        self.assertEqual(segment_profiles(np.ones(10)).tolist(), [0] * 10)
+
+    def test_bin_profiles(self):
+        profile = np.array([0, 0, 0, 1, 1])
+        depth = np.array([0., 1., 10., 2., 9.])
+        values = np.array([1., 3., 5., np.nan, 7.])
+        grid, column = bin_profiles(profile, depth, values, np.array([0., 5., 10.]))
+        self.assertEqual(grid[0].tolist(), [2., 5.])
+        self.assertTrue(np.isnan(grid[1, 0]))
+        self.assertEqual(grid[1, 1], 7.)
+        #more profiles than columns share them
+        grid, column = bin_profiles(profile, depth, values, np.array([0., 5., 10.]), columns=1)
+        self.assertEqual(grid.tolist(), [[2., 6.]])
+
+    def test_bounded_output(self):
+        depth_centers, grid, times = profile_plot_data(self.t, self.depth, self.temp, 2, 10)
+        self.assertEqual(grid.shape, (2, 10))
+        self.assertEqual(len(times), 2)
+        t_edges, edges, grid = section_plot_data(self.t, self.depth, self.temp, 3, 10)
+        self.assertEqual(grid.shape, (3, 10))
+        self.assertEqual(len(t_edges), 4)
+        self.assertEqual(edges.tolist(), depth_edges(self.depth, 10).tolist())
+
+    def test_render(self):
+        depth_centers, grid, times = profile_plot_data(self.t, self.depth, self.temp, 3, 20)
+        image = render_profile_plot('Test', 'temp', 'pressure', depth_centers, grid, times, 4, 3, 'png')
+        self.assertTrue(image.startswith('\x89PNG'))
+        t_edges, edges, grid = section_plot_data(self.t, self.depth, self.temp, 50, 20)
+        image = render_section_plot('Test', 'temp', 'pressure', t_edges, edges, grid, 4, 3, 'svg')
+        self.assertTrue(image.startswith('<?xml'))
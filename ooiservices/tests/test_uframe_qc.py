@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+'''
+unit testing for the quality flag filtering
+
+'''
+
+import unittest
+import numpy as np
+from ooiservices.app import create_app
+from ooiservices.app.uframe.data import qc_rejected, apply_qc
+from ooiservices.app.uframe.controller import records_to_csv, convert_record_times
+
+class UframeQcTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_rejected_numeric_and_text_flags(self):
+        numeric = np.array([1., 4., 9., 4.])
+        self.assertEqual(qc_rejected(numeric, ['4', '9']).tolist(), [False, True, True, True])
+        text = np.array(['ok', 'bad', None, 'ok'], dtype=object)
+        self.assertEqual(qc_rejected(text, ['bad']).tolist(), [False, True, False, False])
+
+    def test_drop(self):
+        t = np.array([0., 1., 2.])
+        rejected = np.array([False, True, False])
+        t, columns = apply_qc(t, {'temp': np.array([10., 11., 12.])}, rejected, 'drop')
+        self.assertEqual(t.tolist(), [0., 2.])
+        self.assertEqual(columns['temp'].tolist(), [10., 12.])
+
+    def test_mask(self):
+        t = np.array([0., 1., 2.])
+        rejected = np.array([False, True, False])
+        columns = {'temp': np.array([10., 11., 12.]), 'name': np.array([u'a', u'b', u'c'])}
+        t, masked = apply_qc(t, columns, rejected, 'mask')
+        self.assertEqual(t.tolist(), [0., 1., 2.])
+        self.assertTrue(np.isnan(masked['temp'][1]))
+        self.assertEqual(masked['name'].tolist(), [u'a', None, u'c'])
+        self.assertEqual(columns['temp'][1], 11.)
+
+    def test_csv_all_rejected(self):
+        data = [{'preferred_timestamp': 'internal_timestamp', 'internal_timestamp': 3600000000.0 + i,
+                 'temp': 10. + i, 'quality_flag': 'bad'} for i in range(3)]
+        lines = records_to_csv(data, ['bad'], 'drop').splitlines()
+        #only the header is left
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(sorted(lines[0].split(',')), sorted(data[0].keys()))
+        self.assertEqual(len(records_to_csv(data, ['bad'], 'mask').splitlines()), 4)
+        self.assertEqual(records_to_csv([]), '')
+
+    def test_record_times(self):
+        data = [{'preferred_timestamp': 'internal_timestamp', 'internal_timestamp': 2208988800.0 + i,
+                 'port_timestamp': 2208988800.0} for i in range(2)]
+        self.assertEqual([d['internal_timestamp'] for d in convert_record_times(data, 'unix')], [0.0, 1.0])
+        #only the preferred timestamp is converted
+        self.assertEqual(data[1]['port_timestamp'], 2208988800.0)
+        data = [{'preferred_timestamp': 'internal_timestamp', 'internal_timestamp': 2208988800.0}]
+        self.assertIn('1970-01-01T00:00:00', records_to_csv(data, time_format='iso'))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+'''
+unit testing for regular-interval resampling of stream data
+
+'''
+
+import unittest
+import numpy as np
+from ooiservices.app import create_app, cache
+from ooiservices.app.uframe import data
+from ooiservices.app.uframe.data import resample, parse_interval, get_resampled_columns
+
+RECORDS = [{'preferred_timestamp': 'internal_timestamp', 'internal_timestamp': 3600000000.0 + i, 'temp': float(i)}
+           for i in range(10)]
+
+class UframeResampleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.t = np.array([0., 1., 2., 3., 10., 11., 20.])
+        self.columns = {'temp': np.array([4., 1., np.nan, 3., 5., np.nan, np.nan])}
+        self.urls = []
+        self.fetch_uframe_data = data.fetch_uframe_data
+        data.fetch_uframe_data = self.fake_fetch
+
+    def tearDown(self):
+        data.fetch_uframe_data = self.fetch_uframe_data
+        cache.clear()
+        self.app_context.pop()
+
+    def fake_fetch(self, url):
+        self.urls.append(url.split('?')[1] if '?' in url else '')
+        return RECORDS
+
+    def test_parse_interval(self):
+        self.assertEqual(parse_interval('1h'), 3600)
+        self.assertEqual(parse_interval('15m'), 900)
+        self.assertRaises(ValueError, parse_interval, '1w')
+        self.assertRaises(ValueError, parse_interval, 'h')
+
+    def test_resample_bins(self):
+        bin_t, resampled = resample(self.t, self.columns, 10, 'count')
+        self.assertEqual(bin_t.tolist(), [0., 10., 20.])
+        self.assertEqual(resampled['temp'].tolist(), [3., 1., 0.])
+
+    def test_resample_aggregates_ignore_nan(self):
+        self.assertEqual(resample(self.t, self.columns, 10, 'min')[1]['temp'][:2].tolist(), [1., 5.])
+        self.assertEqual(resample(self.t, self.columns, 10, 'max')[1]['temp'][:2].tolist(), [4., 5.])
+        self.assertEqual(resample(self.t, self.columns, 10, 'median')[1]['temp'][:2].tolist(), [3., 5.])
+        mean = resample(self.t, self.columns, 10, 'mean')[1]['temp']
+        self.assertAlmostEqual(mean[0], 8. / 3)
+        self.assertTrue(np.isnan(mean[2]))
+
+    def test_resample_rejects_unknown_agg(self):
+        self.assertRaises(ValueError, resample, self.t, self.columns, 10, 'sum')
+
+    def test_resampled_window(self):
+        pref_timestamp, t, columns = get_resampled_columns('ctdpf_ckl_wfp_instrument', 'CP02PMUO-WFP01-03-CTDPFK000',
+                                                           5, 'count', '', 3600000002.0, 3600000007.0)
+        #the window goes to uframe and bounds the bins
+        self.assertEqual(self.urls, ['beginDT=2014-01-29T16%3A00%3A02.000Z&endDT=2014-01-29T16%3A00%3A07.000Z'])
+        self.assertEqual(t.tolist(), [3600000000.0, 3600000005.0])
+        self.assertEqual(columns['temp'].tolist(), [3., 3.])
+        #cached per window
+        get_resampled_columns('ctdpf_ckl_wfp_instrument', 'CP02PMUO-WFP01-03-CTDPFK000',
+                              5, 'count', '', 3600000002.0, 3600000007.0)
+        get_resampled_columns('ctdpf_ckl_wfp_instrument', 'CP02PMUO-WFP01-03-CTDPFK000', 5, 'count', '')
+        self.assertEqual(self.urls[1:], [''])
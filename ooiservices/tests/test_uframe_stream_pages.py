@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+'''
+unit testing for the /uframe/stream page cursors
+
+'''
+
+import unittest
+import json
+from base64 import b64encode
+from flask import url_for
+from ooiservices.app import create_app, db
+from ooiservices.app.models import User, UserScope
+from ooiservices.app.uframe import controller
+from ooiservices.app.uframe.controller import encode_cursor, decode_cursor
+
+STREAMS = {'ctdbp_cdef_instrument': ['CP02PMUO-WFP01-03-CTDPFK000', 'CP02PMUO-WFP01-04-CTDPFK000'],
+           'dofst_k_instrument': ['CP02PMUO-WFP01-02-DOFSTK000'],
+           'flort_kn_instrument': ['CP02PMUO-WFP01-01-FLORDL000']}
+RECORDS = [{'preferred_timestamp': 'internal_timestamp', 'internal_timestamp': 3600000000.0 + i, 'temp': float(i)}
+           for i in range(2)]
+
+class FakeResponse(object):
+    def __init__(self, value):
+        self.content = json.dumps(value)
+        self.status_code = 200
+        self.url = 'uframe'
+
+    def json(self):
+        return json.loads(self.content)
+
+class UframeStreamPagesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client(use_cookies=False)
+        User.insert_user(username='admin', password='test')
+        UserScope.insert_scopes()
+        self.fetched = []
+        self.patched = [(name, getattr(controller, name)) for name in
+                        ['get_uframe_streams', 'get_uframe_stream', 'get_uframe_stream_contents']]
+        controller.get_uframe_streams = lambda: FakeResponse(STREAMS.keys())
+        controller.get_uframe_stream = self.fake_get_uframe_stream
+        controller.get_uframe_stream_contents = lambda stream, ref: FakeResponse(RECORDS)
+
+    def tearDown(self):
+        for name, value in self.patched:
+            setattr(controller, name, value)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def fake_get_uframe_stream(self, stream):
+        self.fetched.append(stream)
+        return FakeResponse(STREAMS[stream])
+
+    def get_api_headers(self, username, password):
+        return {
+            'Authorization': 'Basic ' + b64encode(
+                (username + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+    def get_page(self, **args):
+        response = self.client.get(url_for('uframe.streams_list', limit=2, **args),
+                                   headers=self.get_api_headers('admin', 'test'))
+        self.assertEqual(response.status_code, 200)
+        page = json.loads(response.data)
+        return [(s['stream_name'], s['reference_designator']) for s in page['streams']], page['next_cursor']
+
+    def test_cursor_round_trip(self):
+        cursor = encode_cursor('ctdbp_cdef_instrument', 'CP02PMUO-WFP01-03-CTDPFK000')
+        self.assertEqual(decode_cursor(cursor), ('ctdbp_cdef_instrument', 'CP02PMUO-WFP01-03-CTDPFK000'))
+
+    def test_invalid_cursor(self):
+        self.assertRaises(ValueError, decode_cursor, 'not a cursor')
+
+    def test_pages(self):
+        first, cursor = self.get_page()
+        #the page filled with the first stream, the next one is left for the next page
+        self.assertEqual(self.fetched, ['ctdbp_cdef_instrument'])
+        self.assertIsNotNone(cursor)
+        second, cursor = self.get_page(cursor=cursor)
+        self.assertIsNone(cursor)
+        expected = [(stream, ref) for stream in sorted(STREAMS) for ref in STREAMS[stream]]
+        self.assertEqual(first + second, expected)
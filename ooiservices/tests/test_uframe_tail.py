@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+'''
+unit testing for the uframe live tail
+
+'''
+
+import unittest
+import json
+from ooiservices.app import create_app
+from ooiservices.app.uframe import tail
+from ooiservices.app.uframe.tail import select_fields, fetch_new_records, poll_stream, TAIL_LAST, TAIL_LOCK
+
+RECORDS = [{'preferred_timestamp': 'internal_timestamp', 'internal_timestamp': 3600000000.0 + i, 'temp': float(i)}
+           for i in (3, 1, 4, 2, 0)]
+
+class FakeResponse(object):
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield self.body
+
+    def close(self):
+        pass
+
+class FakeRedis(object):
+    '''
+    The keys, publish and subscriber count of a poller; the stream has a
+    subscriber for the first poll only
+    '''
+    def __init__(self, values):
+        self.values = values
+        self.published = []
+        self.polls = 0
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def expire(self, key, ttl):
+        pass
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def pubsub_numsub(self, channel):
+        self.polls += 1
+        return [(channel, 1 if self.polls == 1 else 0)]
+
+    def publish(self, channel, message):
+        self.published.append(json.loads(message))
+
+class UframeTailTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.app.config['TAIL_POLL_INTERVAL'] = 0
+        self.traced_get = tail.traced_get
+        self.redis_store = tail.redis_store
+        self.urls = []
+        tail.traced_get = self.fake_traced_get
+
+    def tearDown(self):
+        tail.traced_get = self.traced_get
+        tail.redis_store = self.redis_store
+        self.app_context.pop()
+
+    def test_select_fields(self):
+        record = {'preferred_timestamp': 'internal_timestamp', 'internal_timestamp': 3600000000.0,
+                  'temp': 10.5, 'pressure': 2.0}
+        self.assertEqual(select_fields(record, ['temp', 'salinity']),
+                         {'time': 3600000000.0, 'temp': 10.5, 'salinity': None})
+        self.assertEqual(select_fields(record, []), record)
+
+    def test_fetch_new_records(self):
+        #the first poll keeps no records, only where the stream ends
+        records, newest = fetch_new_records('url', None)
+        self.assertEqual(records, [])
+        self.assertEqual(newest, 3600000004.0)
+        calls = []
+        records, newest = fetch_new_records('url', 3600000001.0, lambda: calls.append(1))
+        self.assertEqual([r['temp'] for r in records], [2., 3., 4.])
+        self.assertEqual(newest, 3600000004.0)
+        self.assertEqual(len(calls), len(RECORDS))
+
+    def fake_traced_get(self, url, **kwargs):
+        self.urls.append(url)
+        return FakeResponse(json.dumps(RECORDS))
+
+    def poll(self, values):
+        values[TAIL_LOCK % ('stream', 'ref')] = 'token'
+        tail.redis_store = FakeRedis(values)
+        poll_stream(self.app, 'stream', 'ref', 'token')
+        return tail.redis_store
+
+    def test_poller_goes_on_from_last(self):
+        redis = self.poll({TAIL_LAST % ('stream', 'ref'): '3600000002.0'})
+        self.assertEqual([r['temp'] for r in redis.published], [3., 4.])
+        self.assertIn('beginDT=2014-01-29T16%3A00%3A02.000Z', self.urls[0])
+        self.assertEqual(float(redis.values[TAIL_LAST % ('stream', 'ref')]), 3600000004.0)
+        #the lock is released when the subscribers are gone
+        self.assertNotIn(TAIL_LOCK % ('stream', 'ref'), redis.values)
+
+    def test_poller_without_last_skips_history(self):
+        self.poll({})
+        #asks for the last few intervals only, not the whole stream
+        self.assertIn('beginDT=', self.urls[0])
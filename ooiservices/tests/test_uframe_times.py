@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+'''
+unit testing for the uframe time conversions
+
+'''
+
+import unittest
+import numpy as np
+from ooiservices.app import create_app
+from ooiservices.app.uframe.times import to_unix, to_iso, to_datenum, times_to_list, convert_times, COSMO_CONSTANT
+
+class UframeTimesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_unix(self):
+        self.assertEqual(to_unix([COSMO_CONSTANT, COSMO_CONSTANT + 1.5]).tolist(), [0., 1.5])
+
+    def test_iso(self):
+        t = np.array([3600000000.5, np.nan])
+        self.assertEqual(to_iso(t).tolist(), ['2014-01-29T16:00:00.500000Z', None])
+        self.assertEqual(times_to_list(t, 'unix'), [1391011200.5, None])
+
+    def test_datenum(self):
+        #matplotlib's date number of 1970-01-01 and 1970-01-02 12:00
+        self.assertEqual(to_datenum([COSMO_CONSTANT, COSMO_CONSTANT + 129600]).tolist(), [719163., 719164.5])
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, convert_times, np.array([0.]), 'julian')
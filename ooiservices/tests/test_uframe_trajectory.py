@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+'''
+unit testing for the trajectory simplification
+
+'''
+
+import unittest
+import numpy as np
+import datetime as dt
+from ooiservices.app import create_app, db, cache
+from ooiservices.app.models import InstrumentDeployment
+from ooiservices.app.uframe import trajectory as trajectory_module
+from ooiservices.app.uframe.trajectory import simplification_weights, simplify_for_zoom, zoom_tolerance
+from ooiservices.app.uframe.trajectory import get_trajectory, TRACK_TIMEOUT, ENDED_TRACK_TIMEOUT
+
+REF = 'CP05MOAS-GL001-03-CTDGVM000'
+STREAM = 'ctdgv_m_glider_instrument'
+
+class UframeTrajectoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_weights(self):
+        x = np.array([0., 1., 2., 3., 4.])
+        y = np.array([0., 0.1, -0.1, 5., 6.])
+        weights = simplification_weights(x, y)
+        self.assertTrue(np.isinf(weights[0]) and np.isinf(weights[-1]))
+        #the corner splits first, points near the straight run weigh little
+        self.assertEqual(np.argmax(weights[1:-1]) + 1, 2)
+        self.assertTrue(weights[1] < 0.2)
+
+    def test_straight_line_collapses(self):
+        x = np.linspace(0., 1., 100)
+        weights = simplification_weights(x, 2 * x, 1e-9)
+        self.assertEqual((weights > 0).sum(), 2)
+
+    def test_zoom_selects_vertices(self):
+        t = np.arange(5.)
+        lat = np.array([0., 1e-3, 0., 1., 2.])
+        lon = np.arange(5.)
+        weights = simplification_weights(lon, lat)
+        trajectory = (t, lat, lon, weights, 5)
+        self.assertEqual(simplify_for_zoom(trajectory, 0)[0].tolist(), [0., 4.])
+        #the collinear vertex 3 is never needed
+        self.assertEqual(simplify_for_zoom(trajectory, 18)[0].tolist(), [0., 1., 2., 4.])
+        self.assertTrue(zoom_tolerance(1) == zoom_tolerance(0) / 2)
+
+class TrajectoryDeploymentsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.urls = []
+        self.timeouts = []
+        self.patched = [(name, getattr(trajectory_module, name)) for name in ['fetch_uframe_columns', 'get_or_set']]
+        get_or_set = trajectory_module.get_or_set
+        def fake_get_or_set(name, key, timeout, compute):
+            self.timeouts.append(timeout)
+            return get_or_set(name, key, timeout, compute)
+        trajectory_module.fetch_uframe_columns = self.fake_fetch
+        trajectory_module.get_or_set = fake_get_or_set
+
+    def tearDown(self):
+        for name, value in self.patched:
+            setattr(trajectory_module, name, value)
+        cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def fake_fetch(self, url, fields, start=None, end=None):
+        self.urls.append(url.split('?')[1] if '?' in url else '')
+        t = np.arange(3.) + (start or 0.)
+        return 'internal_timestamp', t, {'lat': np.array([0., 1., 2.]), 'lon': np.array([0., 5., 1.])}
+
+    def test_track_per_deployment(self):
+        db.session.add(InstrumentDeployment(reference_designator=REF, start_date=dt.date(2014, 1, 1),
+                                            end_date=dt.date(2014, 1, 31)))
+        db.session.add(InstrumentDeployment(reference_designator=REF, start_date=dt.date(2014, 2, 1)))
+        db.session.commit()
+        tracks = get_trajectory(STREAM, REF, 'lat', 'lon')
+        self.assertEqual(len(tracks), 2)
+        #each deployment is fetched for its own window, the end date counts in full
+        self.assertEqual(self.urls, ['beginDT=2014-01-01T00%3A00%3A00.000Z&endDT=2014-02-01T00%3A00%3A00.000Z',
+                                     'beginDT=2014-02-01T00%3A00%3A00.000Z'])
+        self.assertIsNone(tracks[1][2])
+        self.assertEqual(tracks[0][3][0][0], tracks[0][1])
+        #the ended deployment is kept as long as the cache allows
+        self.assertEqual(self.timeouts, [ENDED_TRACK_TIMEOUT, TRACK_TIMEOUT])
+        get_trajectory(STREAM, REF, 'lat', 'lon')
+        self.assertEqual(len(self.urls), 2)
+
+    def test_without_deployments(self):
+        tracks = get_trajectory(STREAM, REF, 'lat', 'lon')
+        self.assertEqual([track[:3] for track in tracks], [(None, None, None)])
+        self.assertEqual(self.urls, [''])
+        self.assertEqual(self.timeouts, [TRACK_TIMEOUT])